@@ -0,0 +1,92 @@
+import argparse
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from ultralytics import settings
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils
+from prepare import OUTPUT_DIRECTORY, OUTPUT_VALIDATION_IMAGES_DIRECTORY
+
+parser = argparse.ArgumentParser(
+    prog="ALPR model runtime comparison",
+    description="Compare latency and accuracy of a model in every runtime it was exported for (see export.py), to choose MODEL_RUNTIME",
+)
+parser.add_argument("model", help="Path to the original model (.pt), the same path as in the server's .env")
+parser.add_argument("--runtimes", nargs="+", default=list(utils.MODEL_RUNTIMES.keys()), help="Runtimes to compare, the ones which weren't exported are skipped")
+parser.add_argument("--images", default=OUTPUT_VALIDATION_IMAGES_DIRECTORY, help="Directory of images latency is measured on, default is the validation set made by `prepare.py`")
+parser.add_argument("--number-of-images", type=int, default=100, help="Maximum number of images latency is measured on")
+parser.add_argument("--batch-size", type=int, default=8, help="Same as LP_DETECTION_BATCH_SIZE / CAR_DETECTION_BATCH_SIZE of the server")
+parser.add_argument("--data", default="./data.yaml", help="Dataset to compute mAP on (ultralytics val()), only makes sense for the license plate model")
+parser.add_argument("--skip-val", action="store_true", help="Don't compute mAP (eg. for the car model, or if the dataset isn't prepared)")
+
+def _box_iou(a: np.ndarray, b: np.ndarray) -> float:
+    intersection = max(0, min(a[2], b[2]) - max(a[0], b[0])) * max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+# F1 of boxes (same class, IoU >= 0.5) against boxes of the reference runtime, 1.0 => exactly the same detections
+def _agreement(boxes_of_images: list[any], reference_boxes_of_images: list[any]) -> float:
+    matched, found, expected = 0, 0, 0
+    for boxes, reference_boxes in zip(boxes_of_images, reference_boxes_of_images):
+        boxes = list(zip(boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy()))
+        reference_boxes = list(zip(reference_boxes.xyxy.cpu().numpy(), reference_boxes.cls.cpu().numpy()))
+        found += len(boxes)
+        expected += len(reference_boxes)
+        for box, cls in boxes:
+            for k, (reference_box, reference_cls) in enumerate(reference_boxes):
+                if cls == reference_cls and _box_iou(box, reference_box) >= 0.5:
+                    matched += 1
+                    del reference_boxes[k]
+                    break
+    return 2 * matched / (found + expected) if found + expected > 0 else 1.0
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if os.path.isdir(args.images) is False:
+        print(f"Images directory \"{args.images}\" doesn't exist, run `python prepare.py` first, or pass --images.")
+        sys.exit(1)
+    image_names = sorted(name for name in os.listdir(args.images) if os.path.splitext(name)[1].lower() in [".jpg", ".jpeg", ".png"])[:args.number_of_images]
+    images = [cv2.imread(os.path.join(args.images, name)) for name in image_names]
+    if len(images) == 0:
+        print(f"Didn't find any images in \"{args.images}\".")
+        sys.exit(1)
+    if args.skip_val is False:
+        # Same as train.py, so val() finds the prepared dataset
+        settings.update({"datasets_dir": os.path.join(os.getcwd(), OUTPUT_DIRECTORY)})
+        settings.save()
+
+    print(f"{'runtime':>14} | {'size':>8} | {'per-image mean':>14} | {'per-image p95':>13} | {'batched per image':>17} | {'agreement':>9} | {'mAP50':>6} | {'mAP50-95':>8}")
+    reference_boxes_of_images = None
+    for runtime in args.runtimes:
+        model_path = utils.get_model_path_for_runtime(args.model, runtime)
+        if os.path.exists(model_path) is False:
+            print(f"{runtime:>14} | not exported, run `python export.py {args.model}` first")
+            continue
+        model = utils.load_yolo_model(args.model, runtime)
+        utils.warm_up_yolo_model(model, 1, args.batch_size)
+        size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(model_path) for name in names) if os.path.isdir(model_path) else os.path.getsize(model_path)
+
+        boxes_of_images = []
+        timings = []
+        for image in images:
+            start = time.perf_counter()
+            _, boxes = utils.detect_with_yolo(model, image, False)
+            timings.append(time.perf_counter() - start)
+            boxes_of_images.append(boxes)
+        timings_ms = np.array(timings) * 1000
+        start = time.perf_counter()
+        utils.detect_with_yolo_batched(model, images, False, args.batch_size)
+        batched_ms = (time.perf_counter() - start) * 1000 / len(images)
+
+        # The first runtime (pytorch by default) is what the others are compared against
+        if reference_boxes_of_images is None:
+            reference_boxes_of_images = boxes_of_images
+        agreement = _agreement(boxes_of_images, reference_boxes_of_images)
+
+        map50, map50_95 = "-", "-"
+        if args.skip_val is False:
+            metrics = model.val(data=args.data, batch=1, plots=False, verbose=False)
+            map50, map50_95 = f"{metrics.box.map50:.3f}", f"{metrics.box.map:.3f}"
+        print(f"{runtime:>14} | {size / 1024 / 1024:>5.1f} MB | {np.mean(timings_ms):>11.1f} ms | {np.percentile(timings_ms, 95):>10.1f} ms | {batched_ms:>14.1f} ms | {agreement:>9.3f} | {map50:>6} | {map50_95:>8}")
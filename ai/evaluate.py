@@ -0,0 +1,243 @@
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import time
+import cv2
+import numpy as np
+import torch
+from difflib import SequenceMatcher
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils
+import ocr_backends
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".bmp"]
+
+parser = argparse.ArgumentParser(
+    prog="ALPR batch evaluation",
+    description="Run a license plate model (+ OCR) over a whole directory of images without any window, save what it found and score it against labels, to compare models and OCR settings",
+)
+parser.add_argument("model", help="Path to license plate model (.pt), the same path as in the server's .env")
+parser.add_argument("images", help="Directory of images (eg. snapshots of the gate, or validation images made by `prepare.py`)")
+parser.add_argument("--output", default="./evaluation.jsonl", help="Results of every image, .jsonl or .csv")
+parser.add_argument("--runtime", default=utils.MODEL_RUNTIME_PYTORCH, help="Same as MODEL_RUNTIME of the server")
+parser.add_argument("--batch-size", type=int, default=8, help="Images per predict(), same as LP_DETECTION_BATCH_SIZE of the server")
+parser.add_argument("--number-of-images", type=int, default=None, help="Evaluate only the first n images (in order of their file names)")
+parser.add_argument("--box-labels", default=None, help="Directory of YOLO labels ({image name}.txt) to score detection against, default is the `labels` directory next to the images directory, if there is one")
+parser.add_argument("--plate-labels", default=None, help="CSV with columns image (file name) and license_plate (one row per license plate) to score OCR against")
+parser.add_argument("--skip-ocr", action="store_true", help="Only detect license plates (eg. when comparing models)")
+parser.add_argument("--ocr-backend", default="pytesseract", help="Same as OCR_BACKEND of the server")
+parser.add_argument("--segmentation-mode", default=utils.SEGMENTATION_MODE_ACCURATE, choices=utils.SEGMENTATION_MODES, help="Same as SEGMENTATION_MODE of the server")
+parser.add_argument("--minimum-number-of-chars", type=int, default=4, help="Same as MINIMUM_NUMBER_OF_CHARS_FOR_MATCH of the server")
+parser.add_argument("--should-try-lp-crop", action="store_true", help="Same as SHOULD_TRY_LP_CROP of the server")
+parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes reading license plates (each with its own OCR backend) while the model works on the next batch, 0 reads them in this process")
+parser.add_argument("--iou-threshold", type=float, default=0.5, help="Minimum IoU of a detected box and a labeled box to be a match")
+
+# Box of the license plate inside of its crop, looks like a box of ultralytics to utils.read_license_plate
+class _CroppedBox:
+    def __init__(self, x_min: float, y_min: float, x_max: float, y_max: float):
+        self.xyxy = torch.tensor([[x_min, y_min, x_max, y_max]], dtype=torch.float32)
+
+# Only the license plate (with a few pixels around it) is sent to the worker process, not the whole image
+def _crop_license_plate(image: np.ndarray, box: (float, float, float, float), margin: int = 4) -> (np.ndarray, _CroppedBox):
+    x_min, y_min, x_max, y_max = box
+    crop_x_min, crop_y_min = max(int(x_min) - margin, 0), max(int(y_min) - margin, 0)
+    crop = np.ascontiguousarray(utils.crop_box(image, (crop_x_min, crop_y_min, x_max + margin, y_max + margin)))
+    return (crop, _CroppedBox(x_min - crop_x_min, y_min - crop_y_min, x_max - crop_x_min, y_max - crop_y_min))
+
+_OCR_BACKEND = None
+def _init_ocr_worker(ocr_backend_name: str):
+    global _OCR_BACKEND
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    _OCR_BACKEND = ocr_backends.create_ocr_backend(ocr_backend_name, 1)
+
+# Runs inside of the worker processes
+# Returns license plate as string + seconds it took to read it
+def read_license_plate(crop: np.ndarray, box: _CroppedBox, segmentation_mode: str, minimum_number_of_chars: int, should_try_lp_crop: bool) -> (str, float):
+    started_at = time.perf_counter()
+    _, license_plate_as_string = utils.read_license_plate("", box, crop, 500, 20, False, should_try_lp_crop, minimum_number_of_chars, _OCR_BACKEND, segmentation_mode)
+    return (license_plate_as_string, time.perf_counter() - started_at)
+
+# Yields (image names, images), batch_size images at a time, so the whole directory is never in memory
+def read_images_in_batches(images_directory: str, image_names: list[str], batch_size: int):
+    for batch_start in range(0, len(image_names), batch_size):
+        batch_names = image_names[batch_start:batch_start + batch_size]
+        yield (batch_names, [cv2.imread(os.path.join(images_directory, name)) for name in batch_names])
+
+def _box_iou(a: list[float], b: list[float]) -> float:
+    intersection = max(0, min(a[2], b[2]) - max(a[0], b[0])) * max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+# Returns labeled boxes (x_min, y_min, x_max, y_max in pixels) of the image, None if the image isn't labeled
+def load_box_labels(box_labels_directory: str, image_name: str, image_shape: tuple) -> list[list[float]]:
+    label_path = os.path.join(box_labels_directory, f"{os.path.splitext(image_name)[0]}.txt")
+    if os.path.isfile(label_path) is False:
+        return None
+    height, width = image_shape[:2]
+    boxes = []
+    with open(label_path) as label_file:
+        for line in label_file:
+            values = line.split()
+            if len(values) < 5:
+                continue
+            x_center, y_center, box_width, box_height = [float(value) for value in values[1:5]]
+            boxes.append([(x_center - box_width / 2) * width, (y_center - box_height / 2) * height, (x_center + box_width / 2) * width, (y_center + box_height / 2) * height])
+    return boxes
+
+# Returns {image name: [license plate]}
+def load_plate_labels(plate_labels_path: str) -> dict:
+    plate_labels = {}
+    with open(plate_labels_path, newline="") as plate_labels_file:
+        for row in csv.DictReader(plate_labels_file):
+            plate_labels.setdefault(row["image"], []).append(normalize_license_plate(row["license_plate"]))
+    return plate_labels
+
+# Same as the replay benchmark of the server
+def normalize_license_plate(license_plate: str) -> str:
+    return license_plate.replace(" ", "").upper()
+
+# Detected boxes matched to labeled boxes, most confident first
+# Returns number of matched boxes
+def match_boxes(boxes: list[list[float]], confidences: list[float], labeled_boxes: list[list[float]], iou_threshold: float) -> int:
+    unmatched_labeled_boxes = list(labeled_boxes)
+    matched = 0
+    for k in np.argsort(confidences)[::-1]:
+        ious = [_box_iou(boxes[k], labeled_box) for labeled_box in unmatched_labeled_boxes]
+        if len(ious) > 0 and max(ious) >= iou_threshold:
+            del unmatched_labeled_boxes[int(np.argmax(ious))]
+            matched += 1
+    return matched
+
+# Returns number of exactly read license plates + similarity (0-1, characters) of every expected license plate to the most similar one read
+def match_license_plates(license_plates: list[str], expected_license_plates: list[str]) -> (int, list[float]):
+    unmatched_license_plates = [normalize_license_plate(license_plate) for license_plate in license_plates if license_plate != ""]
+    exactly_read = 0
+    similarities = []
+    for expected_license_plate in expected_license_plates:
+        if expected_license_plate in unmatched_license_plates:
+            unmatched_license_plates.remove(expected_license_plate)
+            exactly_read += 1
+            similarities.append(1.0)
+        else:
+            similarities.append(max([SequenceMatcher(None, expected_license_plate, license_plate).ratio() for license_plate in unmatched_license_plates], default=0.0))
+    return (exactly_read, similarities)
+
+def save_results(output_path: str, results: list[dict]):
+    if output_path.lower().endswith(".csv"):
+        with open(output_path, "w", newline="") as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(["image", "number_of_boxes", "license_plates", "confidences", "detection_ms", "ocr_ms"])
+            for result in results:
+                writer.writerow([
+                    result["image"],
+                    len(result["license_plates"]),
+                    "|".join(license_plate["license_plate"] or "" for license_plate in result["license_plates"]),
+                    "|".join(f"{license_plate['confidence']:.3f}" for license_plate in result["license_plates"]),
+                    f"{result['detection_ms']:.2f}",
+                    "" if result["ocr_ms"] is None else f"{result['ocr_ms']:.2f}",
+                ])
+    else:
+        with open(output_path, "w") as output_file:
+            for result in results:
+                output_file.write(json.dumps(result) + "\n")
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if os.path.isdir(args.images) is False:
+        print(f"Images directory \"{args.images}\" doesn't exist.")
+        sys.exit(1)
+    image_names = sorted(name for name in os.listdir(args.images) if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)[:args.number_of_images]
+    if len(image_names) == 0:
+        print(f"Didn't find any images in \"{args.images}\".")
+        sys.exit(1)
+    box_labels_directory = args.box_labels
+    if box_labels_directory is None and os.path.isdir(os.path.join(os.path.dirname(os.path.normpath(args.images)), "labels")):
+        box_labels_directory = os.path.join(os.path.dirname(os.path.normpath(args.images)), "labels") # layout of `prepare.py`
+    plate_labels = load_plate_labels(args.plate_labels) if args.plate_labels is not None else None
+
+    print("Loading model")
+    model = utils.load_yolo_model(args.model, args.runtime)
+    utils.warm_up_yolo_model(model, 1, args.batch_size)
+    ocr_executor = None
+    if args.skip_ocr is False:
+        if args.workers > 0:
+            ocr_executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=_init_ocr_worker, initargs=(args.ocr_backend,))
+        else:
+            ocr_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, initializer=_init_ocr_worker, initargs=(args.ocr_backend,))
+
+    print(f"Evaluating {len(image_names)} images")
+    results = [] # [{"image", "license_plates": [{"box", "confidence", "license_plate"}], "detection_ms", "ocr_ms"}]
+    pending_reads = [] # [(result, [Future])] => license plates of the result being read by the OCR workers
+    detected_boxes, labeled_boxes, matched_boxes = 0, 0, 0
+    started_at = time.perf_counter()
+    for batch_names, batch_images in read_images_in_batches(args.images, image_names, args.batch_size):
+        readable = [(name, image) for name, image in zip(batch_names, batch_images) if image is not None]
+        for name, image in zip(batch_names, batch_images):
+            if image is None:
+                print(f"Unable to read image \"{name}\", skipping it.")
+        if len(readable) == 0:
+            continue
+
+        detection_started_at = time.perf_counter()
+        detections = utils.detect_with_yolo_batched(model, [image for _, image in readable], False, args.batch_size)
+        detection_ms = (time.perf_counter() - detection_started_at) * 1000 / len(readable) # the whole batch took this long, split between its images
+        for (name, image), (_, boxes) in zip(readable, detections):
+            boxes_as_lists = boxes.xyxy.cpu().numpy().tolist()
+            confidences = boxes.conf.cpu().numpy().tolist()
+            result = {
+                "image": name,
+                "license_plates": [{"box": [round(value, 1) for value in box], "confidence": confidence, "license_plate": None} for box, confidence in zip(boxes_as_lists, confidences)],
+                "detection_ms": round(detection_ms, 2),
+                "ocr_ms": None,
+            }
+            results.append(result)
+
+            image_box_labels = load_box_labels(box_labels_directory, name, image.shape) if box_labels_directory is not None else None
+            if image_box_labels is not None:
+                detected_boxes += len(boxes_as_lists)
+                labeled_boxes += len(image_box_labels)
+                matched_boxes += match_boxes(boxes_as_lists, confidences, image_box_labels, args.iou_threshold)
+
+            # Reading is left to the workers, the model goes on with the next batch in the meantime
+            if ocr_executor is not None:
+                pending_reads.append((result, [ocr_executor.submit(read_license_plate, *_crop_license_plate(image, box), args.segmentation_mode, args.minimum_number_of_chars, args.should_try_lp_crop) for box in boxes_as_lists]))
+
+    for result, futures in pending_reads:
+        read_results = [future.result() for future in futures]
+        for license_plate, (license_plate_as_string, _) in zip(result["license_plates"], read_results):
+            license_plate["license_plate"] = license_plate_as_string
+        result["ocr_ms"] = round(sum(seconds for _, seconds in read_results) * 1000, 2)
+    elapsed = time.perf_counter() - started_at
+    if ocr_executor is not None:
+        ocr_executor.shutdown()
+
+    save_results(args.output, results)
+    print(f"Evaluated {len(results)} images in {elapsed:.1f} s ({len(results) / elapsed:.2f} images/s), results saved into {args.output}")
+    detection_ms = np.array([result["detection_ms"] for result in results])
+    print(f"detection per image: mean {np.mean(detection_ms):.1f} ms, p95 {np.percentile(detection_ms, 95):.1f} ms")
+    if ocr_executor is not None:
+        ocr_ms_per_plate = [result["ocr_ms"] / len(result["license_plates"]) for result in results if len(result["license_plates"]) > 0]
+        if len(ocr_ms_per_plate) > 0:
+            print(f"reading per license plate: mean {np.mean(ocr_ms_per_plate):.1f} ms, p95 {np.percentile(ocr_ms_per_plate, 95):.1f} ms")
+
+    if labeled_boxes > 0:
+        print(f"detection: precision {matched_boxes / max(detected_boxes, 1):.3f}, recall {matched_boxes / labeled_boxes:.3f} (IoU >= {args.iou_threshold}, {matched_boxes} of {labeled_boxes} labeled boxes found, {detected_boxes} boxes detected)")
+    if plate_labels is not None and ocr_executor is not None:
+        labeled_results = [result for result in results if result["image"] in plate_labels]
+        read_plates, expected_plates, exactly_read_plates, exactly_read_images = 0, 0, 0, 0
+        similarities = []
+        for result in labeled_results:
+            license_plates = [license_plate["license_plate"] for license_plate in result["license_plates"] if license_plate["license_plate"]]
+            expected_license_plates = plate_labels[result["image"]]
+            exactly_read, image_similarities = match_license_plates(license_plates, expected_license_plates)
+            read_plates += len(license_plates)
+            expected_plates += len(expected_license_plates)
+            exactly_read_plates += exactly_read
+            exactly_read_images += exactly_read == len(expected_license_plates) and len(license_plates) == len(expected_license_plates)
+            similarities.extend(image_similarities)
+        if len(labeled_results) > 0:
+            print(f"license plates: precision {exactly_read_plates / max(read_plates, 1):.3f}, recall {exactly_read_plates / max(expected_plates, 1):.3f} ({exactly_read_plates} of {expected_plates} labeled license plates read exactly, {read_plates} read)")
+            print(f"exact-plate accuracy: {exactly_read_images / len(labeled_results):.3f} of images read exactly right (every license plate, nothing more), characters {np.mean(similarities) if len(similarities) > 0 else 0:.3f} similar on average")
@@ -0,0 +1,122 @@
+import argparse
+import os
+import sys
+import cv2
+import numpy as np
+import yaml
+from ultralytics import YOLO
+from ultralytics.data.augment import LetterBox
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils
+from prepare import OUTPUT_VALIDATION_IMAGES_DIRECTORY
+
+FORMATS = ["onnx", "onnx-int8", "openvino", "openvino-int8"] # ONNX is always exported, the other formats are made from it
+
+parser = argparse.ArgumentParser(
+    prog="ALPR model export",
+    description="Export your (or provided) model for CPU runtimes (ONNX Runtime / OpenVINO, optionally int8 quantized), the server picks them by MODEL_RUNTIME",
+)
+parser.add_argument("model", help="Path to model (.pt), exported models are saved next to it")
+parser.add_argument("--formats", nargs="+", default=FORMATS, choices=FORMATS, help="Which runtimes to export for")
+parser.add_argument("--imgsz", type=int, default=640, help="Input size of the exported model")
+parser.add_argument("--opset", type=int, default=18, help="ONNX opset")
+parser.add_argument("--calibration-images", default=OUTPUT_VALIDATION_IMAGES_DIRECTORY, help="Directory of images int8 quantization gets calibrated on, default is the validation set made by `prepare.py`")
+parser.add_argument("--calibration-size", type=int, default=300, help="Maximum number of calibration images")
+
+# Same preprocessing ultralytics does before inference of exported models, so calibration sees the same inputs as the server
+def load_calibration_images(directory: str, number_of_images: int, imgsz: int) -> list[np.ndarray]:
+    if os.path.isdir(directory) is False:
+        print(f"Calibration images directory \"{directory}\" doesn't exist, run `python prepare.py` first, or pass --calibration-images.")
+        sys.exit(1)
+    names = sorted(name for name in os.listdir(directory) if os.path.splitext(name)[1].lower() in [".jpg", ".jpeg", ".png"])[:number_of_images]
+    letterbox = LetterBox((imgsz, imgsz), auto=False)
+    images = []
+    for name in names:
+        image = letterbox(image=cv2.imread(os.path.join(directory, name)))
+        image = image[:, :, ::-1].transpose(2, 0, 1) # BGR HWC => RGB CHW
+        images.append(np.ascontiguousarray(image[None], dtype=np.float32) / 255)
+    if len(images) == 0:
+        print(f"Didn't find any images in \"{directory}\".")
+        sys.exit(1)
+    return images
+
+# Batch size and input size stay dynamic, so batched predict() of the server works.
+# ultralytics saves it next to the model, as `{model}.onnx`, the same path utils.get_model_path_for_runtime expects
+def export_onnx(model_path: str, imgsz: int, opset: int) -> str:
+    return YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=True, opset=opset)
+
+def export_onnx_int8(model_path: str, onnx_path: str, calibration_images: list[np.ndarray]) -> str:
+    try:
+        import onnx
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    except ImportError:
+        raise RuntimeError("Format \"onnx-int8\" requires the onnxruntime package (`pip install onnxruntime`).")
+
+    class CalibrationImages(CalibrationDataReader):
+        def __init__(self):
+            self.images = iter(calibration_images)
+
+        def get_next(self) -> dict:
+            image = next(self.images, None)
+            return None if image is None else {"images": image}
+
+    int8_path = utils.get_model_path_for_runtime(model_path, "onnx-int8")
+    # QDQ with per-channel int8 weights, what ONNX Runtime runs fastest on x86 CPUs
+    quantize_static(onnx_path, int8_path, CalibrationImages(), quant_format=QuantFormat.QDQ, per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    # ultralytics reads names, stride and input size from the metadata, quantization drops it
+    onnx_model = onnx.load(onnx_path)
+    int8_model = onnx.load(int8_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(onnx_model.metadata_props)
+    onnx.save(int8_model, int8_path)
+    return int8_path
+
+# Converted from the exported ONNX model with OpenVINO itself (ultralytics' OpenVINO export requires the model optimizer of openvino-dev, which newer OpenVINO releases dropped)
+def export_openvino(model_path: str, onnx_path: str, runtime: str, calibration_images: list[np.ndarray] = None) -> str:
+    try:
+        import onnx
+        import openvino
+    except ImportError:
+        raise RuntimeError(f"Format \"{runtime}\" requires the openvino package (`pip install openvino`).")
+
+    openvino_model = openvino.convert_model(onnx_path)
+    if calibration_images is not None:
+        try:
+            import nncf
+        except ImportError:
+            raise RuntimeError(f"Format \"{runtime}\" requires the nncf package (`pip install nncf`).")
+        openvino_model = nncf.quantize(openvino_model, nncf.Dataset(calibration_images), preset=nncf.QuantizationPreset.MIXED, subset_size=len(calibration_images))
+
+    openvino_directory = utils.get_model_path_for_runtime(model_path, runtime)
+    os.makedirs(openvino_directory, exist_ok=True)
+    openvino.save_model(openvino_model, os.path.join(openvino_directory, os.path.basename(os.path.splitext(model_path)[0]) + ".xml"), compress_to_fp16=False)
+    # ultralytics reads names, stride and input size from metadata.yaml next to the model
+    metadata = {prop.key: prop.value for prop in onnx.load(onnx_path).metadata_props}
+    with open(os.path.join(openvino_directory, "metadata.yaml"), "w") as metadata_file:
+        yaml.safe_dump(metadata, metadata_file, sort_keys=False)
+    return openvino_directory
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    print("Exporting ONNX model")
+    onnx_path = export_onnx(args.model, args.imgsz, args.opset)
+    exported = {"onnx": onnx_path}
+
+    calibration_images = None
+    if any(runtime.endswith("-int8") for runtime in args.formats):
+        print("Loading calibration images")
+        calibration_images = load_calibration_images(args.calibration_images, args.calibration_size, args.imgsz)
+
+    if "onnx-int8" in args.formats:
+        print(f"Quantizing ONNX model on {len(calibration_images)} images")
+        exported["onnx-int8"] = export_onnx_int8(args.model, onnx_path, calibration_images)
+    if "openvino" in args.formats:
+        print("Converting into OpenVINO model")
+        exported["openvino"] = export_openvino(args.model, onnx_path, "openvino")
+    if "openvino-int8" in args.formats:
+        print(f"Quantizing OpenVINO model on {len(calibration_images)} images")
+        exported["openvino-int8"] = export_openvino(args.model, onnx_path, "openvino-int8", calibration_images)
+    for runtime, path in exported.items():
+        print(f"{runtime:>14} => {path}")
+    print(f"Set MODEL_RUNTIME in the server's .env to use them, compare them first by running `python compare_runtimes.py {args.model}`")
@@ -1,12 +1,56 @@
+import argparse
+import concurrent.futures
+import hashlib
+import io
+import json
 import os
+import shutil
+import time
 import zipfile
 import cv2
-import shutil
 import numpy as np
 import xml.etree.ElementTree as ET
 
-def convert_pascal_voc_into_yolo_annotation(annotation_path: str):
-    tree = ET.parse(annotation_path)
+RESOURCES_DIRECTORY = "./resources/"
+
+OUTPUT_DIRECTORY = "./training_data_preprocessed/"
+OUTPUT_TRAINING_DIRECTORY = os.path.join(OUTPUT_DIRECTORY, "training/")
+OUTPUT_TRAINING_IMAGES_DIRECTORY = os.path.join(OUTPUT_TRAINING_DIRECTORY, "images/")
+OUTPUT_TRAINING_LABELS_DIRECTORY = os.path.join(OUTPUT_TRAINING_DIRECTORY, "labels/")
+OUTPUT_VALIDATION_DIRECTORY = os.path.join(OUTPUT_DIRECTORY, "validation/")
+OUTPUT_VALIDATION_IMAGES_DIRECTORY = os.path.join(OUTPUT_VALIDATION_DIRECTORY, "images/")
+OUTPUT_VALIDATION_LABELS_DIRECTORY = os.path.join(OUTPUT_VALIDATION_DIRECTORY, "labels/")
+OUTPUT_MANIFEST_PATH = os.path.join(OUTPUT_DIRECTORY, "manifest.json")
+
+# Bump, whenever the conversion changes, so the next run converts every item again
+MANIFEST_VERSION = 1
+
+TRAINING = "training"
+VALIDATION = "validation"
+OUTPUT_DIRECTORIES_OF_SPLIT = {
+    TRAINING: (OUTPUT_TRAINING_IMAGES_DIRECTORY, OUTPUT_TRAINING_LABELS_DIRECTORY),
+    VALIDATION: (OUTPUT_VALIDATION_IMAGES_DIRECTORY, OUTPUT_VALIDATION_LABELS_DIRECTORY),
+}
+
+# (name, zip inside of RESOURCES_DIRECTORY, directory of images inside of the zip, extensions of images, directory of annotations inside of the zip)
+# Annotation of an image has the same name as the image, with .xml extension
+DATASETS = [
+    ("andrewmvd", "andrewmvd_dataset.zip", "images/", [".png"], "annotations/"),
+    ("aslanahmedov", "aslanahmedov_dataset.zip", "images/", [".jpeg"], "images/"),
+]
+
+parser = argparse.ArgumentParser(
+    prog="ALPR dataset preparation",
+    description="Convert datasets in resources into training and validation data for YOLO, only new or changed items are converted on later runs",
+)
+parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of processes converting items, default is the number of CPU cores")
+parser.add_argument("--seed", type=int, default=0, help="Seed of the training/validation split, the same seed always puts an item into the same split")
+parser.add_argument("--validation-ratio", type=float, default=0.2, help="Share of items which go into the validation data")
+parser.add_argument("--rebuild", action="store_true", help="Throw away the prepared data and convert everything again")
+
+# annotation_file => path, or file object of the Pascal VOC annotation
+def convert_pascal_voc_into_yolo_annotation(annotation_file: any):
+    tree = ET.parse(annotation_file)
     root_elem = tree.getroot()
 
     size_elem = root_elem.find("size")
@@ -37,118 +81,130 @@ def convert_pascal_voc_into_yolo_annotation(annotation_path: str):
 
     return yolo_annotation.rstrip()
 
-def train_validation_split(input_data: list[any]):
-    total_size = len(input_data)
-    train_size = int(0.8 * total_size)
-    
-    np.random.shuffle(input_data)
-    
-    train_data = input_data[:train_size]
-    validation_data = input_data[train_size:]
-    return train_data, validation_data
-
-def save_dataset_item(image_path: str, yolo_annotation: str, image_destination_path: str, label_destination_path: str, data_item_name: str):
-    new_image_path = os.path.join(image_destination_path, f'{data_item_name}.jpg')
-    if image_path.endswith(".png"):
-        image = cv2.imread(image_path)
+# Split depends only on the seed and the item itself, so it's the same on every run and adding new items doesn't move the old ones between splits
+def get_split_of_item(item_id: str, seed: int, validation_ratio: float) -> str:
+    digest = hashlib.sha256(f"{seed}:{item_id}".encode("utf-8")).digest()
+    return VALIDATION if int.from_bytes(digest[:8], "big") / 2 ** 64 < validation_ratio else TRAINING
+
+def get_output_paths_of_item(item_id: str, split: str) -> (str, str):
+    images_directory, labels_directory = OUTPUT_DIRECTORIES_OF_SPLIT[split]
+    return (os.path.join(images_directory, f"{item_id}.jpg"), os.path.join(labels_directory, f"{item_id}.txt"))
+
+# Returns True if the item was saved
+def save_dataset_item(image_name: str, image_bytes: bytes, yolo_annotation: str, new_image_path: str, new_yolo_annotation_path: str) -> bool:
+    if image_name.endswith(".png"):
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
         cv2.imwrite(new_image_path, image, [int(cv2.IMWRITE_JPEG_QUALITY), 100])
-    elif image_path.endswith(".jpg") or image_path.endswith(".jpeg"):
-        shutil.copy(image_path, new_image_path)
+    elif image_name.endswith(".jpg") or image_name.endswith(".jpeg"):
+        with open(new_image_path, "wb") as image_file:
+            image_file.write(image_bytes)
     else:
         print("Unable to work with formats outside of .jpg and .png - Implment them yourself and submit a PR :D.")
-        return
-    
-    new_yolo_annotation_path = os.path.join(label_destination_path, f'{data_item_name}.txt')
-    yolo_annotation_file = open(new_yolo_annotation_path, "w")
-    yolo_annotation_file.write(yolo_annotation)
-    yolo_annotation_file.close()
-
-RESOURCES_DIRECTORY = "./resources/"
-
-INPUT_DATASET_ROOT = "./training_data/"
-ANDREWMVD_DATASET_ROOT = os.path.join(INPUT_DATASET_ROOT, "andrewmvd_dataset/")
-ASLANAHMEDOV_DATASET_ROOT = os.path.join(INPUT_DATASET_ROOT, "aslanahmedov_dataset/")
-
-OUTPUT_DIRECTORY = "./training_data_preprocessed/"
-OUTPUT_TRAINING_DIRECTORY = os.path.join(OUTPUT_DIRECTORY, "training/")
-OUTPUT_TRAINING_IMAGES_DIRECTORY = os.path.join(OUTPUT_TRAINING_DIRECTORY, "images/")
-OUTPUT_TRAINING_LABELS_DIRECTORY = os.path.join(OUTPUT_TRAINING_DIRECTORY, "labels/")
-OUTPUT_VALIDATION_DIRECTORY = os.path.join(OUTPUT_DIRECTORY, "validation/")
-OUTPUT_VALIDATION_IMAGES_DIRECTORY = os.path.join(OUTPUT_VALIDATION_DIRECTORY, "images/")
-OUTPUT_VALIDATION_LABELS_DIRECTORY = os.path.join(OUTPUT_VALIDATION_DIRECTORY, "labels/")
-
+        return False
+
+    with open(new_yolo_annotation_path, "w") as yolo_annotation_file:
+        yolo_annotation_file.write(yolo_annotation)
+    return True
+
+# Every process opens each zip only once, members are read straight out of it, nothing gets extracted
+_OPEN_ZIP_FILES = {} # zip path => zipfile.ZipFile
+def _read_zip_member(zip_path: str, member_name: str) -> bytes:
+    if zip_path not in _OPEN_ZIP_FILES:
+        _OPEN_ZIP_FILES[zip_path] = zipfile.ZipFile(zip_path, "r")
+    return _OPEN_ZIP_FILES[zip_path].read(member_name)
+
+# Runs inside of the worker processes
+# Returns True if the item was saved
+def prepare_dataset_item(item_id: str, zip_path: str, image_member: str, annotation_member: str, split: str) -> bool:
+    yolo_annotation = convert_pascal_voc_into_yolo_annotation(io.BytesIO(_read_zip_member(zip_path, annotation_member)))
+    new_image_path, new_yolo_annotation_path = get_output_paths_of_item(item_id, split)
+    return save_dataset_item(image_member, _read_zip_member(zip_path, image_member), yolo_annotation, new_image_path, new_yolo_annotation_path)
+
+# Returns {item_id: (zip path, image member, annotation member, content hash)} of every dataset
+# Content hash is made of CRC-32 and size the zip stores for every member, so changed items are found without decompressing anything
+def list_dataset_items() -> dict:
+    items = {}
+    for name, zip_name, images_directory, image_extensions, annotations_directory in DATASETS:
+        zip_path = os.path.join(RESOURCES_DIRECTORY, zip_name)
+        print(f"Listing {name} dataset")
+        with zipfile.ZipFile(zip_path, "r") as zip_file:
+            members = {member.filename: member for member in zip_file.infolist() if member.is_dir() is False}
+        for image_member in sorted(members.keys()):
+            image_name, image_extension = os.path.splitext(image_member)
+            if os.path.dirname(image_member) + "/" != images_directory or image_extension not in image_extensions:
+                continue
+
+            annotation_member = f"{annotations_directory}{os.path.basename(image_name)}.xml"
+            if annotation_member not in members:
+                print(f'Annotation {annotation_member} of {zip_name} missing.')
+                continue
+
+            image_info, annotation_info = members[image_member], members[annotation_member]
+            content_hash = f"{image_info.CRC:08x}:{image_info.file_size}:{annotation_info.CRC:08x}:{annotation_info.file_size}"
+            items[f"{name}_{os.path.basename(image_name)}"] = (zip_path, image_member, annotation_member, content_hash)
+    return items
+
+def load_manifest() -> dict:
+    if os.path.isfile(OUTPUT_MANIFEST_PATH) is False:
+        return None
+    with open(OUTPUT_MANIFEST_PATH) as manifest_file:
+        manifest = json.load(manifest_file)
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+def save_manifest(prepared_items: dict):
+    with open(OUTPUT_MANIFEST_PATH + ".tmp", "w") as manifest_file:
+        json.dump({"version": MANIFEST_VERSION, "items": prepared_items}, manifest_file, indent=1, sort_keys=True)
+    os.replace(OUTPUT_MANIFEST_PATH + ".tmp", OUTPUT_MANIFEST_PATH)
+
+def _remove_item_files(item_id: str, split: str):
+    for path in get_output_paths_of_item(item_id, split):
+        if os.path.exists(path):
+            os.remove(path)
 
 if __name__ == '__main__':
+    args = parser.parse_args()
+    started_at = time.perf_counter()
     print("Preparing environment")
-
-    if os.path.exists(INPUT_DATASET_ROOT):
-        shutil.rmtree(INPUT_DATASET_ROOT)
-    os.mkdir(INPUT_DATASET_ROOT)
-    os.mkdir(ANDREWMVD_DATASET_ROOT)
-    os.mkdir(ASLANAHMEDOV_DATASET_ROOT)
-
-    if os.path.exists(OUTPUT_DIRECTORY):
+    manifest = None if args.rebuild else load_manifest()
+    # Without a manifest (first run, older version of this script or --rebuild), nothing in the output can be trusted
+    if manifest is None and os.path.exists(OUTPUT_DIRECTORY):
         shutil.rmtree(OUTPUT_DIRECTORY)
-    os.mkdir(OUTPUT_DIRECTORY)
-    os.mkdir(OUTPUT_TRAINING_DIRECTORY)
-    os.mkdir(OUTPUT_TRAINING_IMAGES_DIRECTORY)
-    os.mkdir(OUTPUT_TRAINING_LABELS_DIRECTORY)
-    os.mkdir(OUTPUT_VALIDATION_DIRECTORY)
-    os.mkdir(OUTPUT_VALIDATION_IMAGES_DIRECTORY)
-    os.mkdir(OUTPUT_VALIDATION_LABELS_DIRECTORY)
-
-    print("Loading and parsing andrewmvd dataset")
-    with zipfile.ZipFile(os.path.join(RESOURCES_DIRECTORY, "andrewmvd_dataset.zip"), "r") as zip_ref:
-        zip_ref.extractall(ANDREWMVD_DATASET_ROOT)
-    andrewmvd_dataset = []
-    andrewmvd_images_path = os.path.join(ANDREWMVD_DATASET_ROOT, "images")
-    for image_file_name in os.listdir(andrewmvd_images_path):
-        image_path = os.path.join(andrewmvd_images_path, image_file_name)
-        if os.path.isfile(image_path) is False:
+    for images_directory, labels_directory in OUTPUT_DIRECTORIES_OF_SPLIT.values():
+        os.makedirs(images_directory, exist_ok=True)
+        os.makedirs(labels_directory, exist_ok=True)
+    prepared_items = {} if manifest is None else manifest["items"] # item_id => {"hash": content hash, "split": split}
+
+    items = list_dataset_items()
+    for item_id in [item_id for item_id in prepared_items if item_id not in items]:
+        _remove_item_files(item_id, prepared_items.pop(item_id)["split"])
+
+    items_to_prepare = [] # [(item_id, zip path, image member, annotation member, split)]
+    number_of_moved_items = 0
+    for item_id, (zip_path, image_member, annotation_member, content_hash) in items.items():
+        split = get_split_of_item(item_id, args.seed, args.validation_ratio)
+        prepared_item = prepared_items.get(item_id)
+        if prepared_item is not None and prepared_item["hash"] == content_hash and all(os.path.exists(path) for path in get_output_paths_of_item(item_id, prepared_item["split"])):
+            if prepared_item["split"] != split: # different --seed or --validation-ratio
+                for old_path, new_path in zip(get_output_paths_of_item(item_id, prepared_item["split"]), get_output_paths_of_item(item_id, split)):
+                    os.replace(old_path, new_path)
+                prepared_item["split"] = split
+                number_of_moved_items += 1
             continue
 
-        annotation_path = os.path.join(ANDREWMVD_DATASET_ROOT, "annotations", f'{image_file_name.removesuffix(".png")}.xml')
-        if os.path.isfile(annotation_path) is False:
-            print(f'Annotation {annotation_path} missing.')
-            continue
+        if prepared_item is not None:
+            _remove_item_files(item_id, prepared_items.pop(item_id)["split"])
+        items_to_prepare.append((item_id, zip_path, image_member, annotation_member, split))
 
-        yolo_annotation = convert_pascal_voc_into_yolo_annotation(annotation_path)
-        andrewmvd_dataset.append((image_path, yolo_annotation))
-
-    print("Loading and parsing aslanahmedov dataset")
-    with zipfile.ZipFile(os.path.join(RESOURCES_DIRECTORY, "aslanahmedov_dataset.zip"), "r") as zip_ref:
-        zip_ref.extractall(ASLANAHMEDOV_DATASET_ROOT)
-    aslanahmedov_dataset = []
-    aslanahmedov_images_path = os.path.join(ASLANAHMEDOV_DATASET_ROOT, "images")
-    for image_file_name in os.listdir(aslanahmedov_images_path):
-        image_path = os.path.join(aslanahmedov_images_path, image_file_name)
-        if os.path.isfile(image_path) is False or image_path.endswith(".jpeg") is False:
-            continue
-
-        annotation_path = os.path.join(os.path.dirname(image_path), f'{image_file_name.removesuffix(".jpeg")}.xml')
-        if os.path.isfile(annotation_path) is False:
-            print(f'Annotation {annotation_path} missing.')
-            continue
-
-        yolo_annotation = convert_pascal_voc_into_yolo_annotation(annotation_path)
-        aslanahmedov_dataset.append((image_path, yolo_annotation))
-
-    print("Spliting all datasets into training and validation data")
-    andrewmvd_training_dataset, andrewmvd_validation_dataset = train_validation_split(andrewmvd_dataset)
-    aslanahmedov_training_dataset, aslanahmedov_validation_dataset = train_validation_split(aslanahmedov_dataset)
-
-    print("Merging all training and validation datasets")
-    training_dataset = andrewmvd_training_dataset + aslanahmedov_training_dataset
-    validation_dataset = andrewmvd_validation_dataset + aslanahmedov_validation_dataset
-
-    print("Shuffling finalized datasets")
-    np.random.shuffle(training_dataset)
-    np.random.shuffle(validation_dataset)
-
-    print("Saving training data")
-    for i, (image_path, yolo_annotation) in enumerate(training_dataset):
-        save_dataset_item(image_path, yolo_annotation, OUTPUT_TRAINING_IMAGES_DIRECTORY, OUTPUT_TRAINING_LABELS_DIRECTORY, i)
-
-    print("Saving validation data")
-    for i, (image_path, yolo_annotation) in enumerate(validation_dataset):
-        save_dataset_item(image_path, yolo_annotation, OUTPUT_VALIDATION_IMAGES_DIRECTORY, OUTPUT_VALIDATION_LABELS_DIRECTORY, i)
\ No newline at end of file
+    print(f"Converting {len(items_to_prepare)} new or changed items ({len(items) - len(items_to_prepare)} already prepared) with {args.workers} workers")
+    if args.workers > 1 and len(items_to_prepare) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+            results = list(executor.map(prepare_dataset_item, *zip(*items_to_prepare), chunksize=8))
+    else:
+        results = [prepare_dataset_item(*item) for item in items_to_prepare]
+    for (item_id, _, _, _, split), saved in zip(items_to_prepare, results):
+        if saved:
+            prepared_items[item_id] = {"hash": items[item_id][3], "split": split}
+    save_manifest(prepared_items)
+
+    number_of_validation_items = sum(prepared_item["split"] == VALIDATION for prepared_item in prepared_items.values())
+    print(f"Prepared {len(prepared_items) - number_of_validation_items} training and {number_of_validation_items} validation items ({len(items_to_prepare)} converted, {number_of_moved_items} moved between splits) in {time.perf_counter() - started_at:.1f} s")
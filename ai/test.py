@@ -1,9 +1,9 @@
 import argparse
 import os
 import sys
+import cv2
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
-from PIL import Image
 from ultralytics import YOLO
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import utils
@@ -21,7 +21,7 @@ if __name__ == '__main__':
     license_plate_prediction_model = YOLO(args.trained_model)
 
     print("Starting prediction")
-    img_to_test = Image.open(args.img_to_test)
+    img_to_test = cv2.imread(args.img_to_test) # BGR, same as frames captured by the server
     number_of_license_plate_boxes_found, license_plates_as_boxes = utils.detect_with_yolo(license_plate_prediction_model, img_to_test, True)
     if number_of_license_plate_boxes_found == 0:
         print("Didn't find any boxes/matches.")
@@ -29,7 +29,7 @@ if __name__ == '__main__':
     
     print("Plotting image")
     plt.figure()
-    plt.imshow(img_to_test)
+    plt.imshow(cv2.cvtColor(img_to_test, cv2.COLOR_BGR2RGB))
     
     print("Plotting boxes")
     ax = plt.gca()
@@ -34,6 +34,12 @@ pub async fn websocket_main(
             }
         };
 
+        // Cars recognized while disconnected are sent right away, server keeps the last ones in memory
+        let last_seen_uuid = car_rows.lock().unwrap().first().map(|car| car.uuid);
+        if let Some(last_seen_uuid) = last_seen_uuid {
+            _ = ws.send_text(format!("since:{}", last_seen_uuid)).await;
+        }
+
         loop {
             match websocket_receive_car(&mut ws).await {
                 Ok(Some(s)) => car_rows.lock().unwrap().insert(0, s),
@@ -10,6 +10,7 @@ if not exists(select 1 from sys.tables where name = 'main_gate_alpr_license_plat
         id uniqueidentifier primary key,
         license_plate nvarchar(10) not null,
         captured_at datetime not null,
+        camera nvarchar(50), -- only when results are tagged by camera (multiple cameras, or CAMERA_NAMES set)
 
         -- filled out by the user
         license_plate_corrected nvarchar(10),
@@ -21,4 +22,10 @@ if not exists(select 1 from sys.tables where name = 'main_gate_alpr_license_plat
         drove_away_at datetime,
     ) 
 end
+go
+
+-- tables created before multi-camera support
+if not exists(select 1 from sys.columns where name = 'camera' and object_id = object_id('main_gate_alpr_license_plates')) begin
+    alter table main_gate_alpr_license_plates add camera nvarchar(50)
+end
 go
\ No newline at end of file
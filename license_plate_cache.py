@@ -0,0 +1,84 @@
+import collections
+import time
+import cv2
+import numpy as np
+
+# Size of the hash, wide and low like the license plate itself, so every character gets a few columns of the hash
+HASH_WIDTH = 32
+HASH_HEIGHT = 8
+HASH_BYTES = HASH_WIDTH * HASH_HEIGHT // 8
+_BITS_SET = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint16) # byte => number of bits set
+
+# Perceptual (average) hash of a grayscale license plate image, every bit tells whether a pixel of a small thumbnail is brighter than the median of the thumbnail.
+# It doesn't change with brightness, contrast, or size of the license plate, only with what's written on it.
+# Returns HASH_BYTES long uint8 array
+def compute_license_plate_hash(license_plate_image: np.ndarray) -> np.ndarray:
+    thumbnail = cv2.resize(license_plate_image, (HASH_WIDTH, HASH_HEIGHT), interpolation=cv2.INTER_AREA)
+    return np.packbits(thumbnail > np.median(thumbnail))
+
+# License plates read in the last `ttl_seconds`, keyed on the hash of the license plate image, so a parked or slowly moving car isn't segmented and OCR'd on every frame.
+# A license plate image whose hash differs in at most `max_distance` bits (out of HASH_WIDTH * HASH_HEIGHT) from a cached one is considered the same image (noise, compression).
+# Hashes are kept in one matrix, so a lookup compares the hash against every entry by a few numpy operations.
+# Entries expire `ttl_seconds` after they were read (a hit doesn't extend it), when the cache is full, the least recently used entry is replaced.
+class LicensePlateReadCache:
+    def __init__(self, max_size: int, ttl_seconds: float, max_distance: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.hashes = np.zeros((max(max_size, 1), HASH_BYTES), dtype=np.uint8)
+        self.stored_at = np.zeros(len(self.hashes), dtype=np.float64)
+        self.is_used = np.zeros(len(self.hashes), dtype=bool)
+        self.license_plates = [None] * len(self.hashes) # slot => license plate as string
+        self.slots_by_use = collections.OrderedDict() # slot => None, least recently used first
+        self.free_slots = list(range(len(self.hashes) - 1, -1, -1))
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def _free_slot(self, slot: int):
+        self.is_used[slot] = False
+        self.license_plates[slot] = None
+        del self.slots_by_use[slot]
+        self.free_slots.append(slot)
+
+    def _evict_expired(self, now: float):
+        expired_slots = np.flatnonzero(self.is_used & (now - self.stored_at > self.ttl_seconds))
+        for slot in expired_slots:
+            self._free_slot(int(slot))
+        self.stats["expired"] += len(expired_slots)
+
+    # Returns license plate as string ("" if no characters were found on it), or None if the image isn't cached
+    def get(self, license_plate_hash: np.ndarray, now: float = None) -> str:
+        now = time.monotonic() if now is None else now
+        self._evict_expired(now)
+        if len(self.slots_by_use) > 0:
+            distances = _BITS_SET[np.bitwise_xor(self.hashes, license_plate_hash)].sum(axis=1)
+            distances[~self.is_used] = self.max_distance + 1
+            slot = int(np.argmin(distances))
+            if distances[slot] <= self.max_distance:
+                self.slots_by_use.move_to_end(slot)
+                self.stats["hits"] += 1
+                return self.license_plates[slot]
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, license_plate_hash: np.ndarray, license_plate_as_string: str, now: float = None):
+        now = time.monotonic() if now is None else now
+        if len(self.free_slots) == 0:
+            self._free_slot(next(iter(self.slots_by_use)))
+            self.stats["evicted"] += 1
+        slot = self.free_slots.pop()
+        self.hashes[slot] = license_plate_hash
+        self.stored_at[slot] = now
+        self.is_used[slot] = True
+        self.license_plates[slot] = license_plate_as_string
+        self.slots_by_use[slot] = None
+
+    # {hits, misses, hit_rate, entries, expired, evicted}
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups > 0 else 0.0,
+            "entries": len(self.slots_by_use),
+        }
+
+    def __len__(self) -> int:
+        return len(self.slots_by_use)
@@ -0,0 +1,102 @@
+import os
+import queue
+import concurrent.futures
+import numpy as np
+import pytesseract
+
+TESSERACT_LANGUAGE = "eng"
+TESSERACT_DPI = 96
+TESSERACT_CHAR_WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+# Every backend takes single character images (black character on white background, 2D uint8 arrays or PIL images) and returns one string per image.
+# Backends are long-lived, create them once at start-up and reuse them for every license plate.
+class OcrBackend:
+    def read_characters(self, letter_images: list[np.ndarray]) -> list[str]:
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _normalize_character(char_from_img: str) -> str:
+        return str(char_from_img).replace("O", "0").strip()
+
+# Original behavior, kept as a fallback and for comparing outputs.
+# Every character still spawns a tesseract process, but the thread pool is created only once.
+class PytesseractOcrBackend(OcrBackend):
+    def __init__(self, number_of_workers: int):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=number_of_workers)
+        self.config = f"--psm 13 --dpi {TESSERACT_DPI} -c tessedit_char_whitelist={TESSERACT_CHAR_WHITELIST}"
+
+    def read_characters(self, letter_images: list[np.ndarray]) -> list[str]:
+        return list(self.executor.map(self._read_character, letter_images))
+
+    def _read_character(self, letter_image: np.ndarray) -> str:
+        return self._normalize_character(pytesseract.image_to_string(letter_image, lang=TESSERACT_LANGUAGE, config=self.config))
+
+    def close(self):
+        self.executor.shutdown()
+
+# Tesseract running in-process through tesserocr (`pip install tesserocr`).
+# Each worker owns one tesseract API with the model already loaded, so reading a character is just a function call.
+# tesserocr releases the GIL while recognizing, so the workers really do run in parallel.
+class TesserocrOcrBackend(OcrBackend):
+    def __init__(self, number_of_workers: int):
+        # Same as in server.py's __main__, however this has to be set before the tesseract library gets loaded
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+        try:
+            import tesserocr
+        except ImportError:
+            raise RuntimeError("OCR backend \"tesserocr\" requires the tesserocr package (`pip install tesserocr`).")
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=number_of_workers)
+        self.apis = queue.Queue()
+        for _ in range(number_of_workers):
+            api = tesserocr.PyTessBaseAPI(lang=TESSERACT_LANGUAGE, psm=tesserocr.PSM.RAW_LINE)
+            api.SetVariable("tessedit_char_whitelist", TESSERACT_CHAR_WHITELIST)
+            api.SetVariable("user_defined_dpi", str(TESSERACT_DPI))
+            self.apis.put(api)
+        self.number_of_workers = number_of_workers
+
+    def read_characters(self, letter_images: list[np.ndarray]) -> list[str]:
+        if len(letter_images) == 0:
+            return []
+
+        # One chunk per worker, so every worker grabs its API only once per call
+        chunk_size = -(-len(letter_images) // self.number_of_workers)
+        chunks = [letter_images[i:i + chunk_size] for i in range(0, len(letter_images), chunk_size)]
+        results = []
+        for chunk_result in self.executor.map(self._read_chunk, chunks):
+            results.extend(chunk_result)
+        return results
+
+    def _read_chunk(self, letter_images: list[np.ndarray]) -> list[str]:
+        api = self.apis.get()
+        try:
+            chunk_result = []
+            for letter_image in letter_images:
+                if isinstance(letter_image, np.ndarray):
+                    letter_image = np.ascontiguousarray(letter_image)
+                    api.SetImageBytes(letter_image.tobytes(), letter_image.shape[1], letter_image.shape[0], 1, letter_image.shape[1])
+                else:
+                    api.SetImage(letter_image)
+                chunk_result.append(self._normalize_character(api.GetUTF8Text()))
+            return chunk_result
+        finally:
+            self.apis.put(api)
+
+    def close(self):
+        self.executor.shutdown()
+        while self.apis.empty() is False:
+            self.apis.get().End()
+
+OCR_BACKENDS = {
+    "pytesseract": PytesseractOcrBackend,
+    "tesserocr": TesserocrOcrBackend,
+}
+
+def create_ocr_backend(name: str, number_of_workers: int = None) -> OcrBackend:
+    name = name.strip().lower()
+    if name not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend \"{name}\", choose one of: {', '.join(OCR_BACKENDS.keys())}")
+    return OCR_BACKENDS[name](number_of_workers or os.cpu_count() or 1)
@@ -0,0 +1,858 @@
+import argparse
+import csv
+import importlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import sqlite3
+import tempfile
+import uuid
+import random
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+import torch
+from dotenv import load_dotenv
+from PIL import Image
+from ultralytics import YOLO
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils
+import ocr_backends
+from detection_roi import DetectionRoi
+from difflib import SequenceMatcher
+from datetime import datetime, timedelta
+from sent_plates_history import SentLicensePlatesHistory
+from result_store import ResultRecord, ResultWriter, SqliteResultStorage, TABLE_NAME
+from result_artifact import JPEG_ENCODERS, create_jpeg_encoder
+from metrics import MetricsRegistry
+from stage_timings import StageTimings, STAGE_OCR
+from license_plate_cache import LicensePlateReadCache, compute_license_plate_hash
+from recognition import Recognition, RecognitionRounds, compute_sharpness
+
+parser = argparse.ArgumentParser(
+    prog="ALPR benchmarks",
+    description="Measure how fast parts of the matching pipeline are on your hardware",
+)
+subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+lp_batching_parser = subparsers.add_parser("lp-batching", help="Per-car license plate detection vs. batched license plate detection")
+lp_batching_parser.add_argument("license_plate_model", help="Path to license plate model")
+lp_batching_parser.add_argument("car_image", help="Path to image of a single car (cropped), it gets repeated to simulate multiple cars in one frame")
+lp_batching_parser.add_argument("--cars", type=int, nargs="+", default=[1, 4, 8], help="Number of cars per frame to benchmark")
+lp_batching_parser.add_argument("--repeats", type=int, default=10, help="How many frames to measure per number of cars")
+
+ocr_parser = subparsers.add_parser("ocr", help="Per-license plate OCR latency of every OCR backend")
+ocr_parser.add_argument("license_plate_model", help="Path to license plate model")
+ocr_parser.add_argument("car_image", help="Path to image of a car (cropped), all license plates found on it get read")
+ocr_parser.add_argument("--backends", nargs="+", default=list(ocr_backends.OCR_BACKENDS.keys()), help="OCR backends to compare")
+ocr_parser.add_argument("--workers", type=int, default=None, help="Number of OCR workers (default is number of CPU cores)")
+ocr_parser.add_argument("--repeats", type=int, default=10, help="How many times to read each license plate")
+
+roi_parser = subparsers.add_parser("roi", help="Car detection throughput on the full frame vs. on the region of interest")
+roi_parser.add_argument("pure_yolo_model", help="Path to pure yolo model")
+roi_parser.add_argument("video", help="Path to video (or RTSP config) to read frames from")
+roi_parser.add_argument("--roi", required=True, help="Same format as DETECTION_ROI")
+roi_parser.add_argument("--scale", type=float, default=1, help="Same as DETECTION_ROI_SCALE")
+roi_parser.add_argument("--frames", type=int, default=100, help="How many frames of the video to use")
+
+dedup_parser = subparsers.add_parser("dedup", help="Checking whether a license plate was already sent, list + SequenceMatcher vs. SentLicensePlatesHistory")
+dedup_parser.add_argument("--history", type=int, default=10000, help="Number of license plates in the history")
+dedup_parser.add_argument("--queries", type=int, default=100, help="Number of license plates to check")
+dedup_parser.add_argument("--seed", type=int, default=0, help="Seed of the random license plates")
+
+result_writer_parser = subparsers.add_parser("result-writer", help="Saving results with a connection + insert + commit per result vs. ResultWriter (sqlite stands in for the database)")
+result_writer_parser.add_argument("--results", type=int, default=1000, help="Number of results to save")
+result_writer_parser.add_argument("--batch-size", type=int, default=50, help="Same as DB_WRITER_BATCH_SIZE")
+
+jpeg_parser = subparsers.add_parser("jpeg", help="Encode time per result, PIL encoding every crop for websocket and again for disk vs. encoding once")
+jpeg_parser.add_argument("car_image", help="Path to image of a car (cropped), its bottom middle part (grayscale) stands in for the license plate")
+jpeg_parser.add_argument("--encoders", nargs="+", default=list(JPEG_ENCODERS.keys()), help="JPEG encoders to compare")
+jpeg_parser.add_argument("--quality", type=int, default=75, help="Same as RESULT_JPEG_QUALITY")
+jpeg_parser.add_argument("--repeats", type=int, default=50, help="How many results to encode")
+
+preprocess_parser = subparsers.add_parser("preprocess", help="Per-license plate segmentation, original PIL based path vs. numpy path, checks that both binarize the same way")
+preprocess_parser.add_argument("license_plate_model", help="Path to license plate model")
+preprocess_parser.add_argument("car_images", nargs="+", help="Paths to images of cars (cropped), all license plates found on them get segmented")
+preprocess_parser.add_argument("--repeats", type=int, default=20, help="How many times to segment each license plate")
+preprocess_parser.add_argument("--max-different-pixels", type=float, default=0.02, help="Maximum ratio of differently binarized pixels for the check to pass")
+
+segmentation_parser = subparsers.add_parser("segmentation", help="Letter segmentation, accurate vs. fast SEGMENTATION_MODE (accuracy + speed)")
+segmentation_parser.add_argument("--license-plate-model", help="Path to license plate model, license plates found on --car-images are compared between both modes")
+segmentation_parser.add_argument("--car-images", nargs="+", default=[], help="Paths to images of cars (cropped)")
+segmentation_parser.add_argument("--synthetic", type=int, default=0, help="Number of generated license plates (known text, different sizes/lighting/noise) to score both modes against")
+segmentation_parser.add_argument("--ocr-backend", default=None, help="Also read the letters with this OCR backend and compare the strings")
+segmentation_parser.add_argument("--repeats", type=int, default=10, help="How many times to segment each license plate")
+segmentation_parser.add_argument("--seed", type=int, default=0, help="Seed of the generated license plates")
+
+capture_parser = subparsers.add_parser("capture", help="Capture CPU time, read() of every frame vs. grab() of every frame + retrieve() of only some (CAPTURE_MODE)")
+capture_parser.add_argument("video", help="Path to video (or RTSP config) to read frames from")
+capture_parser.add_argument("--retrieve-every", type=int, nargs="+", default=[1, 3, 6, 12], help="Retrieve every n-th grabbed frame, stands in for the detection asking for frames")
+capture_parser.add_argument("--frames", type=int, default=300, help="How many frames of the video to use")
+
+cameras_parser = subparsers.add_parser("cameras", help="Car detection of multiple cameras, one process (and model) per camera vs. one process with a shared model and batched predict()")
+cameras_parser.add_argument("pure_yolo_model", help="Path to pure yolo model")
+cameras_parser.add_argument("video", help="Path to video (or RTSP config) to read frames from, every camera gets the same frames")
+cameras_parser.add_argument("--cameras", type=int, default=3, help="Number of cameras")
+cameras_parser.add_argument("--frames", type=int, default=50, help="How many frames every camera processes")
+
+metrics_parser = subparsers.add_parser("metrics", help="Overhead of instrumentation (stage timers, counters, histograms) per call, with METRICS_ENABLED and without")
+metrics_parser.add_argument("--calls", type=int, default=200000, help="How many calls to measure")
+
+ocr_cache_parser = subparsers.add_parser("ocr-cache", help="Reading license plates of cars standing in front of the camera, every frame segmented and OCR'd vs. OCR cache (hit rate, wrong hits, time per license plate)")
+ocr_cache_parser.add_argument("--plates", type=int, default=50, help="Number of generated license plates (cars)")
+ocr_cache_parser.add_argument("--frames", type=int, default=20, help="Frames every car stands in front of the camera (noise, lighting and position of the license plate box change slightly between frames)")
+ocr_cache_parser.add_argument("--max-distances", type=int, nargs="+", default=[0, 4, 8, 16], help="Values of OCR_CACHE_MAX_DISTANCE to compare")
+ocr_cache_parser.add_argument("--ocr-backend", default=None, help="Also read the letters with this OCR backend, without it only segmentation is measured")
+ocr_cache_parser.add_argument("--seed", type=int, default=0, help="Seed of the generated license plates")
+
+validation_memory_parser = subparsers.add_parser("validation-memory", help="Memory held by validation (VALIDATION_MODE=rounds) at a busy gate, tuples with car and license plate images of every recognition vs. compact recognitions (best one per license plate)")
+validation_memory_parser.add_argument("--frames", type=int, default=100, help="Number of frames")
+validation_memory_parser.add_argument("--cars", type=int, default=6, help="Cars in view on every frame")
+validation_memory_parser.add_argument("--width", type=int, default=3840, help="Width of the frames")
+validation_memory_parser.add_argument("--height", type=int, default=2160, help="Height of the frames")
+validation_memory_parser.add_argument("--rounds", type=int, default=3, help="NUMBER_OF_VALIDATION_ROUNDS")
+validation_memory_parser.add_argument("--occurrences", type=int, default=2, help="NUMBER_OF_OCCURRENCES_TO_BE_VALID")
+validation_memory_parser.add_argument("--misread-ratio", type=float, default=0.5, help="Share of license plates OCR misreads (every misread is a different string)")
+validation_memory_parser.add_argument("--seed", type=int, default=0, help="Seed of the generated gate")
+
+replay_parser = subparsers.add_parser("replay", help="Feeds a video (or a folder of frames) through the production pipeline (car detection => license plate reading => validation => dedup) as fast as possible, reports fps, latency of every stage and accuracy")
+replay_parser.add_argument("source", help="Path to video, or to folder of frames (in order of their file names)")
+replay_parser.add_argument("--env-file", default=".env", help="Configuration of the server to replay with (models, VALIDATION_MODE, thresholds, ...), websocket, database, saving results and worker processes are never used")
+replay_parser.add_argument("--fps", type=float, default=None, help="Frame rate of the source, time of every frame (car tracks, history of sent license plates, motion gate) is derived from it. Default is fps of the video, or 10 for a folder of frames")
+replay_parser.add_argument("--frames", type=int, default=None, help="Replay at most this many frames")
+replay_parser.add_argument("--ground-truth", help="CSV with column license_plate (optionally first_frame and last_frame), results are scored against it")
+replay_parser.add_argument("--report", help="Save results, timings and scores as JSON, it can be used as --baseline of a later run")
+replay_parser.add_argument("--baseline", help="Report of an earlier run, exits with 1 if the results differ, or fps dropped by more than --max-slowdown")
+replay_parser.add_argument("--max-slowdown", type=float, default=0.1, help="Allowed drop of fps against --baseline (0.1 => 10 %%)")
+
+def _measure(function, repeats: int) -> (float, float):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    timings_ms = np.array(timings) * 1000
+    return (float(np.mean(timings_ms)), float(np.percentile(timings_ms, 95)))
+
+def benchmark_lp_batching(args):
+    license_plate_model = YOLO(args.license_plate_model)
+    car_image = cv2.imread(args.car_image)
+    utils.detect_with_yolo(license_plate_model, car_image, False) # warm-up
+
+    print(f"{'cars':>5} | {'per-car mean':>13} | {'per-car p95':>12} | {'batched mean':>13} | {'batched p95':>12} | {'speedup':>7}")
+    for number_of_cars in args.cars:
+        # Slightly different sizes, so the batch has to be letterboxed just like real crops
+        car_images = [cv2.resize(car_image, (car_image.shape[1] + i * 7, car_image.shape[0] + i * 3)) for i in range(number_of_cars)]
+        utils.detect_with_yolo_batched(license_plate_model, car_images, False, number_of_cars) # warm-up for this batch size
+
+        per_car_mean, per_car_p95 = _measure(lambda: [utils.detect_with_yolo(license_plate_model, image, False) for image in car_images], args.repeats)
+        batched_mean, batched_p95 = _measure(lambda: utils.detect_with_yolo_batched(license_plate_model, car_images, False, number_of_cars), args.repeats)
+        print(f"{number_of_cars:>5} | {per_car_mean:>10.1f} ms | {per_car_p95:>9.1f} ms | {batched_mean:>10.1f} ms | {batched_p95:>9.1f} ms | {per_car_mean / batched_mean:>6.2f}x")
+
+def benchmark_ocr(args):
+    license_plate_model = YOLO(args.license_plate_model)
+    car_image = cv2.imread(args.car_image)
+    _, license_plates_as_boxes = utils.detect_with_yolo(license_plate_model, car_image, False)
+    letter_images_of_license_plates = [utils.segment_license_plate(i, box, car_image, 500, 20, False, False, 0)[1] for i, box in enumerate(license_plates_as_boxes)] # defaults from .env.development
+    letter_images_of_license_plates = [letter_images for letter_images in letter_images_of_license_plates if len(letter_images) > 0]
+    if len(letter_images_of_license_plates) == 0:
+        print("Didn't find any license plates with letters to read.")
+        sys.exit(1)
+
+    print(f"{'backend':>12} | {'per-plate mean':>14} | {'per-plate p95':>13} | results")
+    for backend_name in args.backends:
+        ocr_backend = ocr_backends.create_ocr_backend(backend_name, args.workers)
+        license_plates_as_strings = utils.read_letters_of_license_plates(ocr_backend, letter_images_of_license_plates, False) # warm-up
+        mean, p95 = _measure(lambda: [utils.read_letters_of_license_plates(ocr_backend, [letter_images], False) for letter_images in letter_images_of_license_plates], args.repeats)
+        ocr_backend.close()
+        number_of_plates = len(letter_images_of_license_plates)
+        print(f"{backend_name:>12} | {mean / number_of_plates:>11.1f} ms | {p95 / number_of_plates:>10.1f} ms | {', '.join(license_plates_as_strings)}")
+
+def _read_video_frames(video: str, number_of_frames: int) -> list[np.ndarray]:
+    capture = cv2.VideoCapture(video)
+    frames = []
+    while capture.isOpened() and len(frames) < number_of_frames:
+        able_to_read_frame, frame = capture.read()
+        if able_to_read_frame is False:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+def benchmark_roi(args):
+    pure_yolo_model = YOLO(args.pure_yolo_model)
+    detection_roi = DetectionRoi.from_config(args.roi, args.scale)
+    frames = _read_video_frames(args.video, args.frames)
+    if len(frames) == 0:
+        print("Unable to read any frames from the video.")
+        sys.exit(1)
+    utils.detect_with_yolo(pure_yolo_model, frames[0], False) # warm-up
+    utils.detect_with_yolo(pure_yolo_model, detection_roi.apply(frames[0]), False)
+
+    print(f"{'mode':>10} | {'fps':>7} | {'mean':>10} | {'boxes found':>11}")
+    for mode, prepare_frame in [("full frame", lambda frame: frame), ("roi", detection_roi.apply)]:
+        number_of_boxes = 0
+        start = time.perf_counter()
+        for frame in frames:
+            number_of_boxes += utils.detect_with_yolo(pure_yolo_model, prepare_frame(frame), False)[0]
+        elapsed = time.perf_counter() - start
+        print(f"{mode:>10} | {len(frames) / elapsed:>7.2f} | {elapsed / len(frames) * 1000:>7.1f} ms | {number_of_boxes:>11}")
+
+def _random_license_plate(rng: random.Random) -> str:
+    license_plate = "".join(rng.choice("ABCDEFGHIJKLMNPQRSTUVWXYZ0123456789") for _ in range(rng.choice([6, 7, 7, 8])))
+    return license_plate[:3] + " " + license_plate[3:]
+
+def benchmark_dedup(args):
+    rng = random.Random(args.seed)
+    history = [_random_license_plate(rng) for _ in range(args.history)]
+    # Half of the queries are misreads (one character changed) of license plates from the history
+    queries = []
+    for i in range(args.queries):
+        if i % 2 == 0:
+            license_plate = list(rng.choice(history))
+            license_plate[rng.choice([i for i, char in enumerate(license_plate) if char != " "])] = "0"
+            queries.append("".join(license_plate))
+        else:
+            queries.append(_random_license_plate(rng))
+
+    list_history = [(license_plate, datetime.now()) for license_plate in history]
+    def query_list_history():
+        nonlocal list_history
+        results = []
+        for query in queries:
+            list_history = [s for s in list_history if datetime.now() - s[1] <= timedelta(minutes=5)]
+            results.append(any((s[0] == query or SequenceMatcher(None, s[0], query).ratio() > 0.8) for s in list_history))
+        return results
+
+    indexed_history = SentLicensePlatesHistory(5 * 60, 0.8)
+    for license_plate in history:
+        indexed_history.add(license_plate)
+    query_indexed_history = lambda: [indexed_history.is_duplicate(query) for query in queries]
+
+    list_results = query_list_history()
+    indexed_results = query_indexed_history()
+    list_mean, _ = _measure(query_list_history, 1)
+    indexed_mean, _ = _measure(query_indexed_history, 3)
+    agreement = sum(a == b for a, b in zip(list_results, indexed_results)) / len(queries)
+    print(f"history: {args.history} license plates, {len(queries)} queries")
+    print(f"list + SequenceMatcher:   {list_mean / len(queries):>9.3f} ms per query, {sum(list_results)} duplicates found")
+    print(f"SentLicensePlatesHistory: {indexed_mean / len(queries):>9.3f} ms per query, {sum(indexed_results)} duplicates found")
+    print(f"speedup: {list_mean / indexed_mean:.1f}x, results agreement: {agreement * 100:.1f}%")
+
+def benchmark_result_writer(args):
+    records = [ResultRecord(str(uuid.uuid4()), f"ABC {i:04}", datetime.now()) for i in range(args.results)]
+    with tempfile.TemporaryDirectory() as directory:
+        # Original behavior: connection + insert + commit + close per result
+        per_result_database = os.path.join(directory, "per_result.sqlite")
+        SqliteResultStorage(per_result_database, 1).insert_many([])
+        start = time.perf_counter()
+        for record in records:
+            connection = sqlite3.connect(per_result_database)
+            connection.execute(f"insert into {TABLE_NAME} (id, license_plate, captured_at) values (?, ?, ?)", (record.car_id, record.license_plate, record.captured_at.isoformat(" ")))
+            connection.commit()
+            connection.close()
+        per_result_elapsed = time.perf_counter() - start
+
+        writer = ResultWriter(SqliteResultStorage(os.path.join(directory, "writer.sqlite"), 1), None, os.path.join(directory, "spill.jsonl"), args.results, args.batch_size, 10)
+        writer.start()
+        start = time.perf_counter()
+        for record in records:
+            writer.submit(record)
+        writer.flush()
+        writer_elapsed = time.perf_counter() - start
+
+    print(f"{args.results} results")
+    print(f"per-result connection: {per_result_elapsed * 1000:>9.1f} ms ({per_result_elapsed / args.results * 1000:.3f} ms per result)")
+    print(f"ResultWriter:          {writer_elapsed * 1000:>9.1f} ms ({writer_elapsed / args.results * 1000:.3f} ms per result, {writer.get_stats()['batches']} batches)")
+    print(f"speedup: {per_result_elapsed / writer_elapsed:.1f}x")
+
+def _pillow_jpeg(image: Image, quality: int) -> bytes:
+    with io.BytesIO() as bytes_io:
+        image.save(bytes_io, format="JPEG", quality=quality)
+        return bytes_io.getvalue()
+
+def benchmark_jpeg(args):
+    car_image = cv2.imread(args.car_image)
+    height, width = car_image.shape[:2]
+    license_plate_image = cv2.cvtColor(car_image[height * 2 // 3:height * 5 // 6, width // 3:width * 2 // 3], cv2.COLOR_BGR2GRAY)
+
+    # Original behavior: both crops (PIL images) encoded for the websocket and once more when saved into RESULTS_PATH
+    pil_images = [Image.fromarray(cv2.cvtColor(car_image, cv2.COLOR_BGR2RGB)), Image.fromarray(license_plate_image)]
+    encode_twice = lambda: [_pillow_jpeg(image, args.quality) for image in pil_images + pil_images]
+    twice_mean, twice_p95 = _measure(encode_twice, args.repeats)
+    print(f"{'encoder':>24} | {'mean':>10} | {'p95':>10} | {'saved per result':>16} | {'bytes':>7}")
+    print(f"{'pillow, encoded twice':>24} | {twice_mean:>7.2f} ms | {twice_p95:>7.2f} ms | {'':>16} | {sum(len(image) for image in encode_twice()[:2]):>7}")
+    for name in args.encoders:
+        try:
+            encoder = create_jpeg_encoder(name, args.quality)
+        except RuntimeError as e:
+            print(f"Skipping \"{name}\": {e}")
+            continue
+        encode_once = lambda: [encoder.encode(image) for image in [car_image, license_plate_image]]
+        once_mean, once_p95 = _measure(encode_once, args.repeats)
+        print(f"{name + ', encoded once':>24} | {once_mean:>7.2f} ms | {once_p95:>7.2f} ms | {twice_mean - once_mean:>13.2f} ms | {sum(len(image) for image in encode_once()):>7}")
+
+# Segmentation as it was before the pipeline went numpy-native (frame => RGB => PIL => crop => "L" => resize => numpy => BGR => HSV => V),
+# kept here only as the reference the numpy path gets checked against
+def _legacy_segment_license_plate(box: any, car_image: Image, width_boost: int, additional_white_spacing_each_side: int) -> (np.ndarray, list[Image]):
+    from skimage.filters import threshold_local
+    import imutils
+    x_min, y_min, x_max, y_max = box.xyxy.cpu().detach().numpy()[0]
+    boost_multiplier = width_boost / (x_max - x_min)
+    license_plate_cropped_img = car_image.crop((x_min, y_min, x_max, y_max)).convert("L").resize([int((x_max - x_min) * boost_multiplier), int((y_max - y_min) * boost_multiplier)])
+    plate_img = cv2.GaussianBlur(cv2.cvtColor(np.array(license_plate_cropped_img), cv2.COLOR_GRAY2BGR), (11,11), 0)
+    V = cv2.split(cv2.cvtColor(plate_img, cv2.COLOR_BGR2HSV))[2]
+    T = threshold_local(V, 99, offset=5, method='gaussian')
+    thresh = cv2.bitwise_not((V > T).astype('uint8') * 255)
+    plate_img = imutils.resize(plate_img, width=width_boost)
+    thresh = imutils.resize(thresh, width=width_boost)
+    iwl_wb = cv2.bitwise_not(cv2.morphologyEx(thresh, cv2.MORPH_DILATE, np.ones((3, 3), np.uint8)))
+    iwl_wb_pil = Image.fromarray(iwl_wb, mode="L")
+    letter_images = []
+    for (x, y, w, h) in utils.get_letter_rectangles_from_contours(iwl_wb):
+        letter_box_cropped_img = iwl_wb_pil.crop((x, y, x + w, y + h))
+        new_letter_box_img = Image.new("L", (letter_box_cropped_img.width + additional_white_spacing_each_side * 2, letter_box_cropped_img.height + additional_white_spacing_each_side * 2), "white")
+        new_letter_box_img.paste(letter_box_cropped_img, (additional_white_spacing_each_side, additional_white_spacing_each_side))
+        letter_images.append(new_letter_box_img)
+    return (iwl_wb, letter_images)
+
+def _binarized_license_plate(box: any, car_image: np.ndarray, width_boost: int) -> np.ndarray:
+    x_min, y_min, x_max, y_max = box.xyxy.cpu().detach().numpy()[0]
+    boost_multiplier = width_boost / (x_max - x_min)
+    license_plate_cropped_img = cv2.resize(cv2.cvtColor(utils.crop_box(car_image, (x_min, y_min, x_max, y_max)), cv2.COLOR_BGR2GRAY), (int((x_max - x_min) * boost_multiplier), int((y_max - y_min) * boost_multiplier)), interpolation=cv2.INTER_CUBIC)
+    return cv2.bitwise_not(utils.clean_plate_into_contours(license_plate_cropped_img, width_boost))
+
+# Returns (peak of memory allocated by numpy/opencv during the call, number of PIL images created), PIL allocates outside of python's allocator, so tracemalloc can't see its memory
+def _measure_allocations(function) -> (int, int):
+    pil_images_created_before = Image.core.get_stats()["new_count"]
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (peak, Image.core.get_stats()["new_count"] - pil_images_created_before)
+
+def benchmark_preprocess(args):
+    license_plate_model = YOLO(args.license_plate_model)
+    license_plates = [] # [(np.ndarray, Image, box)] => array of (car image, car image as PIL image, license plate box)
+    for car_image_path in args.car_images:
+        car_image = cv2.imread(car_image_path)
+        _, license_plates_as_boxes = utils.detect_with_yolo(license_plate_model, car_image, False)
+        license_plates.extend((car_image, Image.fromarray(cv2.cvtColor(car_image, cv2.COLOR_BGR2RGB)), box) for box in license_plates_as_boxes)
+    if len(license_plates) == 0:
+        print("Didn't find any license plates.")
+        sys.exit(1)
+
+    # defaults from .env.development
+    legacy_segmentation = lambda car_image, car_image_pil, box: _legacy_segment_license_plate(box, car_image_pil, 500, 20)
+    numpy_segmentation = lambda car_image, car_image_pil, box: utils.segment_license_plate("", box, car_image, 500, 20, False, False, 0)
+
+    all_passed = True
+    print(f"{'plate':>5} | {'different pixels':>16} | {'letters (PIL / numpy)':>21} | check")
+    for i, (car_image, car_image_pil, box) in enumerate(license_plates):
+        legacy_binarized, legacy_letter_images = _legacy_segment_license_plate(box, car_image_pil, 500, 20)
+        binarized = _binarized_license_plate(box, car_image, 500)
+        _, letter_images = utils.segment_license_plate(i, box, car_image, 500, 20, False, False, 0)
+        different_pixels = np.count_nonzero(legacy_binarized != binarized) / legacy_binarized.size if legacy_binarized.shape == binarized.shape else 1
+        passed = different_pixels <= args.max_different_pixels
+        all_passed = all_passed and passed
+        print(f"{i:>5} | {different_pixels * 100:>15.2f}% | {len(legacy_letter_images):>10} / {len(letter_images):<8} | {'ok' if passed else 'FAILED'}")
+
+    number_of_plates = len(license_plates)
+    print(f"{'path':>6} | {'per-plate mean':>14} | {'per-plate p95':>13} | {'numpy peak memory':>17} | {'PIL images':>10}")
+    for name, segmentation in [("PIL", legacy_segmentation), ("numpy", numpy_segmentation)]:
+        segment_all = lambda: [segmentation(*license_plate) for license_plate in license_plates]
+        segment_all() # warm-up
+        mean, p95 = _measure(segment_all, args.repeats)
+        allocations = [_measure_allocations(lambda: segmentation(*license_plate)) for license_plate in license_plates]
+        peak = sum(peak for peak, _ in allocations) / number_of_plates
+        pil_images = sum(pil_images for _, pil_images in allocations) / number_of_plates
+        print(f"{name:>6} | {mean / number_of_plates:>11.2f} ms | {p95 / number_of_plates:>10.2f} ms | {peak / 1024:>14.0f} KB | {pil_images:>10.1f}")
+    if all_passed is False:
+        sys.exit(1)
+
+class _FakeBox:
+    def __init__(self, x_min: float, y_min: float, x_max: float, y_max: float):
+        self.xyxy = torch.tensor([[x_min, y_min, x_max, y_max]], dtype=torch.float32)
+
+# Returns (car image, license plate box, text) of a dark-on-light license plate, width pixels wide
+def _generate_license_plate(rng: random.Random, np_rng: np.random.Generator, width: int) -> (np.ndarray, _FakeBox, str):
+    text = _random_license_plate(rng).replace(" ", "")
+    license_plate = np.full((110, 520, 3), 235, dtype=np.uint8)
+    cv2.rectangle(license_plate, (3, 3), (516, 106), (20, 20, 20), 3)
+    cv2.putText(license_plate, text, (30, 85), cv2.FONT_HERSHEY_SIMPLEX, 2.4 * 7 / max(len(text), 7), (15, 15, 15), 7, cv2.LINE_AA)
+    lighting = np.linspace(rng.uniform(0.6, 1), rng.uniform(0.6, 1), 520)[None, :, None]
+    height = int(width * 110 / 520)
+    license_plate = cv2.resize((license_plate * lighting).astype(np.uint8), (width, height), interpolation=cv2.INTER_AREA)
+    license_plate = np.clip(license_plate + np_rng.normal(0, rng.uniform(2, 8), license_plate.shape), 0, 255).astype(np.uint8)
+    car_image = np.full((height + 40, width + 40, 3), 90, dtype=np.uint8)
+    car_image[20:20 + height, 20:20 + width] = license_plate
+    return (car_image, _FakeBox(20, 20, 20 + width, 20 + height), text)
+
+def _box_iou(a: list[float], b: list[float]) -> float:
+    intersection = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])) * max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    return intersection / (a[2] * a[3] + b[2] * b[3] - intersection)
+
+# Letter rectangles of license plate, scaled into the coordinates of the license plate box, so both modes can be compared
+def _letter_rectangles(box: any, car_image: np.ndarray, segmentation_mode: str) -> list[list[float]]:
+    x_min, y_min, x_max, y_max = box.xyxy.cpu().detach().numpy()[0]
+    working_width = min(500, max(x_max - x_min, utils.FAST_SEGMENTATION_MIN_WIDTH)) if segmentation_mode == utils.SEGMENTATION_MODE_FAST else 500
+    boost_multiplier = working_width / (x_max - x_min)
+    license_plate_image = cv2.resize(cv2.cvtColor(utils.crop_box(car_image, (x_min, y_min, x_max, y_max)), cv2.COLOR_BGR2GRAY), (int((x_max - x_min) * boost_multiplier), int((y_max - y_min) * boost_multiplier)), interpolation=cv2.INTER_CUBIC)
+    clean = utils.clean_plate_into_contours_fast if segmentation_mode == utils.SEGMENTATION_MODE_FAST else utils.clean_plate_into_contours
+    iwl_wb = cv2.bitwise_not(clean(license_plate_image, 500))
+    scale = (x_max - x_min) / iwl_wb.shape[1]
+    return [[value * scale for value in rectangle] for rectangle in utils.get_letter_rectangles_from_contours(iwl_wb)]
+
+# Letter candidate filtering as it was before vectorizing, kept here only to check and measure against
+def _legacy_filter_letter_rectangles(rectangles: list[list[int]], height: int, width: int) -> list[list[int]]:
+    rectangles = [[x, y, w, h] for x, y, w, h in rectangles if not (h < (height / 5) or w > (width / 5))]
+    final_rect = [[x, y, w, h] for x, y, w, h in rectangles if not any(x > x2 and y > y2 and x + w < x2 + w2 and y + h < y2 + h2 for x2, y2, w2, h2 in rectangles)]
+    return sorted(final_rect)
+
+def benchmark_segmentation(args):
+    license_plates = [] # [(np.ndarray, box, str)] => array of (car image, license plate box, text if known)
+    if args.license_plate_model is not None:
+        license_plate_model = YOLO(args.license_plate_model)
+        for car_image_path in args.car_images:
+            car_image = cv2.imread(car_image_path)
+            _, license_plates_as_boxes = utils.detect_with_yolo(license_plate_model, car_image, False)
+            license_plates.extend((car_image, box, None) for box in license_plates_as_boxes)
+    rng = random.Random(args.seed)
+    np_rng = np.random.default_rng(args.seed)
+    license_plates.extend(_generate_license_plate(rng, np_rng, width) for width in np.linspace(60, 400, args.synthetic).astype(int))
+    if len(license_plates) == 0:
+        print("No license plates to segment, pass --license-plate-model with --car-images, or --synthetic.")
+        sys.exit(1)
+    ocr_backend = ocr_backends.create_ocr_backend(args.ocr_backend) if args.ocr_backend is not None else None
+
+    # Accuracy, fast mode against accurate mode, and against the text (if known)
+    same_number_of_letters = 0
+    letters_matched = 0
+    letters_total = 0
+    correct_number_of_letters = {utils.SEGMENTATION_MODE_ACCURATE: 0, utils.SEGMENTATION_MODE_FAST: 0}
+    same_ocr_results = 0
+    number_of_known_texts = sum(text is not None for _, _, text in license_plates)
+    for i, (car_image, box, text) in enumerate(license_plates):
+        accurate_rectangles = _letter_rectangles(box, car_image, utils.SEGMENTATION_MODE_ACCURATE)
+        fast_rectangles = _letter_rectangles(box, car_image, utils.SEGMENTATION_MODE_FAST)
+        same_number_of_letters += len(accurate_rectangles) == len(fast_rectangles)
+        letters_matched += sum(any(_box_iou(a, b) >= 0.5 for b in fast_rectangles) for a in accurate_rectangles)
+        letters_total += len(accurate_rectangles)
+        letter_images = {}
+        for segmentation_mode in correct_number_of_letters.keys():
+            _, letter_images[segmentation_mode] = utils.segment_license_plate(i, box, car_image, 500, 20, False, False, 0, segmentation_mode)
+            correct_number_of_letters[segmentation_mode] += text is not None and len(letter_images[segmentation_mode]) == len(text)
+        if ocr_backend is not None:
+            ocr_results = utils.read_letters_of_license_plates(ocr_backend, list(letter_images.values()), False)
+            same_ocr_results += ocr_results[0] == ocr_results[1]
+
+    number_of_plates = len(license_plates)
+    print(f"{number_of_plates} license plates")
+    print(f"fast finds the same number of letters as accurate: {same_number_of_letters / number_of_plates * 100:.1f}% of plates, {letters_matched / max(letters_total, 1) * 100:.1f}% of accurate's letters found (IoU >= 0.5)")
+    if number_of_known_texts > 0:
+        for segmentation_mode, correct in correct_number_of_letters.items():
+            print(f"{segmentation_mode:>8} finds exactly as many letters as the text has: {correct / number_of_known_texts * 100:.1f}% of generated plates")
+    if ocr_backend is not None:
+        print(f"same OCR result: {same_ocr_results / number_of_plates * 100:.1f}% of plates")
+        ocr_backend.close()
+
+    # Speed
+    print(f"{'':>22} | {'per-plate mean':>14} | {'per-plate p95':>13}")
+    for segmentation_mode in correct_number_of_letters.keys():
+        mean, p95 = _measure(lambda: [utils.segment_license_plate(i, box, car_image, 500, 20, False, False, 0, segmentation_mode) for i, (car_image, box, _) in enumerate(license_plates)], args.repeats)
+        print(f"{segmentation_mode + ' segmentation':>22} | {mean / number_of_plates:>11.2f} ms | {p95 / number_of_plates:>10.2f} ms")
+
+    # Filtering of letter candidates, clean license plates have ~10 candidates, noisy ones can have hundreds
+    print(f"{'candidates':>10} | {'original filtering':>18} | {'vectorized filtering':>20} | same result")
+    for number_of_candidates in [10, 30, 100, 300]:
+        rectangles = [[rng.randint(0, 500), rng.randint(0, 120), rng.randint(5, 100), rng.randint(20, 120)] for _ in range(number_of_candidates)]
+        rectangles_as_array = np.array(rectangles, dtype=np.int32)
+        original_mean, _ = _measure(lambda: _legacy_filter_letter_rectangles(rectangles, 120, 500), args.repeats * 10)
+        vectorized_mean, _ = _measure(lambda: utils.filter_letter_rectangles(rectangles_as_array, 120, 500), args.repeats * 10)
+        same_result = _legacy_filter_letter_rectangles(rectangles, 120, 500) == utils.filter_letter_rectangles(rectangles_as_array, 120, 500)
+        print(f"{number_of_candidates:>10} | {original_mean:>15.3f} ms | {vectorized_mean:>17.3f} ms | {same_result}")
+
+# (CPU seconds, wall seconds, frames grabbed, frames decoded)
+def _run_capture(video: str, number_of_frames: int, retrieve_every: int) -> (float, float, int, int):
+    capture = cv2.VideoCapture(video)
+    frames_grabbed = 0
+    frames_decoded = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    while capture.isOpened() and frames_grabbed < number_of_frames:
+        if retrieve_every is None:
+            able_to_read_frame, _ = capture.read()
+            frames_decoded += able_to_read_frame
+        else:
+            able_to_read_frame = capture.grab()
+            if able_to_read_frame and frames_grabbed % retrieve_every == 0:
+                frames_decoded += capture.retrieve()[0]
+        if able_to_read_frame is False:
+            break
+        frames_grabbed += 1
+    cpu_elapsed = time.process_time() - cpu_start
+    wall_elapsed = time.perf_counter() - wall_start
+    capture.release()
+    return (cpu_elapsed, wall_elapsed, frames_grabbed, frames_decoded)
+
+def benchmark_capture(args):
+    print(f"{'mode':>16} | {'CPU per frame':>13} | {'wall per frame':>14} | {'decoded':>7}")
+    for mode, retrieve_every in [("read", None)] + [(f"grab, 1/{n}", n) for n in args.retrieve_every]:
+        cpu_elapsed, wall_elapsed, frames_grabbed, frames_decoded = _run_capture(args.video, args.frames, retrieve_every)
+        if frames_grabbed == 0:
+            print("Unable to read any frames from the video.")
+            sys.exit(1)
+        print(f"{mode:>16} | {cpu_elapsed / frames_grabbed * 1000:>10.2f} ms | {wall_elapsed / frames_grabbed * 1000:>11.2f} ms | {frames_decoded:>7}")
+
+# Runs in its own process, so memory (peak RSS) of every setup is measured separately.
+# Puts (seconds spent detecting, peak RSS in MB) into results
+def _run_cameras_worker(pure_yolo_model_path: str, video: str, number_of_frames: int, number_of_cameras: int, barrier: any, results: any):
+    pure_yolo_model = YOLO(pure_yolo_model_path)
+    frames = _read_video_frames(video, number_of_frames)
+    utils.detect_with_yolo_batched(pure_yolo_model, [frames[0]] * number_of_cameras, False, number_of_cameras) # warm-up
+    barrier.wait() # all cameras start at the same time
+    start = time.perf_counter()
+    for frame in frames:
+        utils.detect_with_yolo_batched(pure_yolo_model, [frame] * number_of_cameras, False, number_of_cameras)
+    results.put((time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+def benchmark_cameras(args):
+    number_of_frames = len(_read_video_frames(args.video, args.frames))
+    if number_of_frames == 0:
+        print("Unable to read any frames from the video.")
+        sys.exit(1)
+    context = multiprocessing.get_context("spawn")
+    print(f"{'setup':>34} | {'total fps':>9} | {'per-frame latency':>17} | {'peak memory':>11}")
+    for setup, number_of_processes, number_of_cameras_per_process in [("process per camera", args.cameras, 1), ("shared model, batched", 1, args.cameras)]:
+        barrier = context.Barrier(number_of_processes)
+        results = context.Queue()
+        processes = [context.Process(target=_run_cameras_worker, args=(args.pure_yolo_model, args.video, number_of_frames, number_of_cameras_per_process, barrier, results)) for _ in range(number_of_processes)]
+        for process in processes:
+            process.start()
+        elapsed_and_memory = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = max(process_elapsed for process_elapsed, _ in elapsed_and_memory)
+        memory = sum(process_memory for _, process_memory in elapsed_and_memory)
+        print(f"{setup + f' ({args.cameras} cameras)':>34} | {number_of_frames * args.cameras / elapsed:>9.2f} | {elapsed / number_of_frames * 1000:>14.1f} ms | {memory:>8.0f} MB")
+
+def benchmark_metrics(args):
+    print(f"{'instrumentation':>24} | {'disabled':>11} | {'enabled':>11}")
+    per_call_ns = {}
+    for enabled in [False, True]:
+        registry = MetricsRegistry(enabled)
+        stage_timings = StageTimings(histogram=registry.histogram("stage_duration_seconds", "", ["stage"]) if enabled else None)
+        counter = registry.counter("cars_skipped_total", "", ["camera", "reason"])
+        def measure_stage():
+            with stage_timings.measure(STAGE_OCR):
+                pass
+        for name, function in [
+            ("empty call", lambda: None),
+            ("stage timer", measure_stage),
+            ("counter", lambda: counter.inc(label_values=("camera_1", "too_far"))),
+        ]:
+            start = time.perf_counter()
+            for _ in range(args.calls):
+                function()
+            per_call_ns[(name, enabled)] = (time.perf_counter() - start) / args.calls * 1e9
+    for name in ["empty call", "stage timer", "counter"]:
+        print(f"{name:>24} | {per_call_ns[(name, False)]:>8.0f} ns | {per_call_ns[(name, True)]:>8.0f} ns")
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".bmp"]
+
+# Same license plate as seen on the next frame of a car standing in front of the camera
+def _next_frame_of_license_plate(rng: random.Random, np_rng: np.random.Generator, car_image: np.ndarray, box: _FakeBox) -> (np.ndarray, _FakeBox):
+    x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
+    car_image = np.clip(car_image * rng.uniform(0.9, 1.1) + np_rng.normal(0, rng.uniform(1, 4), car_image.shape), 0, 255).astype(np.uint8)
+    jitter = lambda: rng.uniform(-0.5, 0.5)
+    return (car_image, _FakeBox(x_min + jitter(), y_min + jitter(), x_max + jitter(), y_max + jitter()))
+
+def benchmark_ocr_cache(args):
+    rng = random.Random(args.seed)
+    np_rng = np.random.default_rng(args.seed)
+    frames = [] # [(np.ndarray, box, int)] => array of (car image, license plate box, index of the car), cars one after another
+    for k in range(args.plates):
+        car_image, box, _ = _generate_license_plate(rng, np_rng, rng.randint(100, 300))
+        frames.extend((*_next_frame_of_license_plate(rng, np_rng, car_image, box), k) for _ in range(args.frames))
+    ocr_backend = ocr_backends.create_ocr_backend(args.ocr_backend) if args.ocr_backend is not None else None
+
+    # Without an OCR backend, index of the car stands in for the license plate as string, so wrong hits (license plate of another car) can be counted
+    def read(i: int, car_image: np.ndarray, box: _FakeBox, k: int) -> str:
+        license_plate_image = utils.crop_license_plate(i, box, car_image, 500, False, False)
+        letter_images = utils.segment_cropped_license_plate(i, license_plate_image, 500, 20, False, 0)
+        return utils.read_letters_of_license_plates(ocr_backend, [letter_images], False)[0] if ocr_backend is not None else str(k)
+
+    started_at = time.perf_counter()
+    uncached_results = [read(i, car_image, box, k) for i, (car_image, box, k) in enumerate(frames)]
+    uncached_ms = (time.perf_counter() - started_at) * 1000 / len(frames)
+    print(f"{len(frames)} license plate images of {args.plates} cars, {args.frames} frames each")
+    print(f"{'max distance':>12} | {'hit rate':>8} | {'wrong hits':>10} | {'per-plate mean':>14} | {'lookup mean':>11}")
+    print(f"{'no cache':>12} | {'-':>8} | {'-':>10} | {uncached_ms:>11.2f} ms | {'-':>11}")
+    for max_distance in args.max_distances:
+        license_plate_cache = LicensePlateReadCache(256, 10, max_distance)
+        wrong_hits = 0
+        lookup_seconds = 0
+        started_at = time.perf_counter()
+        for i, ((car_image, box, k), uncached_result) in enumerate(zip(frames, uncached_results)):
+            license_plate_image = utils.crop_license_plate(i, box, car_image, 500, False, False)
+            lookup_started_at = time.perf_counter()
+            license_plate_hash = compute_license_plate_hash(license_plate_image)
+            cached_result = license_plate_cache.get(license_plate_hash, i)
+            lookup_seconds += time.perf_counter() - lookup_started_at
+            if cached_result is None:
+                license_plate_cache.put(license_plate_hash, read(i, car_image, box, k), i)
+            else:
+                wrong_hits += cached_result != uncached_result
+        cached_ms = (time.perf_counter() - started_at) * 1000 / len(frames)
+        stats = license_plate_cache.get_stats()
+        print(f"{max_distance:>12} | {stats['hit_rate'] * 100:>7.1f}% | {wrong_hits:>10} | {cached_ms:>11.2f} ms | {lookup_seconds * 1000 / len(frames):>8.3f} ms")
+    if ocr_backend is not None:
+        ocr_backend.close()
+
+# Validation as it was, every recognition keeps its car image (view into the frame) and license plate image until the window closes
+def _legacy_validate_results_between_rounds(recognitions_between_rounds: list[list[(np.ndarray, np.ndarray, str)]], number_of_occurrences_to_be_valid: int) -> [(np.ndarray, np.ndarray, str)]:
+    license_plate_counts = {}
+    for recognitions in recognitions_between_rounds:
+        for _, _, license_plate_as_string in recognitions:
+            license_plate_counts[license_plate_as_string] = license_plate_counts.get(license_plate_as_string, 0) + 1
+    validated_recognitions = []
+    for license_plate, times_found in license_plate_counts.items():
+        if times_found >= number_of_occurrences_to_be_valid:
+            validated_recognitions.append(next(recognition for recognitions in recognitions_between_rounds for recognition in recognitions if recognition[2] == license_plate))
+    return validated_recognitions
+
+# Same as validate_results_between_rounds + materialize_recognition of server.py
+def _validate_recognition_rounds(recognition_rounds: RecognitionRounds, number_of_occurrences_to_be_valid: int) -> [(np.ndarray, np.ndarray, str)]:
+    validated_recognitions = [recognition_rounds.best_recognitions[license_plate] for license_plate, times_found in recognition_rounds.count_license_plates().items() if times_found >= number_of_occurrences_to_be_valid]
+    return [(recognition.car_image, utils.crop_license_plate_box(recognition.license_plate_box, recognition.car_image, 500, False), recognition.license_plate) for recognition in validated_recognitions]
+
+def benchmark_validation_memory(args):
+    rng = random.Random(args.seed)
+    np_rng = np.random.default_rng(args.seed)
+    # Cars queue at the gate in a row, every car is replaced by a new one once in a while
+    car_width, car_height = args.width // (args.cars + 1), args.height // 3
+    cars = [[*_generate_license_plate(rng, np_rng, rng.randint(120, 300)), 0] for _ in range(args.cars)] # [[license plate image, box, text, frames left]]
+    frames = [] # [[(int, int, str)]] => cars of every frame as (x of the car, y of the car, license plate as read by OCR)
+    for _ in range(args.frames):
+        cars_of_frame = []
+        for k, car in enumerate(cars):
+            if car[3] == 0:
+                car[:] = [*_generate_license_plate(rng, np_rng, rng.randint(120, 300)), rng.randint(10, 40)]
+            car[3] -= 1
+            license_plate = car[2] if rng.random() >= args.misread_ratio else _random_license_plate(rng).replace(" ", "")
+            cars_of_frame.append((k * car_width + car_width // 2, args.height // 2 + rng.randint(-20, 20), license_plate))
+        frames.append(cars_of_frame)
+
+    def replay(compact: bool) -> dict:
+        recognitions_between_rounds = RecognitionRounds() if compact else []
+        results = []
+        retained_bytes = []
+        tracemalloc.start()
+        started_at = time.perf_counter()
+        for cars_of_frame in frames:
+            # A new frame for every round, as FrameRingBuffer.take_latest returns
+            frame = np.full((args.height, args.width, 3), 90, dtype=np.uint8)
+            recognitions = []
+            for (x, y, license_plate), (license_plate_image, box, _, _) in zip(cars_of_frame, cars):
+                car_image = frame[y:y + car_height, x:x + car_width]
+                car_image[:license_plate_image.shape[0], :license_plate_image.shape[1]] = license_plate_image[:car_height, :car_width]
+                license_plate_box = utils.get_box_coordinates(box)
+                cropped_license_plate = utils.crop_license_plate_box(license_plate_box, car_image, 500, False)
+                if compact:
+                    recognitions.append(Recognition(license_plate, car_image, license_plate_box, compute_sharpness(cropped_license_plate)))
+                else:
+                    recognitions.append((car_image, cropped_license_plate, license_plate))
+            del frame, car_image, cropped_license_plate
+
+            recognitions_between_rounds.append(recognitions)
+            del recognitions
+            if len(recognitions_between_rounds) == args.rounds:
+                validated_results = _validate_recognition_rounds(recognitions_between_rounds, args.occurrences) if compact else _legacy_validate_results_between_rounds(recognitions_between_rounds, args.occurrences)
+                if len(validated_results) == 0:
+                    if compact:
+                        recognitions_between_rounds.pop_oldest()
+                    else:
+                        recognitions_between_rounds.pop(0)
+                else:
+                    results.extend(license_plate for _, _, license_plate in validated_results)
+                    recognitions_between_rounds = RecognitionRounds() if compact else []
+                del validated_results
+            retained_bytes.append(tracemalloc.get_traced_memory()[0])
+        elapsed = time.perf_counter() - started_at
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"results": results, "retained_mean": np.mean(retained_bytes), "retained_max": max(retained_bytes), "peak": peak, "ms_per_frame": elapsed * 1000 / len(frames)}
+
+    print(f"{args.frames} frames of {args.width}x{args.height} with {args.cars} cars each, {args.misread_ratio * 100:.0f} % misreads, {args.occurrences} of {args.rounds} rounds to be valid")
+    print(f"{'recognitions':>12} | {'retained mean':>13} | {'retained max':>12} | {'peak':>10} | {'per frame':>10} | {'results':>7}")
+    reports = {}
+    for name, compact in [("tuples", False), ("compact", True)]:
+        report = reports[name] = replay(compact)
+        print(f"{name:>12} | {report['retained_mean'] / 2 ** 20:>10.1f} MB | {report['retained_max'] / 2 ** 20:>9.1f} MB | {report['peak'] / 2 ** 20:>7.1f} MB | {report['ms_per_frame']:>7.1f} ms | {len(report['results']):>7}")
+    if sorted(reports["tuples"]["results"]) != sorted(reports["compact"]["results"]):
+        print("Validated license plates differ!")
+        sys.exit(1)
+
+# Returns (frames, fps of the source), frames are read one by one, so long videos don't have to fit into memory
+def _open_replay_source(source: str, number_of_frames: int, fps: float) -> (any, float):
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(source, name) for name in os.listdir(source) if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+        frames = (cv2.imread(path) for path in paths[:number_of_frames])
+        return (frames, fps or 10)
+
+    capture = cv2.VideoCapture(source)
+    def read_frames():
+        number_of_frames_read = 0
+        while capture.isOpened() and (number_of_frames is None or number_of_frames_read < number_of_frames):
+            able_to_read_frame, frame = capture.read()
+            if able_to_read_frame is False:
+                break
+            number_of_frames_read += 1
+            yield frame
+        capture.release()
+    return (read_frames(), fps or capture.get(cv2.CAP_PROP_FPS) or 10)
+
+def _normalize_license_plate(license_plate: str) -> str:
+    return license_plate.replace(" ", "").upper()
+
+# results => [{"frame": int, "license_plate": str}], every expected license plate can be matched by a single result (within its frames, if set)
+def _score_results(results: list[dict], ground_truth_path: str) -> dict:
+    with open(ground_truth_path, newline="") as ground_truth_file:
+        expected = list(csv.DictReader(ground_truth_file))
+    unmatched_results = list(results)
+    matched = 0
+    for row in expected:
+        first_frame = int(row["first_frame"]) if row.get("first_frame") else 0
+        last_frame = int(row["last_frame"]) if row.get("last_frame") else sys.maxsize
+        for result in unmatched_results:
+            if _normalize_license_plate(result["license_plate"]) == _normalize_license_plate(row["license_plate"]) and first_frame <= result["frame"] <= last_frame:
+                unmatched_results.remove(result)
+                matched += 1
+                break
+    return {
+        "expected": len(expected),
+        "found": len(results),
+        "matched": matched,
+        "precision": matched / len(results) if len(results) > 0 else 0.0,
+        "recall": matched / len(expected) if len(expected) > 0 else 0.0,
+    }
+
+# Runs the same functions as the pipeline threads of server.py, just sequentially, so every frame gets processed (nothing is dropped),
+# and with time of the frame in the video instead of the wall clock. The same source and configuration always gives the same results.
+def benchmark_replay(args):
+    # Variables already in the environment win over the env file, so these can't be turned on by it
+    os.environ.update({
+        "RTSP_CAPTURE_CONFIG": args.source,
+        "DEBUG": "False",
+        "DB_ENABLED": "False",
+        "SAVE_RESULTS_ENABLED": "False",
+        "PIPELINE_WORKER_PROCESSES": "0",
+        "METRICS_ENABLED": "False",
+    })
+    load_dotenv(args.env_file)
+    server = importlib.import_module("server")
+    camera = server.CAMERAS[0]
+    stage_timings = server.STAGE_TIMINGS
+
+    frames, fps = _open_replay_source(args.source, args.frames, args.fps)
+    first_frame = next(frames, None)
+    if first_frame is None:
+        print("Unable to read any frames from the source.")
+        sys.exit(1)
+    # warm-up, first predict() of every model is a lot slower
+    server.find_cars_in_frames([(camera, first_frame)])
+    utils.detect_with_yolo(server.LICENSE_PLATE_YOLO_MODEL, first_frame, False)
+    stage_timings.enabled = True
+
+    results = [] # [{"frame": int, "license_plate": str}]
+    validation_votes = {"total": 0, "from_ocr_cache": 0} # license plates read, which went into validation
+    number_of_frames = 0
+    started_at = time.perf_counter()
+    for frame_index, frame in enumerate(itertools.chain([first_frame], frames)):
+        now = frame_index / fps
+        frame_started_at = time.perf_counter()
+        number_of_frames += 1
+        if camera.motion_gate is not None and camera.motion_gate.should_run_inference(frame, now) is False:
+            stage_timings.record("frame", time.perf_counter() - frame_started_at)
+            continue
+        cars_to_read = server.detect_cars_from_frames([(camera, frame)], now)[0]
+        if len(cars_to_read) > 0:
+            license_plates_recognized = server.read_license_plates_of_cars([(camera, cars_to_read)], now)[0][1]
+            validation_votes["total"] += len(license_plates_recognized)
+            validation_votes["from_ocr_cache"] += sum(1 for recognition in license_plates_recognized if recognition.is_cached)
+            if len(license_plates_recognized) > 0:
+                for _, _, license_plate_as_string in server.select_results_to_send(camera, license_plates_recognized, now):
+                    results.append({"frame": frame_index, "license_plate": license_plate_as_string})
+        stage_timings.record("frame", time.perf_counter() - frame_started_at)
+    elapsed = time.perf_counter() - started_at
+
+    stages = stage_timings.get_summary()
+    report = {
+        "source": args.source,
+        "frames": number_of_frames,
+        "fps": number_of_frames / elapsed,
+        "stages": stages,
+        "validation_votes": validation_votes,
+        "results": results,
+    }
+    print(f"Replayed {number_of_frames} frames at {report['fps']:.2f} fps (frames are decoded in between, that's not part of any stage)")
+    print(f"{'stage':>24} | {'calls':>6} | {'mean':>10} | {'p50':>10} | {'p95':>10} | {'p99':>10}")
+    for stage, summary in stages.items():
+        print(f"{stage:>24} | {summary['calls']:>6} | {summary['mean_ms']:>7.1f} ms | {summary['p50_ms']:>7.1f} ms | {summary['p95_ms']:>7.1f} ms | {summary['p99_ms']:>7.1f} ms")
+    if server.OCR_CACHE is not None:
+        report["ocr_cache"] = server.OCR_CACHE.get_stats()
+        print(f"OCR cache: {report['ocr_cache']['hit_rate'] * 100:.1f}% hit rate ({report['ocr_cache']['hits']} hits, {report['ocr_cache']['misses']} misses)")
+        # Same as in the server, a cached read is a vote, even though it's only a repeat of an earlier read, so a single misread served from the cache
+        # can collect enough votes to be validated, accuracy with the cache and without it doesn't compare the same thing
+        print(f"Validation votes: {validation_votes['total']}, {validation_votes['from_ocr_cache']} of them served by the OCR cache (repeats of an earlier read, counted as votes like in the server, so accuracy isn't directly comparable with a run without the cache)")
+    results_as_text = [f"{result['license_plate']} (frame {result['frame']})" for result in results]
+    print(f"Results ({len(results)}): {', '.join(results_as_text)}")
+
+    if args.ground_truth is not None:
+        report["accuracy"] = _score_results(results, args.ground_truth)
+        accuracy = report["accuracy"]
+        print(f"Matched {accuracy['matched']} of {accuracy['expected']} expected license plates, precision {accuracy['precision']:.3f}, recall {accuracy['recall']:.3f}")
+
+    if args.report is not None:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        failures = []
+        if baseline["results"] != results:
+            failures.append(f"results differ from the baseline ({len(baseline['results'])} results in the baseline, {len(results)} now)")
+        if report["fps"] < baseline["fps"] * (1 - args.max_slowdown):
+            failures.append(f"{report['fps']:.2f} fps is more than {args.max_slowdown * 100:.0f} % below {baseline['fps']:.2f} fps of the baseline")
+        for failure in failures:
+            print(f"Regression: {failure}")
+        if len(failures) > 0:
+            sys.exit(1)
+        print("No regression against the baseline.")
+
+BENCHMARKS = {
+    "lp-batching": benchmark_lp_batching,
+    "ocr": benchmark_ocr,
+    "roi": benchmark_roi,
+    "dedup": benchmark_dedup,
+    "result-writer": benchmark_result_writer,
+    "jpeg": benchmark_jpeg,
+    "preprocess": benchmark_preprocess,
+    "segmentation": benchmark_segmentation,
+    "capture": benchmark_capture,
+    "cameras": benchmark_cameras,
+    "metrics": benchmark_metrics,
+    "ocr-cache": benchmark_ocr_cache,
+    "validation-memory": benchmark_validation_memory,
+    "replay": benchmark_replay,
+}
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
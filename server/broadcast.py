@@ -0,0 +1,192 @@
+import asyncio
+import collections
+import struct
+import time
+from datetime import datetime
+
+# Protocols a websocket client can receive results in:
+# - "legacy" => 3 messages per result (binary car image, binary license plate image, text "{license plate} => {uuid}"), this is what the client in `./client` expects
+# - "framed" => 1 binary message per result, see `encode_result_frame`
+LEGACY_PROTOCOL = "legacy"
+FRAMED_PROTOCOL = "framed"
+PROTOCOLS = [LEGACY_PROTOCOL, FRAMED_PROTOCOL]
+PROTOCOL_MESSAGE_PREFIX = "protocol:" # clients can switch protocol by sending eg. "protocol:framed"
+CATCH_UP_MESSAGE_PREFIX = "since:" # clients can get results they missed while disconnected by sending eg. "since:{uuid of the last result they got}", see `RecentResults.get_since`
+
+RESULT_FRAME_MAGIC = b"ALPR"
+RESULT_FRAME_VERSION = 1
+RESULT_FRAME_HEADER = struct.Struct(">4sBIII") # magic, version, car image length, license plate image length, text length
+
+# Single binary message: header + car image (JPEG) + license plate image (JPEG) + text (UTF-8)
+def encode_result_frame(car_image: bytes, license_plate_image: bytes, text: str) -> bytes:
+    encoded_text = text.encode("utf-8")
+    header = RESULT_FRAME_HEADER.pack(RESULT_FRAME_MAGIC, RESULT_FRAME_VERSION, len(car_image), len(license_plate_image), len(encoded_text))
+    return b"".join([header, car_image, license_plate_image, encoded_text])
+
+# (car image, license plate image, text)
+def decode_result_frame(frame: bytes) -> (bytes, bytes, str):
+    magic, version, car_image_length, license_plate_image_length, text_length = RESULT_FRAME_HEADER.unpack_from(frame)
+    if magic != RESULT_FRAME_MAGIC or version != RESULT_FRAME_VERSION:
+        raise ValueError("Not a result frame, or unsupported version.")
+    offset = RESULT_FRAME_HEADER.size
+    car_image = frame[offset:offset + car_image_length]
+    offset += car_image_length
+    license_plate_image = frame[offset:offset + license_plate_image_length]
+    offset += license_plate_image_length
+    return (car_image, license_plate_image, frame[offset:offset + text_length].decode("utf-8"))
+
+# Result encoded for every protocol, the encoding is done only once, no matter how many clients receive it
+# result_id => uuid of the result, created_at => unix timestamp (seconds), both are only used for catching up, see `RecentResults`
+class EncodedResult:
+    def __init__(self, car_image: bytes, license_plate_image: bytes, text: str, result_id: str = None, created_at: float = None):
+        self.legacy_messages = [car_image, license_plate_image, text]
+        self.framed_message = encode_result_frame(car_image, license_plate_image, text)
+        self.result_id = result_id
+        self.created_at = time.time() if created_at is None else created_at
+
+    def get_messages(self, protocol: str) -> list:
+        return [self.framed_message] if protocol == FRAMED_PROTOCOL else self.legacy_messages
+
+# Every connected client has its own bounded send queue and sender task, so a slow client only delays itself.
+# If a client can't keep up and its queue is full, the oldest result waiting for it is dropped.
+class BroadcastClient:
+    def __init__(self, websocket, protocol: str, queue_size: int):
+        self.websocket = websocket
+        self.protocol = protocol
+        self.queue = asyncio.Queue(maxsize=max(queue_size, 1))
+        self.results_dropped = 0
+        self.sender_task = None
+
+        self.last_sequence_number_at_register = 0 # results up to this one (see `RecentResults`) were broadcast before the client connected
+
+    # encoded_results => single result, or list of results sent in one burst (catching up), which takes only one place in the queue
+    def enqueue(self, encoded_results: any):
+        if self.queue.full():
+            dropped = self.queue.get_nowait()
+            self.results_dropped += len(dropped) if isinstance(dropped, list) else 1
+        self.queue.put_nowait(encoded_results)
+
+    # Results queued already (broadcast since the client connected) are sent after these, so the client gets everything in order
+    def enqueue_first(self, encoded_results: any):
+        queued = [self.queue.get_nowait() for _ in range(self.queue.qsize())]
+        for encoded_results in [encoded_results] + queued[1 if len(queued) == self.queue.maxsize else 0:]:
+            self.queue.put_nowait(encoded_results)
+        if len(queued) == self.queue.maxsize:
+            self.results_dropped += len(queued[0]) if isinstance(queued[0], list) else 1
+
+    async def run_sender(self, on_error):
+        while True:
+            encoded_results = await self.queue.get()
+            try:
+                for encoded_result in encoded_results if isinstance(encoded_results, list) else [encoded_results]:
+                    for message in encoded_result.get_messages(self.protocol):
+                        await self.websocket.send(message)
+            except Exception:
+                on_error(self)
+                return
+
+# Last results broadcast (already encoded, nothing gets read from the database), so a client which reconnects can get the ones it missed.
+# At most max_size results are kept, results older than max_age_seconds are dropped as well, max_size 0 => nothing is kept.
+class RecentResults:
+    def __init__(self, max_size: int, max_age_seconds: float):
+        self.max_age_seconds = max_age_seconds
+        self.results = collections.deque(maxlen=max(max_size, 0)) # [(int, EncodedResult)] => array of (sequence number, result), oldest first
+        self.last_sequence_number = 0
+
+    def _evict_expired(self, now: float):
+        while len(self.results) > 0 and now - self.results[0][1].created_at > self.max_age_seconds:
+            self.results.popleft()
+
+    def add(self, encoded_result: EncodedResult, now: float = None):
+        self.last_sequence_number += 1
+        self.results.append((self.last_sequence_number, encoded_result))
+        self._evict_expired(time.time() if now is None else now)
+
+    # since => uuid of the last result the client got, or time (unix timestamp in seconds, or ISO 8601 in server's local time) it was last connected
+    # Returns results broadcast after it, oldest first, up to (including) until_sequence_number.
+    # If the uuid isn't kept anymore (or is unknown), every kept result is returned, the client could've missed all of them.
+    def get_since(self, since: str, until_sequence_number: int, now: float = None) -> list[EncodedResult]:
+        self._evict_expired(time.time() if now is None else now)
+        since_sequence_number = next((sequence_number for sequence_number, encoded_result in self.results if encoded_result.result_id == since), None)
+        since_timestamp = parse_timestamp(since) if since_sequence_number is None else None
+        return [
+            encoded_result for sequence_number, encoded_result in self.results
+            if sequence_number <= until_sequence_number and (sequence_number > since_sequence_number if since_sequence_number is not None else since_timestamp is None or encoded_result.created_at > since_timestamp)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+# Returns unix timestamp (seconds), or None if it's neither a number nor ISO 8601
+def parse_timestamp(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+class ResultBroadcaster:
+    def __init__(self, default_protocol: str, client_queue_size: int, log = print, recent_results: RecentResults = None):
+        self.default_protocol = default_protocol if default_protocol in PROTOCOLS else LEGACY_PROTOCOL
+        self.client_queue_size = client_queue_size
+        self.clients = {} # websocket => BroadcastClient
+        self.log = log
+        self.recent_results = recent_results if recent_results is not None else RecentResults(0, 0)
+        self.catch_up_results_sent = 0
+
+    def register(self, websocket) -> BroadcastClient:
+        client = BroadcastClient(websocket, self.default_protocol, self.client_queue_size)
+        client.last_sequence_number_at_register = self.recent_results.last_sequence_number
+        client.sender_task = asyncio.ensure_future(client.run_sender(self._on_send_error))
+        self.clients[websocket] = client
+        return client
+
+    def unregister(self, websocket):
+        client = self.clients.pop(websocket, None)
+        if client is not None and client.sender_task is not None:
+            client.sender_task.cancel()
+
+    def _on_send_error(self, client: BroadcastClient):
+        self.log("Socket closed before or while the server was sending a response.")
+
+    # Returns True if the message was a protocol switch or a catch-up request
+    def handle_message(self, websocket, message) -> bool:
+        if isinstance(message, str) is False:
+            return False
+        client = self.clients.get(websocket)
+        if message.startswith(CATCH_UP_MESSAGE_PREFIX):
+            if client is not None:
+                self.catch_up(client, message[len(CATCH_UP_MESSAGE_PREFIX):].strip())
+            return True
+        if message.startswith(PROTOCOL_MESSAGE_PREFIX) is False:
+            return False
+        protocol = message[len(PROTOCOL_MESSAGE_PREFIX):].strip().lower()
+        if client is not None and protocol in PROTOCOLS:
+            client.protocol = protocol
+        return True
+
+    # Results the client missed go out in one burst. Results broadcast since the client connected aren't part of it, the client already has them in its queue (behind the burst).
+    def catch_up(self, client: BroadcastClient, since: str):
+        missed_results = self.recent_results.get_since(since, client.last_sequence_number_at_register)
+        self.log(f"Client caught up on {len(missed_results)} results since \"{since}\"")
+        if len(missed_results) > 0:
+            client.enqueue_first(missed_results)
+            self.catch_up_results_sent += len(missed_results)
+
+    # Never waits for any client
+    def broadcast(self, encoded_result: EncodedResult):
+        self.recent_results.add(encoded_result)
+        for client in list(self.clients.values()):
+            client.enqueue(encoded_result)
+
+    def get_stats(self) -> dict:
+        return {
+            "connected_clients": len(self.clients),
+            "queued_results": sum(client.queue.qsize() for client in self.clients.values()),
+            "results_dropped": sum(client.results_dropped for client in self.clients.values()),
+            "recent_results": len(self.recent_results),
+            "catch_up_results_sent": self.catch_up_results_sent,
+        }
@@ -0,0 +1,73 @@
+import numpy as np
+from frame_ring_buffer import FrameRingBuffer
+from motion_gate import MotionGate
+from detection_roi import DetectionRoi
+from car_tracker import CarTracker
+from sent_plates_history import SentLicensePlatesHistory
+from recognition import RecognitionRounds
+
+# Separator of per-camera values inside env variables (eg. `RTSP_CAPTURE_CONFIG="rtsp://...|rtsp://..."`),
+# `;` is already taken by DETECTION_ROI polygons.
+CAMERA_SEPARATOR = "|"
+
+# Splits per-camera value of an env variable, a single value is used for every camera
+def split_per_camera(value: str, number_of_cameras: int, name: str) -> list[str]:
+    values = [None] * number_of_cameras if value is None else [camera_value.strip() for camera_value in value.split(CAMERA_SEPARATOR)]
+    if len(values) == 1:
+        return values * number_of_cameras
+    if len(values) != number_of_cameras:
+        raise ValueError(f"{name} has {len(values)} values, but there are {number_of_cameras} cameras, separate them by \"{CAMERA_SEPARATOR}\", or use a single value for all cameras.")
+    return values
+
+# Results are tagged by camera only if there are multiple cameras, or they're named (otherwise results look exactly like before)
+# camera_names => value of CAMERA_NAMES, dotenv reads `CAMERA_NAMES=` as "", which means the same as not set
+def should_tag_results_by_camera(camera_names: str, number_of_cameras: int) -> bool:
+    return number_of_cameras > 1 or (camera_names or "").strip() != ""
+
+# Everything that belongs to a single video input.
+# Models, OCR engine and pipeline stages are shared by all cameras, while frames, motion, car tracks,
+# validation rounds and sent license plates are kept separately for every camera (the same car at the entry and at the exit are two results).
+class Camera:
+    def __init__(self, name: str, capture_config: str, frame_buffer: FrameRingBuffer, detection_roi: DetectionRoi, motion_gate: MotionGate, car_tracker: CarTracker, skip_before_y_max: float, sent_plates_history: SentLicensePlatesHistory):
+        self.name = name
+        self.capture_config = capture_config
+        self.frame_buffer = frame_buffer
+        self.detection_roi = detection_roi
+        self.motion_gate = motion_gate
+        self.car_tracker = car_tracker
+        self.skip_before_y_max = skip_before_y_max
+        self.sent_plates_history = sent_plates_history
+        self.recognitions_between_rounds = RecognitionRounds() # only used when car_tracker is None
+        self.last_frame_sequence_number = 0
+        self.last_frame_captured_at = 0 # time.monotonic() when the frame returned by take_new_frame was captured
+        self.capture_stats = {"grabbed": 0, "decoded": 0} # grabbed => frames read from the stream, decoded => frames converted to BGR and put into frame_buffer
+        self.frame_shape = None # shape of the last frame checked by check_frame_shape
+
+    # Regions of the camera are in pixels of the captured frame, so they can only be checked once the first frame is captured (and again when resolution of the stream changes)
+    # Raises ValueError if the motion gate region, or the detection ROI, doesn't fit into the frame
+    def check_frame_shape(self, frame_shape: tuple):
+        if frame_shape == self.frame_shape:
+            return
+        frame_height, frame_width = frame_shape[:2]
+        try:
+            if self.motion_gate is not None:
+                self.motion_gate.check_frame_size(frame_width, frame_height)
+            if self.detection_roi is not None:
+                self.detection_roi.fit_to_frame(frame_width, frame_height)
+        except ValueError as error:
+            raise ValueError(f"[{self.name}] {error}") from error
+        self.frame_shape = frame_shape
+
+    # Returns latest frame this camera captured, which wasn't taken yet, or None
+    def take_new_frame(self) -> np.ndarray:
+        buffered_frame = self.frame_buffer.take_latest(self.last_frame_sequence_number)
+        if buffered_frame is None:
+            return None
+        self.last_frame_sequence_number, self.last_frame_captured_at, frame = buffered_frame
+        return frame
+
+    def get_stats(self) -> dict:
+        stats = {"frame_buffer": self.frame_buffer.get_stats(), "capture": self.capture_stats}
+        if self.motion_gate is not None:
+            stats["motion_gate"] = self.motion_gate.get_stats()
+        return stats
@@ -0,0 +1,135 @@
+import itertools
+import threading
+import time
+import numpy as np
+from recognition import Recognition, keep_best_recognition
+
+class CarTrack:
+    def __init__(self, track_id: int, box: (float, float, float, float), now: float):
+        self.track_id = track_id
+        self.box = box # (x_min, y_min, x_max, y_max)
+        self.first_seen_at = now
+        self.last_seen_at = now
+        self.votes = {} # license plate as string => times read
+        self.recognitions = {} # license plate as string => best Recognition of it (see `keep_best_recognition`)
+        self.confirmed_license_plate = None
+
+    def get_leading_vote(self) -> (str, int, int):
+        total_votes = sum(self.votes.values())
+        if total_votes == 0:
+            return (None, 0, 0)
+        license_plate, votes = max(self.votes.items(), key=lambda item: item[1])
+        return (license_plate, votes, total_votes)
+
+# Lightweight tracker assigning stable track ids to car boxes between frames.
+# Boxes are matched greedily, best IoU first. Boxes without any IoU match, whose centroid is close enough to an unmatched track
+# (relative to the track's diagonal), are matched as well, so fast cars at low fps don't lose their track.
+# Every track collects OCR votes and gets confirmed once its leading license plate has enough votes, after that, the car doesn't have to be read anymore.
+# Tracks are updated by car detection and voted on by license plate reading, each running in its own thread, hence the lock.
+class CarTracker:
+    def __init__(self, iou_threshold: float, max_centroid_distance_ratio: float, max_age_seconds: float, votes_to_confirm: int, min_vote_share: float):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance_ratio = max_centroid_distance_ratio
+        self.max_age_seconds = max_age_seconds
+        self.votes_to_confirm = votes_to_confirm
+        self.min_vote_share = min_vote_share
+        self.tracks = []
+        self.track_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+        x_min = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+        y_min = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+        x_max = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+        y_max = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+        intersection = np.clip(x_max - x_min, 0, None) * np.clip(y_max - y_min, 0, None)
+        area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+        area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+        union = area_a[:, None] + area_b[None, :] - intersection
+        return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+    @staticmethod
+    def _centroid_distance_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+        centroids_a = np.stack([(boxes_a[:, 0] + boxes_a[:, 2]) / 2, (boxes_a[:, 1] + boxes_a[:, 3]) / 2], axis=1)
+        centroids_b = np.stack([(boxes_b[:, 0] + boxes_b[:, 2]) / 2, (boxes_b[:, 1] + boxes_b[:, 3]) / 2], axis=1)
+        distances = np.linalg.norm(centroids_a[:, None, :] - centroids_b[None, :, :], axis=2)
+        diagonals_b = np.hypot(boxes_b[:, 2] - boxes_b[:, 0], boxes_b[:, 3] - boxes_b[:, 1])
+        return distances / np.maximum(diagonals_b[None, :], 1e-6)
+
+    # boxes => [(x_min, y_min, x_max, y_max)] of cars found in the current frame
+    # Returns track for each box, in the same order
+    def update(self, boxes: list[(float, float, float, float)], now: float = None) -> list[CarTrack]:
+        with self.lock:
+            return self._update(boxes, time.monotonic() if now is None else now)
+
+    # Returns index of the track box matched to each box (None if there's no match), in the same order as boxes
+    def _match(self, boxes: list[(float, float, float, float)], track_boxes: list[(float, float, float, float)]) -> list[int]:
+        matched_track_indexes_of_boxes = [None] * len(boxes)
+        if len(boxes) == 0 or len(track_boxes) == 0:
+            return matched_track_indexes_of_boxes
+
+        boxes_as_array = np.array(boxes, dtype=np.float32)
+        tracks_as_array = np.array(track_boxes, dtype=np.float32)
+        ious = self._iou_matrix(boxes_as_array, tracks_as_array)
+        centroid_distances = self._centroid_distance_matrix(boxes_as_array, tracks_as_array)
+
+        matched_track_indexes = set()
+        candidates = [(ious[box_index, track_index], box_index, track_index) for box_index, track_index in zip(*np.nonzero(ious >= self.iou_threshold))]
+        for _, box_index, track_index in sorted(candidates, reverse=True):
+            if matched_track_indexes_of_boxes[box_index] is None and track_index not in matched_track_indexes:
+                matched_track_indexes_of_boxes[box_index] = track_index
+                matched_track_indexes.add(track_index)
+
+        candidates = [(centroid_distances[box_index, track_index], box_index, track_index) for box_index, track_index in zip(*np.nonzero(centroid_distances <= self.max_centroid_distance_ratio))]
+        for _, box_index, track_index in sorted(candidates):
+            if matched_track_indexes_of_boxes[box_index] is None and track_index not in matched_track_indexes:
+                matched_track_indexes_of_boxes[box_index] = track_index
+                matched_track_indexes.add(track_index)
+        return matched_track_indexes_of_boxes
+
+    def _update(self, boxes: list[(float, float, float, float)], now: float) -> list[CarTrack]:
+        self.tracks = [track for track in self.tracks if now - track.last_seen_at <= self.max_age_seconds]
+        if len(boxes) == 0:
+            return []
+
+        assigned_tracks = [None if track_index is None else self.tracks[track_index] for track_index in self._match(boxes, [track.box for track in self.tracks])]
+        for box_index, box in enumerate(boxes):
+            track = assigned_tracks[box_index]
+            if track is None:
+                track = CarTrack(next(self.track_ids), box, now)
+                self.tracks.append(track)
+                assigned_tracks[box_index] = track
+            track.box = box
+            track.last_seen_at = now
+        return assigned_tracks
+
+    # Returns [(x_min, y_min, x_max, y_max, is_confirmed)] of every live track, inference workers get it with every frame (tracks live in the main process)
+    def get_track_boxes(self, now: float = None) -> list[(float, float, float, float, bool)]:
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return [(*[float(coordinate) for coordinate in track.box], track.confirmed_license_plate is not None) for track in self.tracks if now - track.last_seen_at <= self.max_age_seconds]
+
+    # track_boxes => see `get_track_boxes`
+    # Returns True for each box which `update` would assign to a track with confirmed license plate, without changing any track
+    def match_confirmed(self, boxes: list[(float, float, float, float)], track_boxes: list[(float, float, float, float, bool)]) -> list[bool]:
+        matched_track_indexes = self._match(boxes, [track_box[:4] for track_box in track_boxes])
+        return [track_index is not None and track_boxes[track_index][4] for track_index in matched_track_indexes]
+
+    # Returns True if this vote confirmed the track's license plate
+    def add_vote(self, track: CarTrack, recognition: Recognition) -> bool:
+        with self.lock:
+            return self._add_vote(track, recognition)
+
+    def _add_vote(self, track: CarTrack, recognition: Recognition) -> bool:
+        if track.confirmed_license_plate is not None:
+            return False
+
+        track.votes[recognition.license_plate] = track.votes.get(recognition.license_plate, 0) + 1
+        keep_best_recognition(track.recognitions, recognition)
+        license_plate, votes, total_votes = track.get_leading_vote()
+        if votes >= self.votes_to_confirm and votes / total_votes >= self.min_vote_share:
+            track.confirmed_license_plate = license_plate
+            track.recognitions = {license_plate: track.recognitions[license_plate]} # misreads are no longer needed
+            return True
+        return False
@@ -0,0 +1,40 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+# Windows showing the captured video in DEBUG (one per camera), drawn by a single thread at its own (low) fps.
+# Captures only hand over the reference of their latest frame, so drawing the windows never slows down any capture.
+class DebugPreview:
+    def __init__(self, fps: float, size: (int, int) = (750, 750)):
+        self.interval_seconds = 1 / fps if fps > 0 else 0
+        self.size = size
+        self.latest_frames = {} # window name => latest frame
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def is_enabled(self) -> bool:
+        return self.interval_seconds > 0
+
+    # Safe to call multiple times, the thread is started only once
+    def start(self):
+        with self.lock:
+            if self.is_enabled() and self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    # Called by the capture for every decoded frame, the frame must not be modified afterwards
+    def show(self, frame: np.ndarray, window_name: str = "frame"):
+        self.latest_frames[window_name] = frame
+
+    def _run(self):
+        cv2.startWindowThread()
+        shown_frames = {}
+        while True:
+            started_at = time.monotonic()
+            for window_name, frame in list(self.latest_frames.items()):
+                if frame is not shown_frames.get(window_name):
+                    cv2.imshow(window_name, cv2.resize(frame, self.size))
+                    shown_frames[window_name] = frame
+            cv2.waitKey(1)
+            time.sleep(max(self.interval_seconds - (time.monotonic() - started_at), 0))
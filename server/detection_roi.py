@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+
+# Region of interest the car detection runs on, instead of the whole frame.
+# The region is either a rectangle ("x_min,y_min,x_max,y_max") or a polygon ("x1,y1;x2,y2;x3,y3;..."), in pixels of the captured frame.
+# The frame gets cropped to the bounding box of the region (clamped to the frame), everything outside of the polygon is painted gray (same as yolo's letterbox padding)
+# and the crop can be optionally downscaled. Boxes found inside the region have to be mapped back with `to_frame_coordinates`.
+class DetectionRoi:
+    FILL_COLOR = (114, 114, 114)
+
+    def __init__(self, points: list[(int, int)], scale: float):
+        if scale <= 0:
+            raise ValueError(f"Scale of the detection ROI has to be greater than 0, got: {scale}")
+        self.points = points
+        self.scale = scale
+        x_coordinates = [x for x, _ in points]
+        y_coordinates = [y for _, y in points]
+        self.bounding_box = (min(x_coordinates), min(y_coordinates), max(x_coordinates), max(y_coordinates))
+        self.is_polygon = len(points) > 2 and sorted(points) != sorted(self._rectangle_points(self.bounding_box))
+        self.mask = None
+        self.background = None
+        # Set by `fit_to_frame` once the size of the frame is known
+        self.frame_size = None # (width, height) of the captured frame
+        self.region_box = self.bounding_box # bounding box clamped to the frame
+        self.resized_size = None # (width, height) of the image returned by `apply`, None if it's not resized
+        self.ratio = (scale, scale) # (x, y) => actual ratio between the image returned by `apply` and the region, int() rounding of the resize makes it differ from scale
+
+    @staticmethod
+    def _rectangle_points(bounding_box: (int, int, int, int)) -> list[(int, int)]:
+        x_min, y_min, x_max, y_max = bounding_box
+        return [(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)]
+
+    # Returns None if the config is empty (ROI disabled)
+    @staticmethod
+    def from_config(region: str, scale: float):
+        if region is None or region.strip() == "":
+            return None
+        if ";" in region:
+            points = [tuple(int(float(coordinate)) for coordinate in point.split(",")) for point in region.split(";") if point.strip() != ""]
+        else:
+            x_min, y_min, x_max, y_max = [int(float(coordinate)) for coordinate in region.split(",")]
+            points = DetectionRoi._rectangle_points((x_min, y_min, x_max, y_max))
+        return DetectionRoi(points, scale)
+
+    # Clamps the region to the frame and computes the size the region gets resized to, raises ValueError if no part of the region is inside of the frame
+    def fit_to_frame(self, frame_width: int, frame_height: int):
+        x_min, y_min, x_max, y_max = self.bounding_box
+        x_min, x_max = [min(max(x, 0), frame_width) for x in (x_min, x_max)]
+        y_min, y_max = [min(max(y, 0), frame_height) for y in (y_min, y_max)]
+        if x_min >= x_max or y_min >= y_max:
+            raise ValueError(f"Detection ROI {self.bounding_box} is outside of the frame ({frame_width}x{frame_height})")
+        self.frame_size = (frame_width, frame_height)
+        self.region_box = (x_min, y_min, x_max, y_max)
+        self.mask = None
+        width, height = x_max - x_min, y_max - y_min
+        if self.scale != 1:
+            self.resized_size = (max(int(width * self.scale), 1), max(int(height * self.scale), 1))
+            self.ratio = (self.resized_size[0] / width, self.resized_size[1] / height)
+        else:
+            self.resized_size = None
+            self.ratio = (1, 1)
+
+    # frame => whole captured frame (BGR numpy array)
+    # Returns view into the frame, if the region is a rectangle and not scaled, new image otherwise
+    def apply(self, frame: np.ndarray) -> np.ndarray:
+        frame_height, frame_width = frame.shape[:2]
+        if self.frame_size != (frame_width, frame_height):
+            self.fit_to_frame(frame_width, frame_height)
+        x_min, y_min, x_max, y_max = self.region_box
+        region_image = frame[y_min:y_max, x_min:x_max]
+
+        if self.is_polygon:
+            if self.mask is None or self.mask.shape != region_image.shape[:2]:
+                self.mask = np.zeros(region_image.shape[:2], dtype=np.uint8)
+                cv2.fillPoly(self.mask, [np.array([(x - x_min, y - y_min) for x, y in self.points], dtype=np.int32)], 255)
+                self.background = np.full(region_image.shape, self.FILL_COLOR, dtype=np.uint8)
+            region_image = cv2.copyTo(region_image, self.mask, self.background.copy())
+
+        if self.resized_size is not None:
+            region_image = cv2.resize(region_image, self.resized_size, interpolation=cv2.INTER_AREA)
+        return region_image
+
+    # Box coordinates found on the image returned by `apply` => coordinates inside of the whole captured frame
+    def to_frame_coordinates(self, x_min: float, y_min: float, x_max: float, y_max: float) -> (float, float, float, float):
+        offset_x, offset_y, _, _ = self.region_box
+        ratio_x, ratio_y = self.ratio
+        return (
+            x_min / ratio_x + offset_x,
+            y_min / ratio_y + offset_y,
+            x_max / ratio_x + offset_x,
+            y_max / ratio_y + offset_y,
+        )
@@ -0,0 +1,95 @@
+import threading
+import time
+import numpy as np
+
+# Fixed-size ring of preallocated frame slots, written by the capture thread and read by detection.
+# Every frame gets a sequence number (starting at 1) and a capture timestamp (time.monotonic()),
+# so consumers know whether they've already seen the latest frame and how old it is.
+# Frames are kept as raw numpy arrays straight from the capture, any conversion is done by the consumer when it takes a frame.
+# new_frame_event (optional) gets set on every written frame, one event can be shared by multiple buffers, so a consumer can wait for a frame from any of them.
+class FrameRingBuffer:
+    def __init__(self, number_of_slots: int, new_frame_event: threading.Event = None):
+        self.number_of_slots = max(number_of_slots, 1)
+        self.slots = None # allocated once the first frame arrives (or when the resolution of the capture changes)
+        self.slot_sequence_numbers = [0] * self.number_of_slots
+        self.slot_captured_at = [0.0] * self.number_of_slots
+        self.latest_sequence_number = 0
+        self.is_cleared = True
+        self.lock = threading.Lock()
+        self.new_frame_written = threading.Condition(self.lock)
+        self.new_frame_event = new_frame_event
+        self.frame_requested = threading.Event() # set while a consumer waits for a frame it hasn't seen yet, lets the capture decode frames only on demand
+
+        self.frames_written = 0
+        self.frames_taken = 0
+        self.frames_dropped = 0 # written, but never taken by anyone
+        self.last_taken_sequence_number = 0
+        self.capture_to_take_latency_sum = 0.0
+        self.capture_to_take_latency_max = 0.0
+
+    # Returns sequence number of the written frame
+    def put(self, frame: np.ndarray) -> int:
+        with self.lock:
+            if self.slots is None or self.slots.shape[1:] != frame.shape or self.slots.dtype != frame.dtype:
+                self.slots = np.empty((self.number_of_slots, *frame.shape), dtype=frame.dtype)
+
+            self.latest_sequence_number += 1
+            slot_index = self.latest_sequence_number % self.number_of_slots
+            np.copyto(self.slots[slot_index], frame)
+            self.slot_sequence_numbers[slot_index] = self.latest_sequence_number
+            self.slot_captured_at[slot_index] = time.monotonic()
+            self.is_cleared = False
+            self.frames_written += 1
+            self.frame_requested.clear()
+            self.new_frame_written.notify_all()
+            if self.new_frame_event is not None:
+                self.new_frame_event.set()
+            return self.latest_sequence_number
+
+    # Call when the capture gets disconnected, so nobody works with a stale frame
+    def clear(self):
+        with self.lock:
+            self.is_cleared = True
+
+    # True if a consumer is waiting for a new frame
+    def is_frame_requested(self) -> bool:
+        return self.frame_requested.is_set()
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.is_cleared
+
+    # Returns (sequence number, captured at, converted frame) of the latest frame, or None if there is no frame newer than last_seen_sequence_number.
+    # `convert` gets called while the slot is locked, it has to return a new object (not a view), since the slot gets reused.
+    # If timeout is set, waits up to timeout seconds for a new frame to arrive.
+    def take_latest(self, last_seen_sequence_number: int, convert = np.copy, timeout: float = 0) -> (int, float, any):
+        with self.lock:
+            if self.is_cleared or self.latest_sequence_number <= last_seen_sequence_number:
+                self.frame_requested.set()
+            if timeout > 0:
+                self.new_frame_written.wait_for(lambda: self.is_cleared is False and self.latest_sequence_number > last_seen_sequence_number, timeout)
+            if self.is_cleared or self.latest_sequence_number <= last_seen_sequence_number:
+                return None
+
+            slot_index = self.latest_sequence_number % self.number_of_slots
+            sequence_number = self.slot_sequence_numbers[slot_index]
+            captured_at = self.slot_captured_at[slot_index]
+            converted_frame = convert(self.slots[slot_index])
+
+            self.frames_dropped += max(sequence_number - self.last_taken_sequence_number - 1, 0)
+            self.last_taken_sequence_number = max(self.last_taken_sequence_number, sequence_number)
+            self.frames_taken += 1
+            capture_to_take_latency = time.monotonic() - captured_at
+            self.capture_to_take_latency_sum += capture_to_take_latency
+            self.capture_to_take_latency_max = max(self.capture_to_take_latency_max, capture_to_take_latency)
+            return (sequence_number, captured_at, converted_frame)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "frames_written": self.frames_written,
+                "frames_taken": self.frames_taken,
+                "frames_dropped": self.frames_dropped,
+                "capture_to_take_latency_avg": self.capture_to_take_latency_sum / self.frames_taken if self.frames_taken > 0 else 0.0,
+                "capture_to_take_latency_max": self.capture_to_take_latency_max,
+            }
@@ -0,0 +1,107 @@
+import itertools
+import multiprocessing
+import threading
+from shared_frame_pool import SharedFramePool
+
+# Inference worker processes (PIPELINE_WORKER_PROCESSES), so detection, segmentation and OCR of different frames don't fight over a single GIL.
+# Processes are spawned (not forked), target is called as target(worker_id, task_queue, result_queue).
+# Every worker has its own task queue (at most one task at a time), so it's known which frame slot each worker has in flight.
+# Workers report back through the shared result queue as (worker_id, result), result is None once the worker is ready (models loaded).
+# Dead workers (crashed, killed by the OOM killer, ...) are replaced by new ones, frame slots they had in flight are reclaimed.
+# Every started process gets a new worker_id, so a late result of a dead worker can't free a slot which is already used again.
+class InferenceWorkerPool:
+    def __init__(self, number_of_workers: int, target, shared_frame_pool: SharedFramePool, log = print):
+        self.number_of_workers = max(number_of_workers, 1)
+        self.target = target
+        self.shared_frame_pool = shared_frame_pool
+        self.log = log
+        self.context = multiprocessing.get_context("spawn")
+        self.result_queue = self.context.Queue()
+        self.worker_ids = itertools.count(1)
+        self.workers = {} # worker id => (process, task queue)
+        self.idle_worker_ids = []
+        self.lock = threading.Lock()
+        self.worker_became_idle = threading.Condition(self.lock)
+
+        self.tasks_sent = 0
+        self.workers_restarted = 0
+
+    def start(self):
+        for _ in range(self.number_of_workers):
+            self._start_worker()
+
+    def _start_worker(self):
+        worker_id = next(self.worker_ids)
+        task_queue = self.context.Queue()
+        process = self.context.Process(target=self.target, args=(worker_id, task_queue, self.result_queue), daemon=True)
+        process.start()
+        with self.lock:
+            self.workers[worker_id] = (process, task_queue)
+
+    # Returns id of a ready worker without any task, or None after timeout seconds
+    def wait_for_idle_worker(self, timeout: float) -> int:
+        with self.lock:
+            if self.worker_became_idle.wait_for(lambda: len(self.idle_worker_ids) > 0, timeout) is False:
+                return None
+            return self.idle_worker_ids.pop(0)
+
+    # Worker taken by wait_for_idle_worker, but there was nothing to do
+    def release_idle_worker(self, worker_id: int):
+        with self.lock:
+            if worker_id in self.workers:
+                self.idle_worker_ids.append(worker_id)
+                self.worker_became_idle.notify_all()
+
+    def submit(self, worker_id: int, task: tuple):
+        with self.lock:
+            worker = self.workers.get(worker_id)
+        if worker is None:
+            raise RuntimeError(f"Inference worker {worker_id} is not running.")
+        worker[1].put(task)
+        self.tasks_sent += 1
+
+    # Blocks until a worker returns a result, returns (worker id, result), results of dead workers are thrown away
+    def get_result(self) -> (int, any):
+        while True:
+            worker_id, result = self.result_queue.get()
+            with self.lock:
+                if worker_id not in self.workers:
+                    continue
+                self.idle_worker_ids.append(worker_id)
+                self.worker_became_idle.notify_all()
+            if result is not None:
+                return (worker_id, result)
+
+    def restart_dead_workers(self):
+        with self.lock:
+            dead_workers = [(worker_id, process) for worker_id, (process, _) in self.workers.items() if process.is_alive() is False]
+            for worker_id, process in dead_workers:
+                del self.workers[worker_id]
+                if worker_id in self.idle_worker_ids:
+                    self.idle_worker_ids.remove(worker_id)
+        for worker_id, process in dead_workers:
+            process.join()
+            reclaimed_slots = self.shared_frame_pool.reclaim_slots_of_worker(worker_id)
+            self.log(f"Inference worker {worker_id} died (exit code {process.exitcode}), reclaimed {reclaimed_slots} frames it had in flight, starting a new one...")
+            self.workers_restarted += 1
+            self._start_worker()
+
+    def stop(self):
+        with self.lock:
+            workers = list(self.workers.values())
+        for process, task_queue in workers:
+            task_queue.put(None)
+        for process, _ in workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate() # still busy with a frame
+                process.join()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "workers": len(self.workers),
+                "idle_workers": len(self.idle_worker_ids),
+                "tasks_sent": self.tasks_sent,
+                "workers_restarted": self.workers_restarted,
+            }
@@ -0,0 +1,98 @@
+import threading
+import time
+
+# Every level keeps the degradations of the levels below it
+LEVEL_NORMAL = 0
+LEVEL_REDUCED_INFERENCE_SIZE = 1 # both models run on smaller (letterboxed) images
+LEVEL_CAPPED_CARS = 2 # only the closest cars of every frame get their license plates read
+LEVEL_REDUCED_DETECTION_RATE = 3 # frames are taken for detection less often
+LEVEL_NAMES = ["normal", "reduced_inference_size", "capped_cars", "reduced_detection_rate"]
+
+# Keeps the time from capturing a frame to having its license plates read (end-to-end latency) within a budget.
+# Latency is smoothed (exponential moving average), once it's over the budget, the level goes up by one (at most once per step_seconds),
+# once it's below recovery_ratio of the budget for recovery_seconds (or no frame was measured for that long, eg. nothing moves in front of the cameras), it goes down by one.
+# Stages only ask for the settings of the current level, the scheduler never touches them itself.
+class LatencyScheduler:
+    def __init__(self, budget_seconds: float, reduced_inference_size: int, max_cars_per_frame: int, reduced_detection_fps: float, recovery_seconds: float, log = print, step_seconds: float = 2, recovery_ratio: float = 0.5, smoothing: float = 0.3):
+        self.budget_seconds = budget_seconds
+        self.reduced_inference_size = reduced_inference_size
+        self.max_cars_per_frame = max_cars_per_frame
+        self.reduced_detection_fps = reduced_detection_fps
+        self.recovery_seconds = recovery_seconds
+        self.log = log
+        self.step_seconds = step_seconds
+        self.recovery_ratio = recovery_ratio
+        self.smoothing = smoothing
+        self.level = LEVEL_NORMAL
+        self.latency = None # seconds, smoothed
+        self.stage_costs = {} # stage => seconds, smoothed
+        self.level_changed_at = 0
+        self.below_recovery_since = None
+        self.last_measured_at = None
+        self.level_changes = 0
+        self.lock = threading.Lock()
+
+    def _set_level(self, level: int, now: float):
+        self.log(f"Latency {self.latency * 1000 if self.latency is not None else 0:.0f} ms (budget {self.budget_seconds * 1000:.0f} ms), degradation level {LEVEL_NAMES[self.level]} => {LEVEL_NAMES[level]}")
+        self.level = level
+        self.level_changed_at = now
+        self.below_recovery_since = None
+        self.level_changes += 1
+
+    def _recover_if_idle(self, now: float):
+        if self.level > LEVEL_NORMAL and self.last_measured_at is not None and now - self.last_measured_at >= self.recovery_seconds and now - self.level_changed_at >= self.recovery_seconds:
+            self._set_level(self.level - 1, now)
+            self.latency = None
+
+    # seconds => from capturing the frame until it was done with (license plates read, or no car found on it)
+    def record_latency(self, seconds: float, now: float = None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.latency = seconds if self.latency is None else self.smoothing * seconds + (1 - self.smoothing) * self.latency
+            self.last_measured_at = now
+            if self.latency > self.budget_seconds:
+                self.below_recovery_since = None
+                if self.level < LEVEL_REDUCED_DETECTION_RATE and now - self.level_changed_at >= self.step_seconds:
+                    self._set_level(self.level + 1, now)
+            elif self.latency < self.budget_seconds * self.recovery_ratio and self.level > LEVEL_NORMAL:
+                self.below_recovery_since = now if self.below_recovery_since is None else self.below_recovery_since
+                if now - self.below_recovery_since >= self.recovery_seconds:
+                    self._set_level(self.level - 1, now)
+            else:
+                self.below_recovery_since = None
+
+    # Cost of every stage, only reported (see get_stats)
+    def record_stage(self, stage: str, seconds: float):
+        with self.lock:
+            previous = self.stage_costs.get(stage)
+            self.stage_costs[stage] = seconds if previous is None else self.smoothing * seconds + (1 - self.smoothing) * previous
+
+    def get_level(self, now: float = None) -> int:
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._recover_if_idle(now)
+            return self.level
+
+    # Settings of a level (inference worker processes get the level with every frame)
+    # Returns image size both models run on, None => the size the models were trained/exported with
+    def get_inference_size(self, level: int) -> int:
+        return self.reduced_inference_size if level >= LEVEL_REDUCED_INFERENCE_SIZE else None
+
+    # Returns maximum number of cars to read per frame, None => all of them
+    def get_max_cars_per_frame(self, level: int) -> int:
+        return self.max_cars_per_frame if level >= LEVEL_CAPPED_CARS else None
+
+    # Returns minimum number of seconds between two detections, 0 => as often as there are frames
+    def get_detection_interval(self, level: int) -> float:
+        return 1 / self.reduced_detection_fps if level >= LEVEL_REDUCED_DETECTION_RATE and self.reduced_detection_fps > 0 else 0
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "level": self.level,
+                "level_name": LEVEL_NAMES[self.level],
+                "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+                "budget_ms": round(self.budget_seconds * 1000, 1),
+                "stage_costs_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stage_costs.items()},
+                "level_changes": self.level_changes,
+            }
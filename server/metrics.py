@@ -0,0 +1,146 @@
+import asyncio
+import bisect
+import threading
+
+# Buckets (in seconds) of latency histograms, from a few milliseconds (segmentation of a license plate) to seconds (a busy frame on CPU)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(label_names: tuple, label_values: tuple, extra_labels: list[(str, str)] = []) -> str:
+    labels = list(zip(label_names, label_values)) + extra_labels
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(f"{name}=\"{_escape_label_value(value)}\"" for name, value in labels) + "}"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if isinstance(value, bool) or float(value).is_integer() else repr(float(value))
+
+class Metric:
+    def __init__(self, registry, name: str, help: str, metric_type: str, label_names: list[str]):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+
+    def collect(self) -> list[str]:
+        raise NotImplementedError()
+
+# Only ever goes up, every label combination (eg. per camera) is a separate series
+class Counter(Metric):
+    def __init__(self, registry, name: str, help: str, label_names: list[str]):
+        super().__init__(registry, name, help, "counter", label_names)
+        self.values = {} # label values => value
+
+    def inc(self, amount: float = 1, label_values: tuple = ()):
+        if self.registry.enabled is False:
+            return
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def collect(self) -> list[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return [f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}" for label_values, value in values]
+
+# Fixed buckets, observing a value is a binary search + two additions, no values are kept
+class Histogram(Metric):
+    def __init__(self, registry, name: str, help: str, label_names: list[str], buckets: tuple):
+        super().__init__(registry, name, help, "histogram", label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {} # label values => [count of every bucket (not cumulative) + count of +Inf bucket, sum]
+
+    def observe(self, value: float, label_values: tuple = ()):
+        if self.registry.enabled is False:
+            return
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0]
+                self.series[label_values] = series
+            series[0][bucket_index] += 1
+            series[1] += value
+
+    def collect(self) -> list[str]:
+        with self.lock:
+            series = [(label_values, list(bucket_counts), total) for label_values, (bucket_counts, total) in self.series.items()]
+        lines = []
+        for label_values, bucket_counts, total in series:
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(list(self.buckets) + ["+Inf"], bucket_counts):
+                cumulative_count += bucket_count
+                le = upper_bound if upper_bound == "+Inf" else _format_value(upper_bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, label_values, [('le', le)])} {cumulative_count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, label_values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, label_values)} {cumulative_count}")
+        return lines
+
+# Read only when metrics are scraped, from stats the components already keep (frame buffers, queues, result writer, ...), so it costs nothing on the hot path.
+# function returns [(label values, value)]
+class CallbackMetric(Metric):
+    def __init__(self, registry, name: str, help: str, metric_type: str, label_names: list[str], function):
+        super().__init__(registry, name, help, metric_type, label_names)
+        self.function = function
+
+    def collect(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}" for label_values, value in self.function()]
+
+# All metrics of the server, exposed in Prometheus text format (METRICS_ENABLED, METRICS_PORT).
+# When disabled, metrics can still be created and used, but counters and histograms return right away and nothing is served.
+class MetricsRegistry:
+    def __init__(self, enabled: bool, log = print):
+        self.enabled = enabled
+        self.log = log
+        self.metrics = []
+
+    def _register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, label_names: list[str] = []) -> Counter:
+        return self._register(Counter(self, name, help, label_names))
+
+    def histogram(self, name: str, help: str, label_names: list[str] = [], buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help, label_names, buckets))
+
+    # metric_type => "counter" or "gauge"
+    def callback(self, name: str, help: str, metric_type: str, label_names: list[str], function) -> CallbackMetric:
+        return self._register(CallbackMetric(self, name, help, metric_type, label_names, function))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            try:
+                samples = metric.collect()
+            except Exception as e:
+                self.log(f"Unable to collect metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    # Minimal HTTP server answering `GET /metrics`, runs in the asyncio loop of the websocket server
+    async def serve(self, port: int):
+        server = await asyncio.start_server(self._handle_request, "", port)
+        await server.wait_closed()
+
+    async def _handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()).strip() != b"": # headers aren't needed
+                pass
+            if len(request_line) >= 2 and request_line[0] == "GET" and request_line[1].split("?")[0] == "/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", self.render().encode("utf-8")
+            else:
+                status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", b"Not found, metrics are at /metrics\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
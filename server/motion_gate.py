@@ -0,0 +1,69 @@
+import time
+import cv2
+import numpy as np
+
+# Cheap pre-stage in front of the car detection.
+# Compares a downscaled grayscale copy of the watched region with the previous one and only lets the frame through
+# when enough pixels changed. After motion, frames keep going through for `hold_seconds` (so cars standing at the gate still get read),
+# and once every `keep_alive_seconds` a frame goes through no matter what.
+class MotionGate:
+    def __init__(self, region: (int, int, int, int), downscale_width: int, pixel_threshold: int, min_changed_ratio: float, hold_seconds: float, keep_alive_seconds: float):
+        self.region = region # (x_min, y_min, x_max, y_max) in pixels of the captured frame, None means whole frame
+        self.downscale_width = downscale_width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_ratio = min_changed_ratio
+        self.hold_seconds = hold_seconds
+        self.keep_alive_seconds = keep_alive_seconds
+
+        self.previous_gray = None
+        self.last_motion_at = 0.0
+        self.last_inference_at = 0.0
+        self.frames_checked = 0
+        self.inferences_skipped = 0
+
+    # Raises ValueError if the watched region doesn't fit into the frame (slicing it out would give an empty or cut off image)
+    def check_frame_size(self, frame_width: int, frame_height: int):
+        if self.region is None:
+            return
+        x_min, y_min, x_max, y_max = self.region
+        if x_max > frame_width or y_max > frame_height:
+            raise ValueError(f"Motion gate region {self.region} is outside of the frame ({frame_width}x{frame_height})")
+
+    def _downscaled_gray(self, frame: np.ndarray) -> np.ndarray:
+        if self.region is not None:
+            x_min, y_min, x_max, y_max = self.region
+            frame = frame[y_min:y_max, x_min:x_max]
+        height, width = frame.shape[:2]
+        downscaled_width = min(self.downscale_width, width)
+        downscaled_height = max(int(height * downscaled_width / width), 1)
+        downscaled = cv2.resize(frame, (downscaled_width, downscaled_height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(downscaled, cv2.COLOR_BGR2GRAY) if downscaled.ndim == 3 else downscaled
+
+    def get_changed_ratio(self, frame: np.ndarray) -> float:
+        gray = self._downscaled_gray(frame)
+        previous_gray = self.previous_gray
+        self.previous_gray = gray
+        if previous_gray is None or previous_gray.shape != gray.shape:
+            return 1.0
+        changed_pixels = np.count_nonzero(cv2.absdiff(gray, previous_gray) > self.pixel_threshold)
+        return changed_pixels / gray.size
+
+    # frame => raw BGR frame, as captured
+    def should_run_inference(self, frame: np.ndarray, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self.frames_checked += 1
+        if self.get_changed_ratio(frame) >= self.min_changed_ratio:
+            self.last_motion_at = now
+
+        if now - self.last_motion_at <= self.hold_seconds or now - self.last_inference_at >= self.keep_alive_seconds:
+            self.last_inference_at = now
+            return True
+
+        self.inferences_skipped += 1
+        return False
+
+    def get_stats(self) -> dict:
+        return {
+            "frames_checked": self.frames_checked,
+            "inferences_skipped": self.inferences_skipped,
+        }
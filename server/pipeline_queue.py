@@ -0,0 +1,30 @@
+import asyncio
+import queue
+
+# Bounded queue connecting two stages of the detection pipeline.
+# Stages where only the freshest work matters use `put_dropping_oldest`, stages where nothing may get lost use the blocking `put`.
+class PipelineQueue(queue.Queue):
+    def __init__(self, name: str, maxsize: int):
+        super().__init__(maxsize=max(maxsize, 1))
+        self.name = name
+        self.items_dropped = 0
+
+    # Never blocks the producer, if the queue is full, the oldest item is thrown away
+    def put_dropping_oldest(self, item):
+        while True:
+            try:
+                self.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.get_nowait()
+                    self.items_dropped += 1
+                except queue.Empty:
+                    pass
+
+    # Waits for an item without blocking the event loop
+    async def get_async(self):
+        return await asyncio.get_running_loop().run_in_executor(None, self.get)
+
+def get_queue_depths(pipeline_queues: list[PipelineQueue]) -> dict:
+    return {pipeline_queue.name: {"depth": pipeline_queue.qsize(), "max": pipeline_queue.maxsize, "dropped": pipeline_queue.items_dropped} for pipeline_queue in pipeline_queues}
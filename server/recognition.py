@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+
+# License plate read from a car, kept until validation decides about it.
+# While the frame is being processed, car_image is only a view into the captured frame (reference to the frame + box of the car),
+# once validation keeps the recognition (see `keep_best_recognition`), it gets its own copy of the car image, so the frame itself can be freed.
+# The license plate image is cropped out of the car image again only if the recognition passes validation (see `materialize_recognition` of server.py).
+class Recognition:
+    __slots__ = ("license_plate", "car_image", "license_plate_box", "quality", "car_track", "is_cached")
+
+    # license_plate_box => (x_min, y_min, x_max, y_max) of the license plate inside of car_image
+    # quality => see `compute_sharpness`, the best recognition of a license plate is the one which gets sent
+    # car_track => track of the car (None if the camera doesn't use car_tracker, index of the car inside of inference workers)
+    # is_cached => license plate came from OCR_CACHE (repeat of an earlier read of a near-identical image), it still counts as a vote in validation
+    def __init__(self, license_plate: str, car_image: np.ndarray, license_plate_box: (float, float, float, float), quality: float, car_track: any = None, is_cached: bool = False):
+        self.license_plate = license_plate
+        self.car_image = car_image
+        self.license_plate_box = license_plate_box
+        self.quality = quality
+        self.car_track = car_track
+        self.is_cached = is_cached
+
+    # The car image stops being a view into the frame (images received from inference workers are copies already)
+    def detach_from_frame(self):
+        if isinstance(self.car_image.base, np.ndarray):
+            self.car_image = self.car_image.copy()
+
+    def __repr__(self) -> str:
+        return f"Recognition({self.license_plate!r}, quality={self.quality:.1f})"
+
+# Sharpness of a grayscale license plate image (variance of its laplacian), small license plates get upscaled for segmentation, so it grows with size of the license plate as well
+def compute_sharpness(license_plate_image: np.ndarray) -> float:
+    return float(cv2.Laplacian(license_plate_image, cv2.CV_32F).var())
+
+# best_recognitions => license plate as string => Recognition, only the best one of every license plate is kept (with a copy of its car image, not the whole frame)
+def keep_best_recognition(best_recognitions: dict, recognition: Recognition):
+    best_recognition = best_recognitions.get(recognition.license_plate)
+    if best_recognition is None or recognition.quality > best_recognition.quality:
+        recognition.detach_from_frame()
+        best_recognitions[recognition.license_plate] = recognition
+
+# Recognitions of the last rounds (frames with license plates read) of a camera, for VALIDATION_MODE=rounds.
+# Rounds only remember which license plates were read, only the best recognition of every license plate still inside of the window is kept,
+# so the window holds one car image per license plate, instead of every frame of the window, and every license plate image of it.
+class RecognitionRounds:
+    def __init__(self):
+        self.rounds = [] # [[str]] => license plates read in every round, oldest first
+        self.best_recognitions = {} # license plate as string => Recognition
+
+    def append(self, recognitions: list[Recognition]):
+        self.rounds.append([recognition.license_plate for recognition in recognitions])
+        for recognition in recognitions:
+            keep_best_recognition(self.best_recognitions, recognition)
+
+    def pop_oldest(self):
+        self.rounds.pop(0)
+        license_plates_in_window = set(license_plate for license_plates in self.rounds for license_plate in license_plates)
+        self.best_recognitions = {license_plate: recognition for license_plate, recognition in self.best_recognitions.items() if license_plate in license_plates_in_window}
+
+    def clear(self):
+        self.rounds = []
+        self.best_recognitions = {}
+
+    # Returns license plate as string => number of times it was read inside of the window, in order of the first read
+    def count_license_plates(self) -> dict:
+        license_plate_counts = {}
+        for license_plates in self.rounds:
+            for license_plate in license_plates:
+                license_plate_counts[license_plate] = license_plate_counts.get(license_plate, 0) + 1
+        return license_plate_counts
+
+    def get_number_of_recognitions(self) -> int:
+        return sum(len(license_plates) for license_plates in self.rounds)
+
+    def __len__(self) -> int:
+        return len(self.rounds)
@@ -0,0 +1,74 @@
+import io
+import cv2
+import numpy as np
+from datetime import datetime
+from PIL import Image
+from result_store import ResultRecord
+
+# Every encoder takes a BGR (or grayscale) image as numpy array, same as opencv uses, and returns JPEG bytes.
+class JpegEncoder:
+    def __init__(self, quality: int):
+        self.quality = quality
+
+    def encode(self, image: np.ndarray) -> bytes:
+        raise NotImplementedError()
+
+class OpencvJpegEncoder(JpegEncoder):
+    def encode(self, image: np.ndarray) -> bytes:
+        successful, encoded_image = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if successful is False:
+            raise RuntimeError("Unable to encode image as JPEG.")
+        return encoded_image.tobytes()
+
+# libjpeg-turbo through simplejpeg (`pip install simplejpeg`)
+class SimplejpegJpegEncoder(JpegEncoder):
+    def __init__(self, quality: int):
+        super().__init__(quality)
+        try:
+            import simplejpeg
+        except ImportError:
+            raise RuntimeError("JPEG encoder \"simplejpeg\" requires the simplejpeg package (`pip install simplejpeg`).")
+        self.simplejpeg = simplejpeg
+
+    def encode(self, image: np.ndarray) -> bytes:
+        image = np.ascontiguousarray(image)
+        if image.ndim == 2:
+            return self.simplejpeg.encode_jpeg(image[:, :, None], quality=self.quality, colorspace="GRAY")
+        return self.simplejpeg.encode_jpeg(image, quality=self.quality, colorspace="BGR")
+
+# Original behavior, kept for comparing outputs
+class PillowJpegEncoder(JpegEncoder):
+    def encode(self, image: np.ndarray) -> bytes:
+        image = Image.fromarray(image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        with io.BytesIO() as bytes_io:
+            image.save(bytes_io, format="JPEG", quality=self.quality)
+            return bytes_io.getvalue()
+
+JPEG_ENCODERS = {
+    "opencv": OpencvJpegEncoder,
+    "simplejpeg": SimplejpegJpegEncoder,
+    "pillow": PillowJpegEncoder,
+}
+
+def create_jpeg_encoder(name: str, quality: int) -> JpegEncoder:
+    name = name.strip().lower()
+    if name not in JPEG_ENCODERS:
+        raise ValueError(f"Unknown JPEG encoder \"{name}\", choose one of: {', '.join(JPEG_ENCODERS.keys())}")
+    return JPEG_ENCODERS[name](quality)
+
+# Validated result with its crops encoded exactly once, the same bytes are sent to websocket clients and written into RESULTS_PATH
+class ResultArtifact:
+    def __init__(self, record: ResultRecord, car_image_jpeg: bytes, license_plate_image_jpeg: bytes):
+        self.record = record
+        self.car_image_jpeg = car_image_jpeg
+        self.license_plate_image_jpeg = license_plate_image_jpeg
+
+    @staticmethod
+    def create(jpeg_encoder: JpegEncoder, car_id: str, license_plate: str, car_image: np.ndarray, license_plate_image: np.ndarray, camera: str = None):
+        return ResultArtifact(ResultRecord(car_id, license_plate, datetime.now(), camera), jpeg_encoder.encode(car_image), jpeg_encoder.encode(license_plate_image))
+
+    # What websocket clients receive as the text message, "{license plate} => {uuid}", or "{license plate} => {uuid} => {camera}" if tagged by camera
+    # (clients reading only the first two parts, like the one in `./client`, keep working)
+    def get_text(self) -> str:
+        text = self.record.license_plate + " => " + self.record.car_id
+        return text if self.record.camera is None else text + " => " + self.record.camera
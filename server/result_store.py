@@ -0,0 +1,269 @@
+import contextlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+TABLE_NAME = "main_gate_alpr_license_plates"
+CAPTURED_AT_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+class ResultRecord:
+    def __init__(self, car_id: str, license_plate: str, captured_at: datetime, camera: str = None):
+        self.car_id = car_id
+        self.license_plate = license_plate
+        self.captured_at = captured_at
+        self.camera = camera # name of the camera which captured the car, None if results aren't tagged by camera
+
+    def to_json(self) -> str:
+        return json.dumps({"id": self.car_id, "license_plate": self.license_plate, "captured_at": self.captured_at.strftime(CAPTURED_AT_FORMAT), "camera": self.camera})
+
+    @staticmethod
+    def from_json(line: str):
+        values = json.loads(line)
+        return ResultRecord(values["id"], values["license_plate"], datetime.strptime(values["captured_at"], CAPTURED_AT_FORMAT), values.get("camera"))
+
+# Keeps connections open between writes, a broken connection is thrown away and a new one gets created on the next acquire.
+class ConnectionPool:
+    def __init__(self, connect, size: int):
+        self.connect = connect
+        self.connections = queue.LifoQueue(maxsize=max(size, 1))
+
+    @contextlib.contextmanager
+    def acquire(self):
+        try:
+            connection = self.connections.get_nowait()
+        except queue.Empty:
+            connection = self.connect()
+        try:
+            yield connection
+        except Exception:
+            with contextlib.suppress(Exception):
+                connection.close()
+            raise
+        try:
+            self.connections.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                connection = self.connections.get_nowait()
+            except queue.Empty:
+                return
+            with contextlib.suppress(Exception):
+                connection.close()
+
+# Every storage inserts a batch of records in a single statement + commit.
+# Inserts have to be idempotent (records with an already stored id are skipped), so a batch can be safely retried from the spill file.
+# The `camera` column is written only if the storage is created with camera_column (results tagged by camera), so existing tables keep working as they are.
+class ResultStorage:
+    @staticmethod
+    def _columns(camera_column: bool) -> list[str]:
+        return ["id", "license_plate", "captured_at"] + (["camera"] if camera_column else [])
+
+    def insert_many(self, records: list[ResultRecord]):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+class MssqlResultStorage(ResultStorage):
+    # SQL Server allows at most 2100 parameters per statement, 3 (or 4 with camera) per record
+    MAX_RECORDS_PER_STATEMENT = 500
+
+    def __init__(self, server: str, port: str, database: str, user: str, password: str, pool_size: int, camera_column: bool = False):
+        try:
+            import pymssql
+        except ImportError:
+            raise RuntimeError("Result storage \"mssql\" requires the pymssql package (`pip install pymssql`).")
+        self.pool = ConnectionPool(lambda: pymssql.connect(server=server, port=port, database=database, user=user, password=password), pool_size)
+        self.columns = self._columns(camera_column)
+
+    def _values_of(self, record: ResultRecord) -> tuple:
+        return (record.car_id, record.license_plate, record.captured_at, record.camera)[:len(self.columns)]
+
+    def insert_many(self, records: list[ResultRecord]):
+        columns = ", ".join(self.columns)
+        with self.pool.acquire() as connection:
+            cursor = connection.cursor()
+            for start in range(0, len(records), self.MAX_RECORDS_PER_STATEMENT):
+                chunk = records[start:start + self.MAX_RECORDS_PER_STATEMENT]
+                values = ", ".join(["(" + ", ".join(["%s"] * len(self.columns)) + ")"] * len(chunk))
+                cursor.execute(
+                    f"insert into {TABLE_NAME} ({columns}) "
+                    f"select {', '.join('v.' + column for column in self.columns)} from (values {values}) as v({columns}) "
+                    f"where not exists (select 1 from {TABLE_NAME} t where t.id = v.id)",
+                    tuple(value for record in chunk for value in self._values_of(record)),
+                )
+            connection.commit()
+
+    def close(self):
+        self.pool.close()
+
+# Stand-in for MSSQL when testing and benchmarking, database is the path of the sqlite file (or ":memory:")
+class SqliteResultStorage(ResultStorage):
+    def __init__(self, database: str, pool_size: int, camera_column: bool = False):
+        def connect():
+            connection = sqlite3.connect(database, check_same_thread=False)
+            connection.execute(f"create table if not exists {TABLE_NAME} (id text primary key, license_plate text not null, captured_at timestamp not null, camera text)")
+            return connection
+        self.pool = ConnectionPool(connect, pool_size)
+        self.columns = self._columns(camera_column)
+
+    def _values_of(self, record: ResultRecord) -> tuple:
+        return (record.car_id, record.license_plate, record.captured_at.isoformat(" "), record.camera)[:len(self.columns)]
+
+    def insert_many(self, records: list[ResultRecord]):
+        with self.pool.acquire() as connection:
+            connection.executemany(f"insert or ignore into {TABLE_NAME} ({', '.join(self.columns)}) values ({', '.join(['?'] * len(self.columns))})", [self._values_of(record) for record in records])
+            connection.commit()
+
+    def close(self):
+        self.pool.close()
+
+RESULT_STORAGES = {
+    "mssql": MssqlResultStorage,
+    "sqlite": SqliteResultStorage,
+}
+
+def create_result_storage(name: str, server: str, port: str, database: str, user: str, password: str, pool_size: int = 1, camera_column: bool = False) -> ResultStorage:
+    name = name.strip().lower()
+    if name not in RESULT_STORAGES:
+        raise ValueError(f"Unknown result storage \"{name}\", choose one of: {', '.join(RESULT_STORAGES.keys())}")
+    if name == "sqlite":
+        return SqliteResultStorage(database, pool_size, camera_column)
+    return MssqlResultStorage(server, port, database, user, password, pool_size, camera_column)
+
+# Single long-lived thread saving validated results, so the pipeline never waits for the database or the disk.
+# Records are inserted in batches (whatever is waiting in the queue, up to batch_size), instead of one connection + insert + commit per result.
+# If the database can't be reached, or the queue is full, records are appended to the spill file (one JSON per line)
+# and replayed once the database is reachable again, so results don't get lost while the database is down.
+class ResultWriter:
+    def __init__(self, storage: ResultStorage, results_path: str, spill_path: str, queue_size: int, batch_size: int, retry_seconds: float, log = print):
+        self.storage = storage
+        self.results_path = results_path
+        self.spill_path = spill_path
+        self.batch_size = max(batch_size, 1)
+        self.retry_seconds = retry_seconds
+        self.log = log
+        self.queue = queue.Queue(maxsize=max(queue_size, 1))
+        self.spill_lock = threading.Lock()
+        self.database_available_at = 0 # time.monotonic() after which inserting into the database is tried again
+        self.records_written = 0
+        self.records_spilled = 0
+        self.batches_written = 0
+        self.database_failures = 0
+        self.images_failed = 0 # results whose images couldn't be written into results_path
+        self.dropped = 0 # results which didn't fit into the queue, their images are never written (their records are spilled)
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # Never blocks, images (already encoded JPEG bytes) are written only when results_path is set
+    def submit(self, record: ResultRecord, car_image_jpeg: bytes = None, license_plate_image_jpeg: bytes = None):
+        try:
+            self.queue.put_nowait((record, car_image_jpeg, license_plate_image_jpeg))
+        except queue.Full:
+            self.dropped += 1
+            self.log(f"Result writer can't keep up, spilling result to disk, its images are dropped ({self.dropped} results dropped so far).")
+            try:
+                self._spill([record])
+            except Exception as e:
+                self.log(f"Unable to spill result {record.car_id}, it's lost: {e}")
+
+    # Waits until everything submitted so far is saved (or spilled)
+    def flush(self):
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            try:
+                items = [self.queue.get(timeout=self.retry_seconds)]
+            except queue.Empty:
+                self._write([]) # nothing to save, but the spill file may be waiting for the database to come back
+                continue
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                # Images failing to save (full disk, bad RESULTS_PATH) must not take the records down with them
+                self._save_images(items)
+                self._write([record for record, _, _ in items])
+            except Exception as e:
+                self.log(f"Result writer failed: {e}")
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    def _save_images(self, items: list):
+        if self.results_path is None:
+            return
+        for record, car_image_jpeg, license_plate_image_jpeg in items:
+            try:
+                for suffix, image_jpeg in [("car", car_image_jpeg), ("lp", license_plate_image_jpeg)]:
+                    if image_jpeg is not None:
+                        with open(os.path.join(self.results_path, f"{record.car_id}_{suffix}.jpg"), "wb") as image_file:
+                            image_file.write(image_jpeg)
+            except Exception as e:
+                self.images_failed += 1
+                self.log(f"Unable to save images of result {record.car_id} into {self.results_path}: {e}")
+
+    def _write(self, records: list[ResultRecord]):
+        if self.storage is None:
+            return
+        if time.monotonic() < self.database_available_at:
+            self._spill(records)
+            return
+        try:
+            self._replay_spill_file()
+            if len(records) > 0:
+                self.storage.insert_many(records)
+                self.records_written += len(records)
+                self.batches_written += 1
+        except Exception as e:
+            self.log(f"Unable to save results to database, will try again after {self.retry_seconds} seconds... ({e})")
+            self.database_available_at = time.monotonic() + self.retry_seconds
+            self.database_failures += 1
+            self._spill(records)
+
+    def _spill(self, records: list[ResultRecord]):
+        if self.storage is None or len(records) == 0:
+            return
+        with self.spill_lock:
+            with open(self.spill_path, "a", encoding="utf-8") as spill_file:
+                spill_file.writelines(record.to_json() + "\n" for record in records)
+            self.records_spilled += len(records)
+
+    # Records are removed from the spill file only after they're committed, inserts are idempotent, so a replay interrupted halfway is fine
+    def _replay_spill_file(self):
+        with self.spill_lock:
+            if os.path.exists(self.spill_path) is False:
+                return
+            with open(self.spill_path, "r", encoding="utf-8") as spill_file:
+                records = [ResultRecord.from_json(line) for line in spill_file if line.strip() != ""]
+            for start in range(0, len(records), self.batch_size):
+                self.storage.insert_many(records[start:start + self.batch_size])
+            os.remove(self.spill_path)
+        if len(records) > 0:
+            self.log(f"Replayed {len(records)} results from spill file to database.")
+            self.records_written += len(records)
+
+    def get_stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.records_written,
+            "batches": self.batches_written,
+            "spilled": self.records_spilled,
+            "database_failures": self.database_failures,
+            "images_failed": self.images_failed,
+            "dropped": self.dropped,
+            "spill_file_exists": os.path.exists(self.spill_path),
+        }
@@ -0,0 +1,110 @@
+import collections
+import math
+import time
+import numpy as np
+
+# All license plates of the history packed into one matrix (one column per license plate, characters as unicode code points, 0 padded),
+# so the levenshtein distance between a license plate and the whole history is computed by a few numpy operations, instead of a python loop per entry.
+class _LicensePlateMatrix:
+    def __init__(self, initial_capacity: int = 64, initial_width: int = 12):
+        self.columns = np.zeros((initial_width, initial_capacity), dtype=np.uint32)
+        self.lengths = np.zeros(initial_capacity, dtype=np.int16)
+        self.license_plates = []
+        self.column_of_license_plate = {}
+
+    @staticmethod
+    def _encode(license_plate: str) -> np.ndarray:
+        return np.frombuffer(license_plate.encode("utf-32-le"), dtype=np.uint32)
+
+    def add(self, license_plate: str):
+        number_of_columns = len(self.license_plates)
+        width, capacity = self.columns.shape
+        if len(license_plate) > width or number_of_columns == capacity:
+            new_columns = np.zeros((max(width, len(license_plate)), capacity * 2 if number_of_columns == capacity else capacity), dtype=np.uint32)
+            new_columns[:width, :number_of_columns] = self.columns[:, :number_of_columns]
+            new_lengths = np.zeros(new_columns.shape[1], dtype=np.int16)
+            new_lengths[:number_of_columns] = self.lengths[:number_of_columns]
+            self.columns, self.lengths = new_columns, new_lengths
+
+        self.columns[:, number_of_columns] = 0
+        self.columns[:len(license_plate), number_of_columns] = self._encode(license_plate)
+        self.lengths[number_of_columns] = len(license_plate)
+        self.license_plates.append(license_plate)
+        self.column_of_license_plate[license_plate] = number_of_columns
+
+    # The last column is moved into the place of the removed one
+    def remove(self, license_plate: str):
+        column = self.column_of_license_plate.pop(license_plate)
+        last_column = len(self.license_plates) - 1
+        last_license_plate = self.license_plates.pop()
+        if column != last_column:
+            self.columns[:, column] = self.columns[:, last_column]
+            self.lengths[column] = self.lengths[last_column]
+            self.license_plates[column] = last_license_plate
+            self.column_of_license_plate[last_license_plate] = column
+
+    # Returns levenshtein distance between license_plate and every license plate of the matrix
+    def distances(self, license_plate: str) -> np.ndarray:
+        number_of_columns = len(self.license_plates)
+        columns = self.columns[:, :number_of_columns]
+        width = columns.shape[0]
+        row_indexes = np.arange(width + 1, dtype=np.int16)[:, None]
+        previous = np.broadcast_to(row_indexes, (width + 1, number_of_columns))
+        for i, char_code in enumerate(self._encode(license_plate), 1):
+            current = np.empty((width + 1, number_of_columns), dtype=np.int16)
+            current[0] = i
+            np.minimum(previous[:-1] + (columns != char_code), previous[1:] + 1, out=current[1:]) # substitution, deletion
+            # insertion: current[j] = min(current[j], current[j - 1] + 1), done for the whole matrix at once
+            previous = np.minimum.accumulate(current - row_indexes, axis=0) + row_indexes
+        return previous[self.lengths[:number_of_columns], np.arange(number_of_columns)]
+
+# License plates sent in the last `ttl_seconds`, used to not send the same car multiple times.
+# Entries are stored in time buckets (1/number_of_buckets of ttl each), whole buckets get evicted at once, so there's no rebuilding of the history on every result.
+# Two license plates are considered the same car if 1 - levenshtein distance / length of the longer one > similarity_threshold (OCR misreads of the same car).
+class SentLicensePlatesHistory:
+    def __init__(self, ttl_seconds: float, similarity_threshold: float, number_of_buckets: int = 30):
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.bucket_seconds = max(ttl_seconds / number_of_buckets, 1e-3)
+        self.buckets = collections.OrderedDict() # bucket index => [license plates]
+        self.counts = {} # license plate => number of entries in buckets
+        self.index = _LicensePlateMatrix()
+
+    def _evict_expired(self, now: float):
+        oldest_valid_bucket_index = math.floor((now - self.ttl_seconds) / self.bucket_seconds)
+        while len(self.buckets) > 0 and next(iter(self.buckets)) < oldest_valid_bucket_index:
+            _, license_plates = self.buckets.popitem(last=False)
+            for license_plate in license_plates:
+                self.counts[license_plate] -= 1
+                if self.counts[license_plate] == 0:
+                    del self.counts[license_plate]
+                    self.index.remove(license_plate)
+
+    # Returns True if the same, or similar enough, license plate was added in the last ttl_seconds
+    def is_duplicate(self, license_plate: str, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self._evict_expired(now)
+        if license_plate in self.counts:
+            return True
+        if len(self.counts) == 0:
+            return False
+
+        distances = self.index.distances(license_plate)
+        longer_lengths = np.maximum(self.index.lengths[:len(distances)], len(license_plate))
+        similarities = 1 - distances / np.maximum(longer_lengths, 1)
+        return bool(np.any(similarities > self.similarity_threshold))
+
+    def add(self, license_plate: str, now: float = None):
+        now = time.monotonic() if now is None else now
+        self._evict_expired(now)
+        bucket_index = math.floor(now / self.bucket_seconds)
+        if bucket_index not in self.buckets:
+            self.buckets[bucket_index] = []
+        self.buckets[bucket_index].append(license_plate)
+        if license_plate not in self.counts:
+            self.counts[license_plate] = 0
+            self.index.add(license_plate)
+        self.counts[license_plate] += 1
+
+    def __len__(self) -> int:
+        return sum(self.counts.values())
@@ -1,5 +1,8 @@
 import asyncio
+import multiprocessing
 import os
+import queue
+import signal
 import sys
 import time
 import uuid
@@ -7,40 +10,132 @@ import cv2
 import numpy as np
 import threading
 import websockets
-from datetime import datetime, timedelta 
 from dotenv import load_dotenv
-from difflib import SequenceMatcher
-from PIL import Image
-from ultralytics import YOLO
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import utils
+import ocr_backends
+from license_plate_cache import LicensePlateReadCache, compute_license_plate_hash
+from recognition import Recognition, RecognitionRounds, compute_sharpness
+from frame_ring_buffer import FrameRingBuffer
+from motion_gate import MotionGate
+from detection_roi import DetectionRoi
+from car_tracker import CarTracker, CarTrack
+from sent_plates_history import SentLicensePlatesHistory
+from pipeline_queue import PipelineQueue, get_queue_depths
+from broadcast import ResultBroadcaster, EncodedResult, RecentResults
+from result_store import ResultWriter, create_result_storage
+from result_artifact import ResultArtifact, create_jpeg_encoder
+from debug_preview import DebugPreview
+from camera import Camera, CAMERA_SEPARATOR, split_per_camera, should_tag_results_by_camera
+from shared_frame_pool import SharedFramePool, SharedFrameReader
+from inference_workers import InferenceWorkerPool
+from metrics import MetricsRegistry
+from latency_scheduler import LatencyScheduler, LEVEL_NORMAL
+from stage_timings import StageTimings, STAGE_CAR_DETECTION, STAGE_LICENSE_PLATE_DETECTION, STAGE_SEGMENTATION, STAGE_OCR, STAGE_VALIDATION
 
 # Load env variables
 load_dotenv()
 DEBUG = os.getenv("DEBUG") == "True"
 WS_PORT = int(os.getenv("WS_PORT"))
+WS_PROTOCOL = os.getenv("WS_PROTOCOL", "legacy").strip().lower()
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "16"))
+WS_RECENT_RESULTS_SIZE = int(os.getenv("WS_RECENT_RESULTS_SIZE", "100"))
+WS_RECENT_RESULTS_MAX_AGE_SECONDS = float(os.getenv("WS_RECENT_RESULTS_MAX_AGE_SECONDS", "3600"))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED") == "True"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8766"))
 RTSP_CAPTURE_CONFIG = os.getenv("RTSP_CAPTURE_CONFIG") 
+RTSP_CAPTURE_CONFIGS = [capture_config.strip() for capture_config in RTSP_CAPTURE_CONFIG.split(CAMERA_SEPARATOR)]
+CAMERA_NAMES = [name or f"camera_{i + 1}" for i, name in enumerate(split_per_camera(os.getenv("CAMERA_NAMES"), len(RTSP_CAPTURE_CONFIGS), "CAMERA_NAMES"))]
+SHOULD_TAG_RESULTS_BY_CAMERA = should_tag_results_by_camera(os.getenv("CAMERA_NAMES"), len(RTSP_CAPTURE_CONFIGS))
+CAPTURE_MODE = os.getenv("CAPTURE_MODE", "read").strip().lower()
+CAPTURE_TARGET_FPS = float(os.getenv("CAPTURE_TARGET_FPS", "0"))
+DEBUG_PREVIEW_FPS = float(os.getenv("DEBUG_PREVIEW_FPS", "5"))
 PURE_YOLO_MODEL_PATH = os.getenv("PURE_YOLO_MODEL_PATH") 
 LICENSE_PLATE_YOLO_MODEL_PATH = os.getenv("LICENSE_PLATE_YOLO_MODEL_PATH") 
+MODEL_RUNTIME = os.getenv("MODEL_RUNTIME", utils.MODEL_RUNTIME_PYTORCH)
+MODEL_WARMUP_RUNS = int(os.getenv("MODEL_WARMUP_RUNS", "1"))
 DB_ENABLED = os.getenv("DB_ENABLED") == "True"
 DB_SERVER = os.getenv("DB_SERVER")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_STORAGE = os.getenv("DB_STORAGE", "mssql")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "1"))
+DB_WRITER_QUEUE_SIZE = int(os.getenv("DB_WRITER_QUEUE_SIZE", "256"))
+DB_WRITER_BATCH_SIZE = int(os.getenv("DB_WRITER_BATCH_SIZE", "50"))
+DB_RETRY_SECONDS = float(os.getenv("DB_RETRY_SECONDS", "10"))
+DB_SPILL_PATH = os.getenv("DB_SPILL_PATH", "./results_spill.jsonl")
 SAVE_RESULTS_ENABLED =  os.getenv("SAVE_RESULTS_ENABLED") == "True"
 RESULTS_PATH = os.getenv("RESULTS_PATH")
+RESULT_JPEG_ENCODER = os.getenv("RESULT_JPEG_ENCODER", "opencv")
+RESULT_JPEG_QUALITY = int(os.getenv("RESULT_JPEG_QUALITY", "75"))
 SHOULD_SEND_SAME_RESULTS = os.getenv("SHOULD_SEND_SAME_RESULTS") == "True"
+SENT_PLATES_HISTORY_MINUTES = float(os.getenv("SENT_PLATES_HISTORY_MINUTES", "5"))
+SENT_PLATES_SIMILARITY_THRESHOLD = float(os.getenv("SENT_PLATES_SIMILARITY_THRESHOLD", "0.8"))
 SHOULD_TRY_LP_CROP=os.getenv("SHOULD_TRY_LP_CROP") == "True"
 MINIMUM_NUMBER_OF_CHARS_FOR_MATCH = int(os.getenv("MINIMUM_NUMBER_OF_CHARS_FOR_MATCH"))
 NUMBER_OF_VALIDATION_ROUNDS = int(os.getenv("NUMBER_OF_VALIDATION_ROUNDS"))
 NUMBER_OF_OCCURRENCES_TO_BE_VALID = int(os.getenv("NUMBER_OF_OCCURRENCES_TO_BE_VALID"))
-SKIP_BEFORE_Y_MAX = float(os.getenv("SKIP_BEFORE_Y_MAX"))
+SKIP_BEFORE_Y_MAX = [float(skip_before_y_max) for skip_before_y_max in split_per_camera(os.getenv("SKIP_BEFORE_Y_MAX"), len(RTSP_CAPTURE_CONFIGS), "SKIP_BEFORE_Y_MAX")]
+SEGMENTATION_MODE = os.getenv("SEGMENTATION_MODE", utils.SEGMENTATION_MODE_ACCURATE).strip().lower()
+CAR_DETECTION_BATCH_SIZE = int(os.getenv("CAR_DETECTION_BATCH_SIZE", "8"))
+CAR_DETECTION_BATCH_WAIT_MS = float(os.getenv("CAR_DETECTION_BATCH_WAIT_MS", "20"))
+LP_DETECTION_BATCH_SIZE = int(os.getenv("LP_DETECTION_BATCH_SIZE", "8"))
+OCR_BACKEND = os.getenv("OCR_BACKEND", "pytesseract")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED") == "True"
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "256"))
+OCR_CACHE_TTL_SECONDS = float(os.getenv("OCR_CACHE_TTL_SECONDS", "10"))
+OCR_CACHE_MAX_DISTANCE = int(os.getenv("OCR_CACHE_MAX_DISTANCE", "8"))
+FRAME_BUFFER_SIZE = int(os.getenv("FRAME_BUFFER_SIZE", "4"))
+MOTION_GATE_ENABLED = os.getenv("MOTION_GATE_ENABLED") == "True"
+MOTION_GATE_REGIONS = [utils.parse_region(region, "MOTION_GATE_REGION") for region in split_per_camera(os.getenv("MOTION_GATE_REGION"), len(RTSP_CAPTURE_CONFIGS), "MOTION_GATE_REGION")]
+MOTION_GATE_DOWNSCALE_WIDTH = int(os.getenv("MOTION_GATE_DOWNSCALE_WIDTH", "160"))
+MOTION_GATE_PIXEL_THRESHOLD = int(os.getenv("MOTION_GATE_PIXEL_THRESHOLD", "25"))
+MOTION_GATE_MIN_CHANGED_RATIO = float(os.getenv("MOTION_GATE_MIN_CHANGED_RATIO", "0.01"))
+MOTION_GATE_HOLD_SECONDS = float(os.getenv("MOTION_GATE_HOLD_SECONDS", "3"))
+MOTION_GATE_KEEP_ALIVE_SECONDS = float(os.getenv("MOTION_GATE_KEEP_ALIVE_SECONDS", "30"))
+VALIDATION_MODE = os.getenv("VALIDATION_MODE", "rounds").strip().lower()
+TRACKER_IOU_THRESHOLD = float(os.getenv("TRACKER_IOU_THRESHOLD", "0.3"))
+TRACKER_MAX_CENTROID_DISTANCE_RATIO = float(os.getenv("TRACKER_MAX_CENTROID_DISTANCE_RATIO", "0.5"))
+TRACKER_MAX_AGE_SECONDS = float(os.getenv("TRACKER_MAX_AGE_SECONDS", "5"))
+TRACKER_MIN_VOTE_SHARE = float(os.getenv("TRACKER_MIN_VOTE_SHARE", "0.5"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+PIPELINE_WORKER_PROCESSES = int(os.getenv("PIPELINE_WORKER_PROCESSES", "0"))
+PIPELINE_SHARED_FRAME_SLOTS = int(os.getenv("PIPELINE_SHARED_FRAME_SLOTS", str(2 * len(RTSP_CAPTURE_CONFIGS) + PIPELINE_WORKER_PROCESSES + 1)))
+LATENCY_BUDGET_MS = float(os.getenv("LATENCY_BUDGET_MS", "0"))
+LATENCY_REDUCED_INFERENCE_SIZE = int(os.getenv("LATENCY_REDUCED_INFERENCE_SIZE", "416"))
+LATENCY_MAX_CARS_PER_FRAME = int(os.getenv("LATENCY_MAX_CARS_PER_FRAME", "1"))
+LATENCY_REDUCED_DETECTION_FPS = float(os.getenv("LATENCY_REDUCED_DETECTION_FPS", "2"))
+LATENCY_RECOVERY_SECONDS = float(os.getenv("LATENCY_RECOVERY_SECONDS", "10"))
+DETECTION_ROI_SCALE = float(os.getenv("DETECTION_ROI_SCALE", "1"))
+DETECTION_ROIS = [DetectionRoi.from_config(region, DETECTION_ROI_SCALE) for region in split_per_camera(os.getenv("DETECTION_ROI"), len(RTSP_CAPTURE_CONFIGS), "DETECTION_ROI")]
+
+# With PIPELINE_WORKER_PROCESSES, this file is loaded by every (spawned) inference worker as well.
+# Models and OCR are loaded only where inference runs, the main process only captures, validates and sends results.
+IS_WORKER_PROCESS = multiprocessing.current_process().name != "MainProcess" # parent_process() isn't set yet while a spawned process loads this file
+IS_INFERENCE_PROCESS = PIPELINE_WORKER_PROCESSES == 0 or IS_WORKER_PROCESS
 
 # Initialize global static variables
-PURE_YOLO_MODEL = YOLO(PURE_YOLO_MODEL_PATH)
-LICENSE_PLATE_YOLO_MODEL = YOLO(LICENSE_PLATE_YOLO_MODEL_PATH)
+PURE_YOLO_MODEL = utils.load_yolo_model(PURE_YOLO_MODEL_PATH, MODEL_RUNTIME) if IS_INFERENCE_PROCESS else None
+LICENSE_PLATE_YOLO_MODEL = utils.load_yolo_model(LICENSE_PLATE_YOLO_MODEL_PATH, MODEL_RUNTIME) if IS_INFERENCE_PROCESS else None
+if IS_INFERENCE_PROCESS:
+    utils.warm_up_yolo_model(PURE_YOLO_MODEL, MODEL_WARMUP_RUNS, CAR_DETECTION_BATCH_SIZE)
+    utils.warm_up_yolo_model(LICENSE_PLATE_YOLO_MODEL, MODEL_WARMUP_RUNS, LP_DETECTION_BATCH_SIZE)
+OCR_ENGINE = ocr_backends.create_ocr_backend(OCR_BACKEND, OCR_WORKERS) if IS_INFERENCE_PROCESS else None
+# License plates of all cameras share the cache, every inference worker process has its own
+OCR_CACHE = LicensePlateReadCache(OCR_CACHE_SIZE, OCR_CACHE_TTL_SECONDS, OCR_CACHE_MAX_DISTANCE) if OCR_CACHE_ENABLED and IS_INFERENCE_PROCESS else None
+# Only the main process measures latency and picks the degradation level, inference workers get the level with every frame and only read its settings
+LATENCY_SCHEDULER = LatencyScheduler(LATENCY_BUDGET_MS / 1000, LATENCY_REDUCED_INFERENCE_SIZE, LATENCY_MAX_CARS_PER_FRAME, LATENCY_REDUCED_DETECTION_FPS, LATENCY_RECOVERY_SECONDS) if LATENCY_BUDGET_MS > 0 else None
+JPEG_ENCODER = create_jpeg_encoder(RESULT_JPEG_ENCODER, RESULT_JPEG_QUALITY)
+# Metrics are served by the main process only, see `Metrics` below for the ones read from stats of the components
+METRICS = MetricsRegistry(METRICS_ENABLED and IS_WORKER_PROCESS is False)
+STAGE_TIMINGS = StageTimings(histogram=METRICS.histogram("alpr_stage_duration_seconds", "Duration of a pipeline stage, segmentation per license plate, other stages per batch of frames", ["stage"]) if METRICS.enabled else None)
+CARS_SKIPPED = METRICS.counter("alpr_cars_skipped_total", "Detections which were not read, by reason (not_a_car, too_far, already_confirmed, load_shedding)", ["camera", "reason"])
+LICENSE_PLATES_READ = METRICS.counter("alpr_license_plates_read_total", "License plates read by OCR, by outcome (read, no_characters, too_short)", ["camera", "outcome"])
+RESULTS_VALIDATED = METRICS.counter("alpr_results_validated_total", "Validated license plates, by outcome (sent, duplicate)", ["camera", "outcome"])
 CAR_RELATED_LABELS = [
     utils.normalize_label('car'), 
     utils.normalize_label('motorcycle'), 
@@ -54,182 +149,644 @@ def _print(string):
     if DEBUG: print(string)
 
 ############ Web socket server ############
-CONNECTED_SOCKETS = []
+BROADCASTER = ResultBroadcaster(WS_PROTOCOL, WS_CLIENT_QUEUE_SIZE, _print, RecentResults(WS_RECENT_RESULTS_SIZE, WS_RECENT_RESULTS_MAX_AGE_SECONDS))
 async def handle_connection(websocket, path):
-    global CONNECTED_SOCKETS
-    CONNECTED_SOCKETS.append(websocket)
+    await websocket.send("echo")
+    BROADCASTER.register(websocket)
     try:
-        await websocket.send("echo")
         async for message in websocket:
-            pass
+            BROADCASTER.handle_message(websocket, message)
     finally:
-        CONNECTED_SOCKETS.remove(websocket)
+        BROADCASTER.unregister(websocket)
 async def run_websocket_server():
     server = await websockets.serve(handle_connection, "", WS_PORT)
     await server.wait_closed()
 
 ############ Video capture ############
-LATEST_FRAME = None
-def run_video_capture():
-    global LATEST_FRAME
+# Every camera has its own capture thread and frame buffer, all buffers set NEW_FRAME_EVENT, so detection can wait for a frame from any camera
+NEW_FRAME_EVENT = threading.Event()
+if len(set(CAMERA_NAMES)) != len(CAMERA_NAMES):
+    raise ValueError(f"CAMERA_NAMES have to be unique, got: {', '.join(CAMERA_NAMES)}")
+CAMERAS = [
+    Camera(
+        CAMERA_NAMES[i],
+        RTSP_CAPTURE_CONFIGS[i],
+        FrameRingBuffer(FRAME_BUFFER_SIZE, NEW_FRAME_EVENT),
+        DETECTION_ROIS[i],
+        MotionGate(MOTION_GATE_REGIONS[i], MOTION_GATE_DOWNSCALE_WIDTH, MOTION_GATE_PIXEL_THRESHOLD, MOTION_GATE_MIN_CHANGED_RATIO, MOTION_GATE_HOLD_SECONDS, MOTION_GATE_KEEP_ALIVE_SECONDS) if MOTION_GATE_ENABLED else None,
+        CarTracker(TRACKER_IOU_THRESHOLD, TRACKER_MAX_CENTROID_DISTANCE_RATIO, TRACKER_MAX_AGE_SECONDS, NUMBER_OF_OCCURRENCES_TO_BE_VALID, TRACKER_MIN_VOTE_SHARE) if VALIDATION_MODE == "tracker" else None, # workers don't track, they only match car boxes against tracks of the main process (see `run_inference_worker`)
+        SKIP_BEFORE_Y_MAX[i],
+        SentLicensePlatesHistory(SENT_PLATES_HISTORY_MINUTES * 60, SENT_PLATES_SIMILARITY_THRESHOLD),
+    )
+    for i in range(len(RTSP_CAPTURE_CONFIGS))
+]
+# With PIPELINE_WORKER_PROCESSES, frames are decoded straight into SHARED_FRAME_POOL instead of the frame buffers of cameras
+SHARED_FRAME_POOL = SharedFramePool(PIPELINE_SHARED_FRAME_SLOTS, len(CAMERAS)) if PIPELINE_WORKER_PROCESSES > 0 and IS_WORKER_PROCESS is False else None
+DEBUG_PREVIEW = DebugPreview(DEBUG_PREVIEW_FPS)
+
+# Returns (able to read frame, frame), frame is None if it was only grabbed (see CAPTURE_MODE).
+# If output is passed, the frame is decoded into it (as long as its shape matches), instead of a newly allocated array.
+def read_frame(capture: cv2.VideoCapture, should_decode: bool, output: np.ndarray = None) -> (bool, np.ndarray):
+    if CAPTURE_MODE == "grab":
+        if capture.grab() is False:
+            return (False, None)
+        if should_decode is False:
+            return (True, None)
+        return capture.retrieve(output)
+    return capture.read(output)
+
+# Errors which stop the whole server, the main thread waits for them
+FATAL_ERRORS = queue.Queue()
+
+def run_video_capture(camera_index: int):
+    if CAPTURE_MODE not in ["read", "grab"]:
+        FATAL_ERRORS.put(ValueError(f"Unknown capture mode \"{CAPTURE_MODE}\", choose one of: read, grab"))
+        return
+    if DEBUG:
+        DEBUG_PREVIEW.start()
+    camera = CAMERAS[camera_index]
+    frame_buffer = camera.frame_buffer
+    capture_stats = camera.capture_stats
+    frame_shape = None # known after the first frame, lets following frames be decoded straight into SHARED_FRAME_POOL
+    next_retrieve_at = 0
     while True:
-        capture = cv2.VideoCapture(RTSP_CAPTURE_CONFIG)
+        capture = cv2.VideoCapture(camera.capture_config)
         if capture.isOpened() is False:
-            _print("Unable to connect to video capture. Will try again after 5 seconds...")
-            LATEST_FRAME = None
+            _print(f"[{camera.name}] Unable to connect to video capture. Will try again after 5 seconds...")
+            frame_buffer.clear()
             time.sleep(5)
             continue
 
         while(capture.isOpened()):
-            able_to_read_frame, frame = capture.read()
+            # "grab" => every frame is grabbed (so the stream never lags behind), but converted to BGR only when the detection asks for a new frame,
+            # or when it's time for the next frame at CAPTURE_TARGET_FPS. Frames nobody is going to look at are never retrieved.
+            now = time.monotonic()
+            is_frame_requested = frame_buffer.is_frame_requested() if SHARED_FRAME_POOL is None else SHARED_FRAME_POOL.is_frame_requested(camera_index)
+            should_decode = CAPTURE_MODE == "read" or is_frame_requested or (CAPTURE_TARGET_FPS > 0 and now >= next_retrieve_at)
+            slot_index = None
+            if SHARED_FRAME_POOL is not None and should_decode:
+                slot_index = SHARED_FRAME_POOL.acquire()
+                # All slots are taken (workers can't keep up), there's nowhere to decode the frame into
+                should_decode = slot_index is not None or CAPTURE_MODE == "read"
+            output = SHARED_FRAME_POOL.frame_view(slot_index, frame_shape) if slot_index is not None and frame_shape is not None else None
+
+            able_to_read_frame, frame = read_frame(capture, should_decode, output)
             if able_to_read_frame is False:
-                _print("Could not read frame from video capture, reconnecting...")
-                LATEST_FRAME = None
+                if slot_index is not None:
+                    SHARED_FRAME_POOL.release(slot_index)
+                _print(f"[{camera.name}] Could not read frame from video capture, reconnecting...")
+                frame_buffer.clear()
                 break
+            capture_stats["grabbed"] += 1
+            if frame is None:
+                continue
+            capture_stats["decoded"] += 1
+            try:
+                camera.check_frame_shape(frame.shape)
+            except ValueError as error:
+                # Wrong MOTION_GATE_REGION / DETECTION_ROI can't be fixed by reconnecting, the whole server stops (see __main__), instead of running on without this camera
+                if slot_index is not None:
+                    SHARED_FRAME_POOL.release(slot_index)
+                capture.release()
+                FATAL_ERRORS.put(error)
+                return
+            if CAPTURE_MODE == "grab":
+                next_retrieve_at = now + (1 / CAPTURE_TARGET_FPS if CAPTURE_TARGET_FPS > 0 else 0)
+
+            if SHARED_FRAME_POOL is None:
+                if DEBUG:
+                    DEBUG_PREVIEW.show(frame, camera.name)
+                # Raw BGR frame, it is used as is (no color conversion) by the whole pipeline
+                frame_buffer.put(frame)
+                continue
 
+            if slot_index is None:
+                continue
+            if output is None or np.shares_memory(frame, output) is False:
+                # First frame (or resolution of the capture changed), decoded into a new array, so it has to be copied into the slot once
+                frame_shape = frame.shape
+                output = SHARED_FRAME_POOL.frame_view(slot_index, frame_shape)
+                output[...] = frame
             if DEBUG:
-                cv2.startWindowThread()
-                cv2.namedWindow("frame")
-                cv2.imshow("frame", cv2.resize(frame, (750, 750)))
-                cv2.waitKey(20)
-
-            LATEST_FRAME = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB).astype(np.uint8))
+                DEBUG_PREVIEW.show(output.copy(), camera.name) # the slot gets overwritten once the frame is processed
+            SHARED_FRAME_POOL.publish(camera_index, slot_index, frame_shape)
 
         capture.release()
 
 ############ Detection ############
-# [(Image, Image, str)] => array of (car image, license plate image, license plate as string)
-def detect_license_plates_from_frame(captured_frame: Image) -> [(Image, Image, str)]:
-    number_of_yolo_boxes, yolo_boxes = utils.detect_with_yolo(PURE_YOLO_MODEL, captured_frame, DEBUG)
-    if number_of_yolo_boxes == 0:
-        _print("No images of cars found")
+# Images stay BGR numpy arrays (as captured) all the way to OCR, car images are views into the captured frame, not copies.
+# frames_of_cameras => [(Camera, np.ndarray)] => array of (camera, captured frame), at most one frame per camera
+# Frames of all cameras go through the car model together (in batches of CAR_DETECTION_BATCH_SIZE), instead of one predict() per frame.
+# Returns cars to read for each frame, in the same order, see `select_cars_to_read`
+# now => time.monotonic() of the frames by default, the replay benchmark passes time of the frames in the video instead
+# inference_size, max_cars_per_frame => see `get_degraded_settings`
+def detect_cars_from_frames(frames_of_cameras: [(Camera, np.ndarray)], now: float = None, inference_size: int = None, max_cars_per_frame: int = None) -> [[(int, np.ndarray, float, CarTrack)]]:
+    cars_to_read_of_frames = []
+    for ((camera, captured_frame), cars_found) in zip(frames_of_cameras, find_cars_in_frames(frames_of_cameras, inference_size)):
+        car_tracks = camera.car_tracker.update([car_box for _, car_box in cars_found], now) if camera.car_tracker is not None else [None] * len(cars_found)
+        cars_to_read = select_cars_to_read(captured_frame, cars_found, car_tracks)
+        if len(cars_to_read) < len(cars_found):
+            CARS_SKIPPED.inc(len(cars_found) - len(cars_to_read), (camera.name, "already_confirmed"))
+        cars_to_read_of_frames.append(cap_cars_to_read(camera, cars_to_read, max_cars_per_frame))
+    return cars_to_read_of_frames
+
+# Returns cars found in each frame, in the same order, [(int, (float, float, float, float))] => array of (car index, car box (x_min, y_min, x_max, y_max) in pixels of the captured frame)
+# inference_size => see `get_degraded_settings`
+def find_cars_in_frames(frames_of_cameras: [(Camera, np.ndarray)], inference_size: int = None) -> [[(int, (float, float, float, float))]]:
+    # Pixels outside of the ROI are irrelevant, so they don't even go through the model
+    detection_frames = [captured_frame if camera.detection_roi is None else camera.detection_roi.apply(captured_frame) for camera, captured_frame in frames_of_cameras]
+    with STAGE_TIMINGS.measure(STAGE_CAR_DETECTION):
+        car_detections = utils.detect_with_yolo_batched(PURE_YOLO_MODEL, detection_frames, DEBUG, CAR_DETECTION_BATCH_SIZE, inference_size)
+    return [find_cars(camera, yolo_boxes) for ((camera, _), (_, yolo_boxes)) in zip(frames_of_cameras, car_detections)]
+
+def find_cars(camera: Camera, yolo_boxes: any) -> [(int, (float, float, float, float))]:
+    if len(yolo_boxes) == 0:
+        _print(f"[{camera.name}] No images of cars found")
         return []
 
-    license_plates_recognized = []
-    utils.prepare_env_for_reading_license_plates(DEBUG)
+    cars_found = [] # [(int, (float, float, float, float))] => array of (car index, car box)
     for (i, car_box) in enumerate(yolo_boxes):
         box_label = utils.normalize_label(
             PURE_YOLO_MODEL.names[int(car_box.cls)]
         )
         if box_label not in CAR_RELATED_LABELS:
             _print(f"Found label \"{box_label}\", however it's not in CAR_RELATED_LABELS, skipping")
+            CARS_SKIPPED.inc(label_values=(camera.name, "not_a_car"))
             continue
 
         x_min, y_min, x_max, y_max = car_box.xyxy.cpu().detach().numpy()[0]
-        if y_max < SKIP_BEFORE_Y_MAX:
-            _print(f"Found car, however it's too far \"{y_max}\" (req \"{SKIP_BEFORE_Y_MAX}\"), skipping")
+        if camera.detection_roi is not None:
+            x_min, y_min, x_max, y_max = camera.detection_roi.to_frame_coordinates(x_min, y_min, x_max, y_max)
+        if y_max < camera.skip_before_y_max:
+            _print(f"Found car, however it's too far \"{y_max}\" (req \"{camera.skip_before_y_max}\"), skipping")
+            CARS_SKIPPED.inc(label_values=(camera.name, "too_far"))
             continue
+        cars_found.append((i, (x_min, y_min, x_max, y_max)))
+    return cars_found
+
+# [(int, np.ndarray, float, CarTrack)] => array of (car index, car image, y_max, track of the car (None if the camera doesn't use car_tracker))
+# Cars whose track already has a confirmed license plate are not returned (no reason to read them again)
+def select_cars_to_read(captured_frame: np.ndarray, cars_found: [(int, (float, float, float, float))], car_tracks: list[CarTrack]) -> [(int, np.ndarray, float, CarTrack)]:
+    cars_to_read = [] # [(int, np.ndarray, float, CarTrack)] => array of (car index, car image, y_max, track of the car)
+    for ((i, (x_min, y_min, x_max, y_max)), car_track) in zip(cars_found, car_tracks):
+        if isinstance(car_track, CarTrack) and car_track.confirmed_license_plate is not None:
+            _print(f"Car {i} (track {car_track.track_id}) already has confirmed license plate \"{car_track.confirmed_license_plate}\", skipping")
+            continue
+
+        car_image = utils.crop_box(captured_frame, (x_min, y_min, x_max, y_max))
+        cars_to_read.append((i, car_image, y_max, car_track))
+
+    return cars_to_read
 
-        car_image = captured_frame.crop((x_min, y_min, x_max, y_max))
-        if DEBUG:
-            car_image.save(utils.gen_intermediate_file_name(f"cropped_car", "jpg", i))
+# With LATENCY_BUDGET_MS, under load only the closest cars (the lowest bottom edge in the frame, like SKIP_BEFORE_Y_MAX) of a frame get their license plates read
+def cap_cars_to_read(camera: Camera, cars_to_read: [(int, np.ndarray, float, CarTrack)], max_cars_per_frame: int) -> [(int, np.ndarray, float, CarTrack)]:
+    if max_cars_per_frame is None or len(cars_to_read) <= max_cars_per_frame:
+        return cars_to_read
+    CARS_SKIPPED.inc(len(cars_to_read) - max_cars_per_frame, (camera.name, "load_shedding"))
+    return sorted(cars_to_read, key=lambda car: car[2], reverse=True)[:max_cars_per_frame]
 
-        number_of_license_plate_boxes_found, license_plates_as_boxes = utils.detect_with_yolo(LICENSE_PLATE_YOLO_MODEL, car_image, DEBUG)
+# Debug files of multiple cameras would overwrite each other
+def _intermediate_file_id(camera: Camera, identifier: str) -> str:
+    return identifier if len(CAMERAS) == 1 else f"{camera.name}_{identifier}"
+
+# cars_to_read_of_cameras => [(Camera, [(int, np.ndarray, float, CarTrack)])] => array of (camera, cars to read of its frame)
+# Returns [(Camera, [Recognition])] => array of (camera, license plates read from its cars), in the same order
+# now, inference_size => see `detect_cars_from_frames`
+def read_license_plates_of_cars(cars_to_read_of_cameras: [(Camera, [(int, np.ndarray, float, CarTrack)])], now: float = None, inference_size: int = None) -> [(Camera, [Recognition])]:
+    license_plates_recognized_of_cameras = [(camera, []) for camera, _ in cars_to_read_of_cameras]
+    cars_to_read = [(k, camera, car) for k, (camera, cars) in enumerate(cars_to_read_of_cameras) for car in cars] # cars of all cameras, k => index of the camera's frame
+    utils.prepare_env_for_reading_license_plates(DEBUG)
+    if DEBUG:
+        for _, camera, (i, car_image, _, _) in cars_to_read:
+            cv2.imwrite(utils.gen_intermediate_file_name(f"cropped_car", "jpg", _intermediate_file_id(camera, i)), car_image)
+
+    # All cars of all frames go through the license plate model together, instead of one predict() per car
+    with STAGE_TIMINGS.measure(STAGE_LICENSE_PLATE_DETECTION):
+        license_plate_detections = utils.detect_with_yolo_batched(LICENSE_PLATE_YOLO_MODEL, [car_image for _, _, (_, car_image, _, _) in cars_to_read], DEBUG, LP_DETECTION_BATCH_SIZE, inference_size)
+    license_plates_to_read = [] # [(int, int, int, np.ndarray, (float, float, float, float), CarTrack, np.ndarray, [np.ndarray], np.ndarray, str)] => array of (camera index, car index, result index, car image, license plate box, track of the car, license plate image, letter images, hash of the license plate image, cached license plate as string)
+    for ((k, camera, (i, car_image, _, car_track)), (number_of_license_plate_boxes_found, license_plates_as_boxes)) in zip(cars_to_read, license_plate_detections):
         if number_of_license_plate_boxes_found == 0:
             continue
 
         for (j, license_plate_box) in enumerate(license_plates_as_boxes):
-            license_plate_image, license_plate_as_string = utils.read_license_plate(f"{i}_{j}", license_plate_box, car_image, 500, 20, DEBUG, SHOULD_TRY_LP_CROP, MINIMUM_NUMBER_OF_CHARS_FOR_MATCH)
-            if license_plate_as_string == "":
-                _print(f"Car {i} ; Result {j}, unable to find any characters of detected license plate")
-                continue
-            if len(license_plate_as_string) < MINIMUM_NUMBER_OF_CHARS_FOR_MATCH:
-                _print(f"Found license plate {license_plate_as_string}, but it's shorter than {MINIMUM_NUMBER_OF_CHARS_FOR_MATCH}")
-                continue
+            with STAGE_TIMINGS.measure(STAGE_SEGMENTATION):
+                unique_identifier = _intermediate_file_id(camera, f"{i}_{j}")
+                license_plate_box = utils.get_box_coordinates(license_plate_box)
+                license_plate_image = utils.crop_license_plate_box(license_plate_box, car_image, 500, SHOULD_TRY_LP_CROP, SEGMENTATION_MODE)
+                if DEBUG:
+                    cv2.imwrite(utils.gen_intermediate_file_name("cropped_license_plate_full", "jpg", unique_identifier), license_plate_image)
+                # A near-identical license plate image read recently (eg. a car waiting at the gate) isn't segmented nor read again
+                license_plate_hash = compute_license_plate_hash(license_plate_image) if OCR_CACHE is not None else None
+                cached_license_plate_as_string = OCR_CACHE.get(license_plate_hash, now) if OCR_CACHE is not None else None
+                letter_images = utils.segment_cropped_license_plate(unique_identifier, license_plate_image, 500, 20, DEBUG, MINIMUM_NUMBER_OF_CHARS_FOR_MATCH, SEGMENTATION_MODE) if cached_license_plate_as_string is None else []
+            license_plates_to_read.append((k, i, j, car_image, license_plate_box, car_track, license_plate_image, letter_images, license_plate_hash, cached_license_plate_as_string))
+
+    # Letters of every license plate of all frames (except the cached ones) are read by the OCR engine in one call
+    with STAGE_TIMINGS.measure(STAGE_OCR):
+        license_plates_read_by_ocr = iter(utils.read_letters_of_license_plates(OCR_ENGINE, [letter_images for _, _, _, _, _, _, _, letter_images, _, cached_license_plate_as_string in license_plates_to_read if cached_license_plate_as_string is None], DEBUG))
+    license_plates_as_strings = []
+    for (_, _, _, _, _, _, _, _, license_plate_hash, cached_license_plate_as_string) in license_plates_to_read:
+        if cached_license_plate_as_string is not None:
+            license_plates_as_strings.append(cached_license_plate_as_string)
+            continue
+        license_plate_as_string = next(license_plates_read_by_ocr)
+        if OCR_CACHE is not None:
+            OCR_CACHE.put(license_plate_hash, license_plate_as_string, now)
+        license_plates_as_strings.append(license_plate_as_string)
+
+    for ((k, i, j, car_image, license_plate_box, car_track, license_plate_image, _, _, cached_license_plate_as_string), license_plate_as_string) in zip(license_plates_to_read, license_plates_as_strings):
+        camera, license_plates_recognized = license_plates_recognized_of_cameras[k]
+        if license_plate_as_string == "":
+            _print(f"[{camera.name}] Car {i} ; Result {j}, unable to find any characters of detected license plate")
+            LICENSE_PLATES_READ.inc(label_values=(camera.name, "no_characters"))
+            continue
+        if len(license_plate_as_string) < MINIMUM_NUMBER_OF_CHARS_FOR_MATCH:
+            _print(f"[{camera.name}] Found license plate {license_plate_as_string}, but it's shorter than {MINIMUM_NUMBER_OF_CHARS_FOR_MATCH}")
+            LICENSE_PLATES_READ.inc(label_values=(camera.name, "too_short"))
+            continue
 
-            _print(y_max)
-            _print(f"Found license plate {license_plate_as_string}")
-            license_plates_recognized.append((car_image, license_plate_image, license_plate_as_string))
-
-    return license_plates_recognized
-
-# any => Image (it cannot be used as type)
-def validate_results_between_rounds(recognitions_between_rounds: list[list[(any, any, str)]], number_of_occurrences_to_be_valid: int):
-    license_plate_counts = {}
-    for recognitions in recognitions_between_rounds:
-        for _, _, license_plate_as_string in recognitions:
-            if license_plate_as_string in license_plate_counts:
-                license_plate_counts[license_plate_as_string] += 1
-            else:
-                license_plate_counts[license_plate_as_string] = 1
-    
+        _print(f"[{camera.name}] Found license plate {license_plate_as_string}")
+        LICENSE_PLATES_READ.inc(label_values=(camera.name, "read"))
+        # The license plate image isn't kept, only its box, see `materialize_recognition`
+        license_plates_recognized.append(Recognition(license_plate_as_string, car_image, license_plate_box, compute_sharpness(license_plate_image), car_track, cached_license_plate_as_string is not None))
+
+    return license_plates_recognized_of_cameras
+
+# frames_of_cameras => [(Camera, np.ndarray)] => array of (camera, captured frame)
+# Returns [(Camera, [Recognition])] => array of (camera, license plates read from its frame)
+def detect_license_plates_from_frames(frames_of_cameras: [(Camera, np.ndarray)]) -> [(Camera, [Recognition])]:
+    cars_to_read_of_cameras = [(camera, cars_to_read) for ((camera, _), cars_to_read) in zip(frames_of_cameras, detect_cars_from_frames(frames_of_cameras))]
+    return read_license_plates_of_cars(cars_to_read_of_cameras)
+
+# Returns the best recognition of every license plate read at least number_of_occurrences_to_be_valid times inside of the window
+def validate_results_between_rounds(recognition_rounds: RecognitionRounds, number_of_occurrences_to_be_valid: int) -> [Recognition]:
     validated_recognitions = []
-    for license_plate, times_found in license_plate_counts.items():
+    for license_plate, times_found in recognition_rounds.count_license_plates().items():
         if times_found < number_of_occurrences_to_be_valid:
             continue
-        
-        should_break_recognitions_loop = False
-        for recognitions in recognitions_between_rounds:
-            if should_break_recognitions_loop: break
-            for recognized_car_image, recognized_license_plate_image, recognized_license_plate_as_string in recognitions:
-                if should_break_recognitions_loop: break
-                if license_plate == recognized_license_plate_as_string:
-                    validated_recognitions.append((recognized_car_image, recognized_license_plate_image, recognized_license_plate_as_string))
-                    should_break_recognitions_loop = True
+        validated_recognitions.append(recognition_rounds.best_recognitions[license_plate])
+    return validated_recognitions
 
+# Votes of every recognition are added to the track of its car, results are emitted as soon as a track gets confirmed (once per track)
+# Returns the best recognition of the confirmed license plate of every track confirmed by these recognitions
+def validate_results_with_tracker(car_tracker: CarTracker, license_plates_recognized: list[Recognition]) -> [Recognition]:
+    validated_recognitions = []
+    for recognition in license_plates_recognized:
+        if car_tracker.add_vote(recognition.car_track, recognition):
+            validated_recognitions.append(recognition.car_track.recognitions[recognition.car_track.confirmed_license_plate])
     return validated_recognitions
 
-async def run_detection():
-    recognitions_between_rounds = []
-    license_plates_sent_history = []
-    while True:
-        await asyncio.sleep(0.01) # Checkup on websocket server task
-        if LATEST_FRAME is None:
-            _print("LATEST_FRAME is None, nothing to do, sleeping for 1 second...")
-            time.sleep(1)
+# Pixels of a recognition exist only once it passed validation.
+# Returns (car image, license plate image), the license plate image is cropped out of the car image the same way it was for OCR
+def materialize_recognition(recognition: Recognition) -> (np.ndarray, np.ndarray):
+    return (recognition.car_image, utils.crop_license_plate_box(recognition.license_plate_box, recognition.car_image, 500, SHOULD_TRY_LP_CROP, SEGMENTATION_MODE))
+
+############ Pipeline ############
+# Capture (one per camera) => frame buffers => car detection stage => CARS_TO_READ_QUEUE => license plate reading stage => RESULTS_QUEUE => publisher
+# Both detection stages run in their own threads and are shared by all cameras, the asyncio loop (websocket server + publisher) only does I/O.
+CARS_TO_READ_QUEUE = PipelineQueue("cars_to_read", PIPELINE_QUEUE_SIZE)
+RESULTS_QUEUE = PipelineQueue("results", PIPELINE_QUEUE_SIZE)
+
+def get_pipeline_queue_depths() -> dict:
+    return get_queue_depths([CARS_TO_READ_QUEUE, RESULTS_QUEUE])
+
+############ Latency budget ############
+# With LATENCY_BUDGET_MS, time from capturing a frame until its license plates are read is measured, and once it's over the budget, the pipeline degrades step by step
+# (smaller inference size => fewer cars read per frame => fewer frames detected), see LatencyScheduler
+def get_degradation_level() -> int:
+    return LATENCY_SCHEDULER.get_level() if LATENCY_SCHEDULER is not None else LEVEL_NORMAL
+
+# Returns (image size both models run on, maximum number of cars to read per frame) of a degradation level, None => not limited
+def get_degraded_settings(level: int) -> (int, int):
+    if LATENCY_SCHEDULER is None:
+        return (None, None)
+    return (LATENCY_SCHEDULER.get_inference_size(level), LATENCY_SCHEDULER.get_max_cars_per_frame(level))
+
+# Frames are taken for detection at most once per the detection interval of the level (divided between `number_of_frames` frames taken at once)
+def wait_for_detection_interval(level: int, last_detection_at: float, number_of_frames: int = 1):
+    if LATENCY_SCHEDULER is not None:
+        time.sleep(max(last_detection_at + LATENCY_SCHEDULER.get_detection_interval(level) / number_of_frames - time.monotonic(), 0))
+
+# stage => name of the stage, its cost is only reported (stats, see `register_metrics`)
+def record_stage_cost(stage: str, started_at: float):
+    if LATENCY_SCHEDULER is not None:
+        LATENCY_SCHEDULER.record_stage(stage, time.monotonic() - started_at)
+
+# captured_at => time.monotonic() when the (oldest) frame, which is now done with, was captured
+def record_end_to_end_latency(captured_at: float):
+    if LATENCY_SCHEDULER is not None:
+        LATENCY_SCHEDULER.record_latency(time.monotonic() - captured_at)
+
+# Takes the latest unprocessed frame of every camera which has one, so a single predict() covers all cameras.
+# Returns (frames of cameras, cameras which didn't have a new frame)
+def take_new_frames_of_cameras(cameras: list[Camera]) -> ([(Camera, np.ndarray)], list[Camera]):
+    frames_of_cameras = []
+    cameras_without_frame = []
+    for camera in cameras:
+        # Skips frames which were already processed
+        raw_frame = camera.take_new_frame()
+        if raw_frame is None:
+            cameras_without_frame.append(camera)
             continue
-
-        license_plates_recognized = detect_license_plates_from_frame(LATEST_FRAME.copy())
-        if len(license_plates_recognized) == 0:
+        # Nothing is moving in front of the camera, no reason to run inference
+        if camera.motion_gate is not None and camera.motion_gate.should_run_inference(raw_frame) is False:
             continue
+        frames_of_cameras.append((camera, raw_frame))
+    return (frames_of_cameras, cameras_without_frame)
+
+# Cameras aren't in sync, once a frame of any camera is there, frames of the other (connected) cameras are waited for up to CAR_DETECTION_BATCH_WAIT_MS,
+# so they go through the model in the same predict(), instead of one right after another
+def wait_for_frames_of_cameras() -> [(Camera, np.ndarray)]:
+    NEW_FRAME_EVENT.clear()
+    frames_of_cameras, cameras_without_frame = take_new_frames_of_cameras(CAMERAS)
+    if len(frames_of_cameras) == 0:
+        if NEW_FRAME_EVENT.wait(timeout=1) is False and all(camera.frame_buffer.is_empty() for camera in CAMERAS):
+            _print("All frame buffers are empty, nothing to do, waiting for frames...")
+        return []
 
-        recognitions_between_rounds.append(license_plates_recognized)
-        if len(recognitions_between_rounds) != NUMBER_OF_VALIDATION_ROUNDS:
+    wait_until = time.monotonic() + CAR_DETECTION_BATCH_WAIT_MS / 1000
+    cameras_without_frame = [camera for camera in cameras_without_frame if camera.frame_buffer.is_empty() is False]
+    while len(cameras_without_frame) > 0 and time.monotonic() < wait_until:
+        NEW_FRAME_EVENT.clear()
+        new_frames_of_cameras, cameras_without_frame = take_new_frames_of_cameras(cameras_without_frame)
+        frames_of_cameras.extend(new_frames_of_cameras)
+        if len(cameras_without_frame) > 0:
+            NEW_FRAME_EVENT.wait(timeout=max(wait_until - time.monotonic(), 0))
+    return frames_of_cameras
+
+def run_car_detection_stage():
+    number_of_batches = 0
+    last_detection_at = 0
+    while True:
+        level = get_degradation_level()
+        wait_for_detection_interval(level, last_detection_at)
+        frames_of_cameras = wait_for_frames_of_cameras()
+        if len(frames_of_cameras) == 0:
             continue
-        
-        validated_results = validate_results_between_rounds(recognitions_between_rounds, NUMBER_OF_OCCURRENCES_TO_BE_VALID)
-        if len(validated_results) == 0:
-            if recognitions_between_rounds != []:
-                recognitions_between_rounds.pop(0)
+        last_detection_at = time.monotonic()
+        captured_at = min(camera.last_frame_captured_at for camera, _ in frames_of_cameras)
+
+        number_of_batches += 1
+        if number_of_batches % 100 == 0:
+            for camera in CAMERAS:
+                _print(f"[{camera.name}] Camera stats: {camera.get_stats()}")
+            _print(f"Pipeline queue depths: {get_pipeline_queue_depths()}")
+            _print(f"Broadcast stats: {BROADCASTER.get_stats()}")
+            _print(f"Result writer stats: {RESULT_WRITER.get_stats()}")
+            if OCR_CACHE is not None:
+                _print(f"OCR cache stats: {OCR_CACHE.get_stats()}")
+            if LATENCY_SCHEDULER is not None:
+                _print(f"Latency scheduler stats: {LATENCY_SCHEDULER.get_stats()}")
+
+        inference_size, max_cars_per_frame = get_degraded_settings(level)
+        cars_to_read_of_cameras = [(camera, cars_to_read) for ((camera, _), cars_to_read) in zip(frames_of_cameras, detect_cars_from_frames(frames_of_cameras, None, inference_size, max_cars_per_frame)) if len(cars_to_read) > 0]
+        record_stage_cost("car_detection", last_detection_at)
+        if len(cars_to_read_of_cameras) == 0:
+            record_end_to_end_latency(captured_at)
             continue
-            
-        _print("Sending results: ")
+
+        # If reading license plates can't keep up, only the freshest cars are worth reading
+        CARS_TO_READ_QUEUE.put_dropping_oldest((captured_at, inference_size, cars_to_read_of_cameras))
+
+def run_license_plate_reading_stage():
+    while True:
+        captured_at, inference_size, cars_to_read_of_cameras = CARS_TO_READ_QUEUE.get()
+        started_at = time.monotonic()
+        for camera, license_plates_recognized in read_license_plates_of_cars(cars_to_read_of_cameras, None, inference_size):
+            if len(license_plates_recognized) > 0:
+                publish_validated_results(camera, license_plates_recognized)
+        record_stage_cost("license_plate_reading", started_at)
+        record_end_to_end_latency(captured_at)
+
+# Validation and sent license plates are kept per camera.
+# Returns [(np.ndarray, np.ndarray, str)] => array of (car image, license plate image, license plate as string) which are valid and weren't sent yet
+# Only these get their pixels materialized, see `materialize_recognition`
+# now => see `detect_cars_from_frames`
+def select_results_to_send(camera: Camera, license_plates_recognized: list[Recognition], now: float = None) -> [(np.ndarray, np.ndarray, str)]:
+    with STAGE_TIMINGS.measure(STAGE_VALIDATION):
+        if camera.car_tracker is not None:
+            validated_results = validate_results_with_tracker(camera.car_tracker, license_plates_recognized)
+            if len(validated_results) == 0:
+                return []
+        else:
+            camera.recognitions_between_rounds.append(license_plates_recognized)
+            if len(camera.recognitions_between_rounds) != NUMBER_OF_VALIDATION_ROUNDS:
+                return []
+
+            validated_results = validate_results_between_rounds(camera.recognitions_between_rounds, NUMBER_OF_OCCURRENCES_TO_BE_VALID)
+            if len(validated_results) == 0:
+                camera.recognitions_between_rounds.pop_oldest()
+                return []
+
+        _print(f"[{camera.name}] Sending results: ")
         _print(validated_results)
-        license_plates_sent_history = [s for s in license_plates_sent_history if datetime.now() - s[1] <= timedelta(minutes=5)]
-        for res in validated_results:
-            car_image_raw = res[0]
-            license_plate_image_raw = res[1]
-            license_plate_as_string = str(res[2]) # just to make sure it's string
+        results_to_send = []
+        for recognition in validated_results:
+            license_plate_as_string = str(recognition.license_plate) # just to make sure it's string
             license_plate_as_string = license_plate_as_string[:3] + " " + license_plate_as_string[3:]
-            
-            if SHOULD_SEND_SAME_RESULTS == False and any((s[0] == license_plate_as_string or SequenceMatcher(None, s[0], license_plate_as_string).ratio() > 0.8) for s in license_plates_sent_history):
-                _print(f"Already sent this license plate... Skipping (\"{license_plate_as_string}\")")
-                continue
-            license_plates_sent_history.append((license_plate_as_string, datetime.now()))
 
-            car_image = utils.img_to_bytes(car_image_raw)
-            license_plate_image = utils.img_to_bytes(license_plate_image_raw)
-            license_plate_uuid = str(uuid.uuid4())
-            license_plate_formated_string = license_plate_as_string + " => " + license_plate_uuid
-            for socket in CONNECTED_SOCKETS:
-                try:
-                    await socket.send(car_image)
-                    await socket.send(license_plate_image)
-                    await socket.send(license_plate_formated_string)
-                except:
-                    _print("Socket closed before or while the server was sending a response.")
+            if SHOULD_SEND_SAME_RESULTS == False and camera.sent_plates_history.is_duplicate(license_plate_as_string, now):
+                _print(f"[{camera.name}] Already sent this license plate... Skipping (\"{license_plate_as_string}\")")
+                RESULTS_VALIDATED.inc(label_values=(camera.name, "duplicate"))
+                continue
+            camera.sent_plates_history.add(license_plate_as_string, now)
+            RESULTS_VALIDATED.inc(label_values=(camera.name, "sent"))
+            car_image_raw, license_plate_image_raw = materialize_recognition(recognition)
+            results_to_send.append((car_image_raw, license_plate_image_raw, license_plate_as_string))
+
+        camera.recognitions_between_rounds.clear()
+        return results_to_send
+
+def publish_validated_results(camera: Camera, license_plates_recognized: list[Recognition]):
+    for car_image_raw, license_plate_image_raw, license_plate_as_string in select_results_to_send(camera, license_plates_recognized):
+        # Crops are encoded only once, the same bytes get sent and saved
+        result_artifact = ResultArtifact.create(JPEG_ENCODER, str(uuid.uuid4()), license_plate_as_string, car_image_raw, license_plate_image_raw, camera.name if SHOULD_TAG_RESULTS_BY_CAMERA else None)
+        # Results must not get lost, if the publisher is behind, wait for it
+        RESULTS_QUEUE.put(EncodedResult(result_artifact.car_image_jpeg, result_artifact.license_plate_image_jpeg, result_artifact.get_text(), result_artifact.record.car_id, result_artifact.record.captured_at.timestamp()))
+        RESULT_WRITER.submit(result_artifact.record, result_artifact.car_image_jpeg, result_artifact.license_plate_image_jpeg)
+
+############ Inference worker processes ############
+# With PIPELINE_WORKER_PROCESSES: captures => SHARED_FRAME_POOL => dispatch stage => worker processes (car detection + license plate reading) => worker results stage (validation) => RESULTS_QUEUE => publisher
+# Only the index of the frame slot goes to the worker, the frame itself stays in shared memory.
+# Tracks live in the main process, every task carries boxes of the camera's tracks (see `CarTracker.get_track_boxes`), so workers skip cars
+# with already confirmed license plates the same way `detect_cars_from_frames` does, and the main process updates the tracks with the car boxes the worker returned.
+
+# Runs inside worker process, task => (slot index, shared memory name, frame shape, camera index, sequence number, captured_at, degradation level, track boxes (None without car_tracker))
+# Result => (slot index, camera index, sequence number, captured_at, seconds the worker spent on the frame, car boxes, number of cars skipped because of confirmed license plates, [Recognition] => license plates read, car_track of every recognition is index of the car in car boxes)
+def run_inference_worker(worker_id: int, task_queue: multiprocessing.Queue, result_queue: multiprocessing.Queue):
+    frame_reader = SharedFrameReader()
+    result_queue.put((worker_id, None)) # ready
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        slot_index, slot_name, frame_shape, camera_index, sequence_number, captured_at, level, track_boxes = task
+        started_at = time.monotonic()
+        camera = CAMERAS[camera_index]
+        cars_found = []
+        number_of_confirmed_cars = 0
+        license_plates_recognized = []
+        try:
+            inference_size, max_cars_per_frame = get_degraded_settings(level)
+            captured_frame = frame_reader.frame_view(slot_name, frame_shape)
+            cars_found = find_cars_in_frames([(camera, captured_frame)], inference_size)[0]
+            is_confirmed = camera.car_tracker.match_confirmed([car_box for _, car_box in cars_found], track_boxes) if track_boxes is not None else [False] * len(cars_found)
+            # Index of the car takes the place of its track, so the main process can pair recognitions with tracks
+            car_indexes = [car_index for car_index in range(len(cars_found)) if is_confirmed[car_index] is False]
+            number_of_confirmed_cars = len(cars_found) - len(car_indexes)
+            cars_to_read = cap_cars_to_read(camera, select_cars_to_read(captured_frame, [cars_found[car_index] for car_index in car_indexes], car_indexes), max_cars_per_frame)
+            if len(cars_to_read) > 0:
+                license_plates_recognized = read_license_plates_of_cars([(camera, cars_to_read)], None, inference_size)[0][1]
+        except Exception as e:
+            print(f"[{camera.name}] Inference worker {worker_id} failed to process frame: {e}")
+        # Crops are views into the shared memory, they get copied while being pickled
+        result_queue.put((worker_id, (slot_index, camera_index, sequence_number, captured_at, time.monotonic() - started_at, [car_box for _, car_box in cars_found], number_of_confirmed_cars, license_plates_recognized)))
+
+INFERENCE_WORKER_POOL = InferenceWorkerPool(PIPELINE_WORKER_PROCESSES, run_inference_worker, SHARED_FRAME_POOL, _print) if SHARED_FRAME_POOL is not None else None
+
+def run_worker_dispatch_stage():
+    number_of_dispatched_frames = 0
+    last_dispatch_at = 0
+    while True:
+        level = get_degradation_level()
+        # Every dispatch is a frame of a single camera, so all cameras together get the detection interval
+        wait_for_detection_interval(level, last_dispatch_at, len(CAMERAS))
+        INFERENCE_WORKER_POOL.restart_dead_workers()
+        worker_id = INFERENCE_WORKER_POOL.wait_for_idle_worker(timeout=1)
+        if worker_id is None:
+            continue
 
-            save_thread = threading.Thread(target=utils.save_validated_result, args=(DB_ENABLED, license_plate_uuid, license_plate_as_string, DB_SERVER, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD, SAVE_RESULTS_ENABLED, RESULTS_PATH, car_image_raw, license_plate_image_raw))
-            save_thread.start()
+        frame_to_process = None
+        while frame_to_process is None:
+            camera_indexes = SHARED_FRAME_POOL.wait_for_pending_frames(timeout=1)
+            if len(camera_indexes) == 0:
+                break
+            for camera_index in camera_indexes:
+                pending_frame = SHARED_FRAME_POOL.take_pending_frame(camera_index)
+                if pending_frame is None:
+                    continue
+                slot_index, frame_shape, sequence_number, captured_at = pending_frame
+                # Nothing is moving in front of the camera, no reason to run inference
+                motion_gate = CAMERAS[camera_index].motion_gate
+                if motion_gate is not None and motion_gate.should_run_inference(SHARED_FRAME_POOL.frame_view(slot_index, frame_shape)) is False:
+                    SHARED_FRAME_POOL.release(slot_index)
+                    continue
+                frame_to_process = (slot_index, frame_shape, camera_index, sequence_number, captured_at)
+                break
+        if frame_to_process is None:
+            INFERENCE_WORKER_POOL.release_idle_worker(worker_id)
+            if all(camera.capture_stats["decoded"] == 0 for camera in CAMERAS):
+                _print("No frames captured yet, nothing to do, waiting for frames...")
+            continue
 
-        recognitions_between_rounds = []
+        slot_index, frame_shape, camera_index, sequence_number, captured_at = frame_to_process
+        car_tracker = CAMERAS[camera_index].car_tracker
+        track_boxes = car_tracker.get_track_boxes() if car_tracker is not None else None
+        INFERENCE_WORKER_POOL.submit(worker_id, (slot_index, SHARED_FRAME_POOL.assign(slot_index, worker_id), frame_shape, camera_index, sequence_number, captured_at, level, track_boxes))
+        last_dispatch_at = time.monotonic()
+        number_of_dispatched_frames += 1
+        if number_of_dispatched_frames % 100 == 0:
+            for camera in CAMERAS:
+                _print(f"[{camera.name}] Camera stats: {camera.get_stats()}")
+            _print(f"Shared frame pool stats: {SHARED_FRAME_POOL.get_stats()}")
+            _print(f"Inference worker stats: {INFERENCE_WORKER_POOL.get_stats()}")
+            _print(f"Pipeline queue depths: {get_pipeline_queue_depths()}")
+            _print(f"Broadcast stats: {BROADCASTER.get_stats()}")
+            _print(f"Result writer stats: {RESULT_WRITER.get_stats()}")
+            if LATENCY_SCHEDULER is not None:
+                _print(f"Latency scheduler stats: {LATENCY_SCHEDULER.get_stats()}")
+
+def run_worker_results_stage():
+    last_tracked_sequence_numbers = [0] * len(CAMERAS)
+    while True:
+        worker_id, (slot_index, camera_index, sequence_number, captured_at, worker_seconds, car_boxes, number_of_confirmed_cars, license_plates_recognized) = INFERENCE_WORKER_POOL.get_result()
+        if SHARED_FRAME_POOL.finish(slot_index, worker_id) is False:
+            continue
+        if LATENCY_SCHEDULER is not None:
+            LATENCY_SCHEDULER.record_stage("inference_worker", worker_seconds)
+        camera = CAMERAS[camera_index]
+        if number_of_confirmed_cars > 0:
+            CARS_SKIPPED.inc(number_of_confirmed_cars, (camera.name, "already_confirmed")) # metrics are served by the main process only
+        if camera.car_tracker is not None:
+            # Workers finish frames out of order, an older frame would move tracks back
+            if sequence_number < last_tracked_sequence_numbers[camera_index]:
+                record_end_to_end_latency(captured_at)
+                continue
+            last_tracked_sequence_numbers[camera_index] = sequence_number
+            car_tracks = camera.car_tracker.update(car_boxes)
+        for recognition in license_plates_recognized:
+            recognition.car_track = car_tracks[recognition.car_track] if camera.car_tracker is not None else None
+        if len(license_plates_recognized) > 0:
+            publish_validated_results(camera, license_plates_recognized)
+        record_end_to_end_latency(captured_at)
+
+############ Saving results ############
+RESULT_STORAGE = create_result_storage(DB_STORAGE, DB_SERVER, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD, DB_POOL_SIZE, SHOULD_TAG_RESULTS_BY_CAMERA) if DB_ENABLED else None
+RESULT_WRITER = ResultWriter(RESULT_STORAGE, RESULTS_PATH if SAVE_RESULTS_ENABLED else None, DB_SPILL_PATH, DB_WRITER_QUEUE_SIZE, DB_WRITER_BATCH_SIZE, DB_RETRY_SECONDS, _print)
+
+############ Metrics ############
+# Everything the components already count is read only when metrics are scraped (METRICS_ENABLED, METRICS_PORT)
+def _per_camera(get_value) -> list[(tuple, float)]:
+    return [((camera.name,), get_value(camera)) for camera in CAMERAS]
+
+# Recognitions waiting for the next validation round, or tracks still waiting for a confirmed license plate (VALIDATION_MODE=tracker)
+def _get_validation_backlog(camera: Camera) -> int:
+    if camera.car_tracker is not None:
+        return sum(1 for car_track in list(camera.car_tracker.tracks) if car_track.confirmed_license_plate is None)
+    return camera.recognitions_between_rounds.get_number_of_recognitions()
+
+def register_metrics():
+    METRICS.callback("alpr_frames_grabbed_total", "Frames read from the stream", "counter", ["camera"], lambda: _per_camera(lambda camera: camera.capture_stats["grabbed"]))
+    METRICS.callback("alpr_frames_decoded_total", "Frames converted into images (see CAPTURE_MODE)", "counter", ["camera"], lambda: _per_camera(lambda camera: camera.capture_stats["decoded"]))
+    if SHARED_FRAME_POOL is None:
+        METRICS.callback("alpr_frames_dropped_total", "Frames overwritten in the frame buffer before detection took them", "counter", ["camera"], lambda: _per_camera(lambda camera: camera.frame_buffer.get_stats()["frames_dropped"]))
+    else:
+        METRICS.callback("alpr_shared_frames_dropped_total", "Frames replaced by a newer frame of the same camera before any inference worker took them", "counter", [], lambda: [((), SHARED_FRAME_POOL.get_stats()["frames_dropped"])])
+        METRICS.callback("alpr_inference_workers_restarted_total", "Inference worker processes which died and were replaced", "counter", [], lambda: [((), INFERENCE_WORKER_POOL.get_stats()["workers_restarted"])])
+    if MOTION_GATE_ENABLED:
+        METRICS.callback("alpr_detections_skipped_total", "Frames without motion, which didn't go through the models", "counter", ["camera"], lambda: _per_camera(lambda camera: camera.motion_gate.get_stats()["inferences_skipped"]))
+    if OCR_CACHE is not None:
+        METRICS.callback("alpr_ocr_cache_lookups_total", "License plate images looked up in the OCR cache, by result (hit, miss)", "counter", ["result"], lambda: [(("hit",), OCR_CACHE.get_stats()["hits"]), (("miss",), OCR_CACHE.get_stats()["misses"])])
+        METRICS.callback("alpr_ocr_cache_hit_rate", "Share of license plate images read from the OCR cache, instead of being segmented and OCR'd", "gauge", [], lambda: [((), OCR_CACHE.get_stats()["hit_rate"])])
+        METRICS.callback("alpr_ocr_cache_entries", "License plates in the OCR cache", "gauge", [], lambda: [((), len(OCR_CACHE))])
+    if LATENCY_SCHEDULER is not None:
+        METRICS.callback("alpr_degradation_level", "Current degradation level of LATENCY_BUDGET_MS (0 normal, 1 reduced inference size, 2 capped cars per frame, 3 reduced detection rate)", "gauge", [], lambda: [((), LATENCY_SCHEDULER.get_level())])
+        METRICS.callback("alpr_end_to_end_latency_seconds", "Time from capturing a frame until its license plates were read (smoothed)", "gauge", [], lambda: [((), LATENCY_SCHEDULER.latency or 0)])
+    METRICS.callback("alpr_validation_backlog", "Recognitions waiting for validation", "gauge", ["camera"], lambda: _per_camera(_get_validation_backlog))
+    METRICS.callback("alpr_pipeline_queue_depth", "Items waiting in a queue between pipeline stages", "gauge", ["queue"], lambda: [((name,), depths["depth"]) for name, depths in get_pipeline_queue_depths().items()])
+    METRICS.callback("alpr_pipeline_queue_dropped_total", "Items thrown away, because the next pipeline stage couldn't keep up", "counter", ["queue"], lambda: [((name,), depths["dropped"]) for name, depths in get_pipeline_queue_depths().items()])
+    METRICS.callback("alpr_websocket_clients", "Connected websocket clients", "gauge", [], lambda: [((), BROADCASTER.get_stats()["connected_clients"])])
+    METRICS.callback("alpr_websocket_catch_up_results_total", "Results sent to reconnected websocket clients, which missed them while disconnected", "counter", [], lambda: [((), BROADCASTER.get_stats()["catch_up_results_sent"])])
+    METRICS.callback("alpr_websocket_queued_results", "Results waiting to be sent to websocket clients", "gauge", [], lambda: [((), BROADCASTER.get_stats()["queued_results"])])
+    METRICS.callback("alpr_result_writer_queue_depth", "Results waiting to be saved", "gauge", [], lambda: [((), RESULT_WRITER.get_stats()["queued"])])
+    METRICS.callback("alpr_db_results_written_total", "Results inserted into the database", "counter", [], lambda: [((), RESULT_WRITER.get_stats()["written"])])
+    METRICS.callback("alpr_db_results_spilled_total", "Results written into the spill file, because the database couldn't be reached (or the writer couldn't keep up)", "counter", [], lambda: [((), RESULT_WRITER.get_stats()["spilled"])])
+    METRICS.callback("alpr_result_writer_dropped_total", "Results which didn't fit into the queue of the result writer (records are spilled, images are dropped)", "counter", [], lambda: [((), RESULT_WRITER.get_stats()["dropped"])])
+    METRICS.callback("alpr_result_images_failed_total", "Results whose images couldn't be saved into RESULTS_PATH", "counter", [], lambda: [((), RESULT_WRITER.get_stats()["images_failed"])])
+    METRICS.callback("alpr_db_write_failures_total", "Failed attempts to write into the database", "counter", [], lambda: [((), RESULT_WRITER.get_stats()["database_failures"])])
+
+async def run_publisher():
+    while True:
+        encoded_result = await RESULTS_QUEUE.get_async()
+        BROADCASTER.broadcast(encoded_result)
 
 def init_websocket_server_and_detection():
+    RESULT_WRITER.start()
+    if INFERENCE_WORKER_POOL is not None:
+        threading.Thread(target=run_worker_dispatch_stage, daemon=True).start()
+        threading.Thread(target=run_worker_results_stage, daemon=True).start()
+    else:
+        threading.Thread(target=run_car_detection_stage, daemon=True).start()
+        threading.Thread(target=run_license_plate_reading_stage, daemon=True).start()
+
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     
     asyncio.ensure_future(run_websocket_server())
-    asyncio.ensure_future(run_detection())
+    asyncio.ensure_future(run_publisher())
+    if METRICS.enabled:
+        register_metrics()
+        asyncio.ensure_future(METRICS.serve(METRICS_PORT))
 
     try:
         loop.run_forever()
@@ -244,11 +801,28 @@ if __name__ == "__main__":
         if os.path.exists(RESULTS_PATH) == False:
             os.mkdir(RESULTS_PATH)
 
-    capture_thread = threading.Thread(target=run_video_capture)
-    work_thread = threading.Thread(target=init_websocket_server_and_detection)
-
-    capture_thread.start()
-    work_thread.start()
-
-    capture_thread.join()
-    work_thread.join()
\ No newline at end of file
+    # systemd stops the service by SIGTERM, it goes through the same cleanup as Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        if INFERENCE_WORKER_POOL is not None:
+            INFERENCE_WORKER_POOL.start()
+        capture_threads = [threading.Thread(target=run_video_capture, args=(camera_index,)) for camera_index in range(len(CAMERAS))]
+        work_thread = threading.Thread(target=init_websocket_server_and_detection)
+
+        for capture_thread in capture_threads:
+            capture_thread.start()
+        work_thread.start()
+
+        # Capture and detection threads run forever, the main thread only waits until one of them can't go on
+        fatal_error = FATAL_ERRORS.get()
+        print(f"Stopping the server: {fatal_error}", file=sys.stderr)
+        exit_code = 1
+    except KeyboardInterrupt:
+        exit_code = 0
+    finally:
+        # Shared memory of frames is unlinked here, instead of relying on multiprocessing's resource_tracker
+        if INFERENCE_WORKER_POOL is not None:
+            INFERENCE_WORKER_POOL.stop()
+        if SHARED_FRAME_POOL is not None:
+            SHARED_FRAME_POOL.close()
+    os._exit(exit_code) # capture and detection threads never end on their own
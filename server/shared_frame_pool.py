@@ -0,0 +1,132 @@
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+# Frame slots in shared memory, used when inference runs in worker processes (PIPELINE_WORKER_PROCESSES).
+# Captures decode frames straight into a free slot, workers read the frame from the same memory, so frames are never copied or pickled.
+# Life of a slot: free => written by a capture => pending (latest frame of its camera) => in flight (sent to a worker) => free.
+# A pending frame replaced by a newer one of the same camera before it got sent to a worker is dropped (its slot is freed right away),
+# so workers always get the freshest frame of every camera. Slots in flight are freed once the worker returns its result, or when the worker dies.
+class SharedFramePool:
+    def __init__(self, number_of_slots: int, number_of_cameras: int):
+        self.number_of_slots = max(number_of_slots, 1)
+        self.slots = [None] * self.number_of_slots # SharedMemory, allocated once the first frame arrives (or when a bigger frame does)
+        self.free_slots = list(range(self.number_of_slots))
+        self.pending_frames = [None] * number_of_cameras # camera index => (slot index, shape, sequence number, captured_at)
+        self.slots_in_flight = {} # slot index => worker id
+        self.sequence_numbers = [0] * number_of_cameras
+        self.lock = threading.Lock()
+        self.new_frame_written = threading.Condition(self.lock)
+
+        self.frames_written = 0
+        self.frames_dropped = 0 # written, but replaced by a newer frame before any worker got it
+        self.frames_reclaimed = 0 # in flight, when their worker died
+
+    # Returns index of a free slot, or None if all slots are taken (the capture should skip the frame)
+    def acquire(self) -> int:
+        with self.lock:
+            return self.free_slots.pop() if len(self.free_slots) > 0 else None
+
+    # Returns the frame of the slot as numpy array, the slot is (re)allocated if it's too small for the frame.
+    # Only the holder of the slot can call this (capture that acquired it, or whoever took it as pending frame).
+    def frame_view(self, slot_index: int, shape: tuple) -> np.ndarray:
+        number_of_bytes = int(np.prod(shape))
+        slot = self.slots[slot_index]
+        if slot is None or slot.size < number_of_bytes:
+            if slot is not None:
+                slot.close()
+                slot.unlink()
+            slot = shared_memory.SharedMemory(create=True, size=number_of_bytes)
+            self.slots[slot_index] = slot
+        return np.ndarray(shape, dtype=np.uint8, buffer=slot.buf)
+
+    # Makes the written slot the latest frame of the camera
+    def publish(self, camera_index: int, slot_index: int, shape: tuple):
+        with self.lock:
+            if self.pending_frames[camera_index] is not None:
+                self.free_slots.append(self.pending_frames[camera_index][0])
+                self.frames_dropped += 1
+            self.sequence_numbers[camera_index] += 1
+            self.pending_frames[camera_index] = (slot_index, shape, self.sequence_numbers[camera_index], time.monotonic())
+            self.frames_written += 1
+            self.new_frame_written.notify_all()
+
+    # Slot acquired by a capture, but not published (eg. reading the frame failed), or taken, but not worth sending to a worker
+    def release(self, slot_index: int):
+        with self.lock:
+            self.free_slots.append(slot_index)
+
+    # Result of the worker arrived, returns False if the slot was already reclaimed (the worker was considered dead)
+    def finish(self, slot_index: int, worker_id: int) -> bool:
+        with self.lock:
+            if self.slots_in_flight.get(slot_index) != worker_id:
+                return False
+            del self.slots_in_flight[slot_index]
+            self.free_slots.append(slot_index)
+            return True
+
+    # True if the latest frame of the camera was already taken, so capture knows a new one is needed
+    def is_frame_requested(self, camera_index: int) -> bool:
+        return self.pending_frames[camera_index] is None
+
+    # Waits up to timeout seconds for a frame of any camera, returns indexes of cameras with a pending frame, the camera whose frame waits the longest first
+    def wait_for_pending_frames(self, timeout: float) -> list[int]:
+        with self.lock:
+            self.new_frame_written.wait_for(lambda: any(pending_frame is not None for pending_frame in self.pending_frames), timeout)
+            camera_indexes = [camera_index for camera_index, pending_frame in enumerate(self.pending_frames) if pending_frame is not None]
+            return sorted(camera_indexes, key=lambda camera_index: self.pending_frames[camera_index][3])
+
+    # Returns (slot index, shape, sequence number, captured_at) of the latest frame of the camera, or None.
+    # The slot belongs to the caller from now on, until it's assigned to a worker, or released.
+    def take_pending_frame(self, camera_index: int) -> (int, tuple, int, float):
+        with self.lock:
+            pending_frame = self.pending_frames[camera_index]
+            self.pending_frames[camera_index] = None
+            return pending_frame
+
+    # Returns name of the shared memory block of the slot, the worker attaches to it by name
+    def assign(self, slot_index: int, worker_id: int) -> str:
+        with self.lock:
+            self.slots_in_flight[slot_index] = worker_id
+            return self.slots[slot_index].name
+
+    # Frees every slot the worker had in flight, returns how many
+    def reclaim_slots_of_worker(self, worker_id: int) -> int:
+        with self.lock:
+            slot_indexes = [slot_index for slot_index, slot_worker_id in self.slots_in_flight.items() if slot_worker_id == worker_id]
+            for slot_index in slot_indexes:
+                del self.slots_in_flight[slot_index]
+                self.free_slots.append(slot_index)
+            self.frames_reclaimed += len(slot_indexes)
+            return len(slot_indexes)
+
+    # Called once the server stops, capture threads may still have views into the slots, then the memory is released once the process exits
+    def close(self):
+        for slot in self.slots:
+            if slot is not None:
+                slot.unlink()
+                try:
+                    slot.close()
+                except BufferError:
+                    pass
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "frames_written": self.frames_written,
+                "frames_dropped": self.frames_dropped,
+                "frames_reclaimed": self.frames_reclaimed,
+                "free_slots": len(self.free_slots),
+                "slots_in_flight": len(self.slots_in_flight),
+            }
+
+# Worker side, shared memory blocks are attached once and kept open
+class SharedFrameReader:
+    def __init__(self):
+        self.attached_slots = {} # shared memory name => SharedMemory
+
+    def frame_view(self, name: str, shape: tuple) -> np.ndarray:
+        if name not in self.attached_slots:
+            self.attached_slots[name] = shared_memory.SharedMemory(name=name)
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.attached_slots[name].buf)
@@ -0,0 +1,79 @@
+import threading
+import time
+import numpy as np
+from metrics import Histogram
+
+STAGE_CAR_DETECTION = "car_detection"
+STAGE_LICENSE_PLATE_DETECTION = "license_plate_detection"
+STAGE_SEGMENTATION = "segmentation"
+STAGE_OCR = "ocr"
+STAGE_VALIDATION = "validation"
+STAGES = [STAGE_CAR_DETECTION, STAGE_LICENSE_PLATE_DETECTION, STAGE_SEGMENTATION, STAGE_OCR, STAGE_VALIDATION]
+
+class _StageTimer:
+    def __init__(self, stage_timings, stage: str):
+        self.stage_timings = stage_timings
+        self.stage = stage
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.stage_timings.record(self.stage, time.perf_counter() - self.started_at)
+        return False
+
+class _DisabledStageTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+_DISABLED_STAGE_TIMER = _DisabledStageTimer()
+
+# How long every call of each pipeline stage took (`with STAGE_TIMINGS.measure(STAGE_OCR): ...`).
+# enabled => every duration is kept (the replay benchmark enables it and reports percentiles of every stage),
+# histogram => durations are observed into it (labeled by stage), the server passes one when METRICS_ENABLED.
+# Without either, measure() returns a shared no-op timer.
+class StageTimings:
+    def __init__(self, enabled: bool = False, histogram: Histogram = None):
+        self.enabled = enabled
+        self.histogram = histogram
+        self.durations = {} # stage => [seconds]
+        self.lock = threading.Lock()
+
+    def measure(self, stage: str):
+        return _StageTimer(self, stage) if self.enabled or self.histogram is not None else _DISABLED_STAGE_TIMER
+
+    def record(self, stage: str, seconds: float):
+        if self.histogram is not None:
+            self.histogram.observe(seconds, (stage,))
+        if self.enabled is False:
+            return
+        with self.lock:
+            if stage not in self.durations:
+                self.durations[stage] = []
+            self.durations[stage].append(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.durations = {}
+
+    # stage => {calls, total_ms, mean_ms, p50_ms, p95_ms, p99_ms}, stages in pipeline order
+    def get_summary(self) -> dict:
+        with self.lock:
+            durations = {stage: np.array(seconds) * 1000 for stage, seconds in self.durations.items()}
+        ordered_stages = [stage for stage in STAGES if stage in durations] + sorted(stage for stage in durations if stage not in STAGES)
+        summary = {}
+        for stage in ordered_stages:
+            p50, p95, p99 = np.percentile(durations[stage], [50, 95, 99])
+            summary[stage] = {
+                "calls": len(durations[stage]),
+                "total_ms": float(np.sum(durations[stage])),
+                "mean_ms": float(np.mean(durations[stage])),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+            }
+        return summary
@@ -4,13 +4,16 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-RTSP_CAPTURE_CONFIG = os.getenv("RTSP_CAPTURE_CONFIG") 
-capture = cv2.VideoCapture(RTSP_CAPTURE_CONFIG)
+# Multiple cameras are separated by "|", every one of them gets its own window
+RTSP_CAPTURE_CONFIGS = [capture_config.strip() for capture_config in os.getenv("RTSP_CAPTURE_CONFIG").split("|")]
+captures = [cv2.VideoCapture(capture_config) for capture_config in RTSP_CAPTURE_CONFIGS]
 
-while(capture.isOpened()):
-    _, frame = capture.read()
-    cv2.imshow('frame', frame)
+while(all(capture.isOpened() for capture in captures)):
+    for i, capture in enumerate(captures):
+        _, frame = capture.read()
+        cv2.imshow(f'frame {i + 1}', frame)
     if cv2.waitKey(20) & 0xFF == ord('q'):
         break
-capture.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+for capture in captures:
+    capture.release()
+cv2.destroyAllWindows()
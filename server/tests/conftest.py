@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Modules of the server are imported the same way as server.py imports them (server/ and the root of the repo are on the path)
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.dirname(SERVER_DIR))
@@ -0,0 +1,31 @@
+import os
+
+import pytest
+from dotenv import dotenv_values
+
+from camera import split_per_camera, should_tag_results_by_camera
+
+ENV_DEVELOPMENT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env.development")
+
+def test_single_camera_without_names_is_not_tagged():
+    assert should_tag_results_by_camera(None, 1) is False
+    assert should_tag_results_by_camera("", 1) is False
+    assert should_tag_results_by_camera("  ", 1) is False
+
+# The shipped config has `CAMERA_NAMES= # empty = ...`, which dotenv reads as "" (not unset)
+def test_shipped_config_is_not_tagged():
+    camera_names = dotenv_values(ENV_DEVELOPMENT_PATH)["CAMERA_NAMES"]
+    assert camera_names == ""
+    assert should_tag_results_by_camera(camera_names, 1) is False
+
+def test_named_or_multiple_cameras_are_tagged():
+    assert should_tag_results_by_camera("gate", 1) is True
+    assert should_tag_results_by_camera(None, 2) is True
+    assert should_tag_results_by_camera("", 2) is True
+
+def test_split_per_camera():
+    assert split_per_camera(None, 2, "CAMERA_NAMES") == [None, None]
+    assert split_per_camera("gate", 2, "CAMERA_NAMES") == ["gate", "gate"]
+    assert split_per_camera("entry | exit", 2, "CAMERA_NAMES") == ["entry", "exit"]
+    with pytest.raises(ValueError):
+        split_per_camera("entry|exit|back", 2, "CAMERA_NAMES")
@@ -0,0 +1,38 @@
+import numpy as np
+
+from car_tracker import CarTracker
+from recognition import Recognition
+
+def _car_tracker() -> CarTracker:
+    return CarTracker(0.3, 0.5, 5, 2, 0.5)
+
+def _confirm(car_tracker: CarTracker, car_track, license_plate: str):
+    for _ in range(car_tracker.votes_to_confirm):
+        car_tracker.add_vote(car_track, Recognition(license_plate, np.zeros((10, 10, 3), dtype=np.uint8), (0, 0, 1, 1), 0))
+
+def test_tracks_keep_ids_between_frames():
+    car_tracker = _car_tracker()
+    first_tracks = car_tracker.update([(0, 0, 100, 100), (300, 0, 400, 100)], now=0)
+    second_tracks = car_tracker.update([(310, 5, 410, 105), (5, 0, 105, 100)], now=0.1)
+    assert [track.track_id for track in second_tracks] == [first_tracks[1].track_id, first_tracks[0].track_id]
+
+# Inference workers match car boxes against tracks sent by the main process, the result has to be the same as `update` would give
+def test_match_confirmed_follows_update():
+    car_tracker = _car_tracker()
+    parked_car, moving_car = car_tracker.update([(0, 0, 100, 100), (300, 0, 400, 100)], now=0)
+    _confirm(car_tracker, parked_car, "ABC 1234")
+    track_boxes = car_tracker.get_track_boxes(now=0.1)
+    assert sorted(track_box[4] for track_box in track_boxes) == [False, True]
+
+    boxes = [(320, 0, 420, 100), (2, 1, 101, 100), (700, 0, 800, 100)]
+    assert car_tracker.match_confirmed(boxes, track_boxes) == [False, True, False]
+    car_tracks = car_tracker.update(boxes, now=0.1)
+    assert [car_track.confirmed_license_plate is not None for car_track in car_tracks] == [False, True, False]
+    assert car_tracks[0] is moving_car
+
+def test_expired_tracks_are_not_sent_to_workers():
+    car_tracker = _car_tracker()
+    car_tracker.update([(0, 0, 100, 100)], now=0)
+    assert len(car_tracker.get_track_boxes(now=1)) == 1
+    assert car_tracker.get_track_boxes(now=10) == []
+    assert car_tracker.match_confirmed([(0, 0, 100, 100)], []) == [False]
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from detection_roi import DetectionRoi
+
+def _frame(width: int, height: int) -> np.ndarray:
+    return np.zeros((height, width, 3), dtype=np.uint8)
+
+@pytest.mark.parametrize("scale", [0, -0.5])
+def test_scale_has_to_be_positive(scale):
+    with pytest.raises(ValueError):
+        DetectionRoi.from_config("0,0,100,100", scale)
+
+def test_empty_config_disables_roi():
+    assert DetectionRoi.from_config("", 0) is None
+
+def test_region_is_clamped_to_frame():
+    detection_roi = DetectionRoi.from_config("-50,100,700,900", 1)
+    region_image = detection_roi.apply(_frame(640, 480))
+    assert region_image.shape == (380, 640, 3)
+    assert detection_roi.to_frame_coordinates(10, 20, 30, 40) == (10, 120, 30, 140)
+
+def test_region_outside_of_frame_is_rejected():
+    detection_roi = DetectionRoi.from_config("700,0,900,100", 1)
+    with pytest.raises(ValueError):
+        detection_roi.apply(_frame(640, 480))
+
+# 333 x 101 pixels at 0.5 => 166 x 50 pixels, so the actual ratio is not 0.5
+def test_boxes_are_mapped_back_with_actual_resize_ratio():
+    detection_roi = DetectionRoi.from_config("7,3,340,104", 0.5)
+    region_image = detection_roi.apply(_frame(640, 480))
+    height, width = region_image.shape[:2]
+    assert (width, height) == (166, 50)
+    x_min, y_min, x_max, y_max = detection_roi.to_frame_coordinates(0, 0, width, height)
+    assert (x_min, y_min) == (7, 3)
+    assert x_max == pytest.approx(340) and y_max == pytest.approx(104)
+
+def test_polygon_outside_of_region_is_filled():
+    detection_roi = DetectionRoi.from_config("0,0;100,0;0,100", 1)
+    region_image = detection_roi.apply(np.full((200, 200, 3), 255, dtype=np.uint8))
+    assert region_image.shape == (100, 100, 3)
+    assert tuple(region_image[99, 99]) == DetectionRoi.FILL_COLOR
+    assert tuple(region_image[1, 1]) == (255, 255, 255)
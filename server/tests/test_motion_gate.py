@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import utils
+from motion_gate import MotionGate
+
+def _motion_gate(region: (int, int, int, int)) -> MotionGate:
+    return MotionGate(region, 160, 25, 0.01, 3, 30)
+
+@pytest.mark.parametrize("value", ["100,0,50,100", "0,100,100,100", "-10,0,100,100"])
+def test_inverted_or_negative_region_is_rejected(value):
+    with pytest.raises(ValueError):
+        utils.parse_region(value)
+
+def test_empty_region_means_whole_frame():
+    assert utils.parse_region("") is None
+    assert utils.parse_region(" 0, 400, 1920, 1080 ") == (0, 400, 1920, 1080)
+
+def test_region_outside_of_frame_is_rejected():
+    with pytest.raises(ValueError):
+        _motion_gate((0, 400, 1920, 1080)).check_frame_size(1280, 720)
+    _motion_gate((0, 400, 1280, 720)).check_frame_size(1280, 720)
+    _motion_gate(None).check_frame_size(1280, 720)
+
+def test_motion_inside_of_region():
+    motion_gate = _motion_gate((0, 0, 320, 240))
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    assert motion_gate.get_changed_ratio(frame) == 1.0 # first frame
+    frame[300:, 400:] = 255 # outside of the region
+    assert motion_gate.get_changed_ratio(frame) == 0.0
+    frame[:120, :160] = 255
+    assert motion_gate.get_changed_ratio(frame) == pytest.approx(0.25)
@@ -0,0 +1,86 @@
+import os
+
+import cv2
+import imutils
+import numpy as np
+import pytest
+from PIL import Image
+
+import utils
+
+threshold_local = pytest.importorskip("skimage.filters").threshold_local
+
+EXAMPLE_IMAGE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "ai", "example_for_testing_1.jpg")
+# License plate boxes (x_min, y_min, x_max, y_max) of the example image, a few pixels apart, as YOLO would find them in different frames
+LICENSE_PLATE_BOXES = [(148, 209, 246, 237), (147, 208, 247, 238), (150, 211, 244, 236)]
+WIDTH_BOOST = 500 # defaults from .env.development
+ADDITIONAL_WHITE_SPACING_EACH_SIDE = 20
+
+@pytest.fixture(scope="module")
+def example_image() -> np.ndarray:
+    image = cv2.imread(EXAMPLE_IMAGE_PATH)
+    assert image is not None
+    return image
+
+# Pre-processing as it was before the pipeline went numpy-native (GRAY => BGR => HSV => V, skimage's threshold_local)
+# Returns binarized license plate, black letters on white background
+def _legacy_clean_plate_into_contours(plate_img: np.ndarray, fixed_width: int) -> np.ndarray:
+    plate_img = cv2.GaussianBlur(cv2.cvtColor(plate_img, cv2.COLOR_GRAY2BGR), (11,11), 0)
+    V = cv2.split(cv2.cvtColor(plate_img, cv2.COLOR_BGR2HSV))[2]
+    T = threshold_local(V, 99, offset=5, method='gaussian')
+    thresh = cv2.bitwise_not((V > T).astype('uint8') * 255)
+    thresh = imutils.resize(thresh, width=fixed_width)
+    return cv2.bitwise_not(cv2.morphologyEx(thresh, cv2.MORPH_DILATE, np.ones((3, 3), np.uint8)))
+
+# Whole segmentation as it was before (frame => RGB => PIL => crop => "L" => resize => numpy, letters padded by PIL)
+def _legacy_segment_license_plate(box: (float, float, float, float), car_image: np.ndarray, width_boost: int, additional_white_spacing_each_side: int) -> (np.ndarray, list[list[int]], list[Image.Image]):
+    x_min, y_min, x_max, y_max = box
+    boost_multiplier = width_boost / (x_max - x_min)
+    car_image_pil = Image.fromarray(cv2.cvtColor(car_image, cv2.COLOR_BGR2RGB))
+    license_plate_cropped_img = car_image_pil.crop((x_min, y_min, x_max, y_max)).convert("L").resize([int((x_max - x_min) * boost_multiplier), int((y_max - y_min) * boost_multiplier)])
+    iwl_wb = _legacy_clean_plate_into_contours(np.array(license_plate_cropped_img), width_boost)
+    letter_rectangles = utils.get_letter_rectangles_from_contours(iwl_wb)
+    iwl_wb_pil = Image.fromarray(iwl_wb, mode="L")
+    letter_images = []
+    for (x, y, w, h) in letter_rectangles:
+        letter_box_cropped_img = iwl_wb_pil.crop((x, y, x + w, y + h))
+        new_letter_box_img = Image.new("L", (letter_box_cropped_img.width + additional_white_spacing_each_side * 2, letter_box_cropped_img.height + additional_white_spacing_each_side * 2), "white")
+        new_letter_box_img.paste(letter_box_cropped_img, (additional_white_spacing_each_side, additional_white_spacing_each_side))
+        letter_images.append(new_letter_box_img)
+    return (iwl_wb, letter_rectangles, letter_images)
+
+def _box_iou(a: list[int], b: list[int]) -> float:
+    (ax, ay, aw, ah), (bx, by, bw, bh) = a, b
+    intersection = max(min(ax + aw, bx + bw) - max(ax, bx), 0) * max(min(ay + ah, by + bh) - max(ay, by), 0)
+    return intersection / (aw * ah + bw * bh - intersection)
+
+# Same grayscale license plate on input, so the only difference is skimage + HSV against opencv's float32 gaussian
+@pytest.mark.parametrize("box", LICENSE_PLATE_BOXES)
+def test_clean_plate_into_contours_matches_skimage(example_image, box):
+    license_plate_cropped_img = utils.crop_license_plate_box(box, example_image, WIDTH_BOOST, False)
+    legacy_iwl_wb = _legacy_clean_plate_into_contours(license_plate_cropped_img, WIDTH_BOOST)
+    iwl_wb = cv2.bitwise_not(utils.clean_plate_into_contours(license_plate_cropped_img, WIDTH_BOOST))
+
+    assert iwl_wb.shape == legacy_iwl_wb.shape
+    assert np.array_equal(iwl_wb, legacy_iwl_wb)
+    assert utils.get_letter_rectangles_from_contours(iwl_wb) == utils.get_letter_rectangles_from_contours(legacy_iwl_wb)
+
+# Whole path from the frame, PIL and opencv resize the license plate a bit differently, so pixels and letter boxes may differ slightly
+@pytest.mark.parametrize("box", LICENSE_PLATE_BOXES)
+def test_segmentation_matches_legacy_pil_path(example_image, box):
+    legacy_iwl_wb, legacy_letter_rectangles, legacy_letter_images = _legacy_segment_license_plate(box, example_image, WIDTH_BOOST, ADDITIONAL_WHITE_SPACING_EACH_SIDE)
+    license_plate_cropped_img = utils.crop_license_plate_box(box, example_image, WIDTH_BOOST, False)
+    iwl_wb = cv2.bitwise_not(utils.clean_plate_into_contours(license_plate_cropped_img, WIDTH_BOOST))
+    letter_rectangles = utils.get_letter_rectangles_from_contours(iwl_wb)
+    letter_images = utils.segment_cropped_license_plate("", license_plate_cropped_img, WIDTH_BOOST, ADDITIONAL_WHITE_SPACING_EACH_SIDE, False, 0)
+
+    assert iwl_wb.shape == legacy_iwl_wb.shape
+    assert np.count_nonzero(iwl_wb != legacy_iwl_wb) / iwl_wb.size <= 0.02
+    assert len(letter_rectangles) == len(legacy_letter_rectangles) == 9 # KL54A2670
+    for rectangle, legacy_rectangle in zip(letter_rectangles, legacy_letter_rectangles):
+        assert _box_iou(rectangle, legacy_rectangle) > 0.9
+    assert len(letter_images) == len(legacy_letter_images)
+    for letter_image, legacy_letter_image in zip(letter_images, legacy_letter_images):
+        assert letter_image.dtype == np.uint8 and letter_image.ndim == 2
+        assert abs(letter_image.shape[0] - legacy_letter_image.height) <= 2 and abs(letter_image.shape[1] - legacy_letter_image.width) <= 2
+        assert (letter_image[:ADDITIONAL_WHITE_SPACING_EACH_SIDE] == 255).all() and (letter_image[:, -ADDITIONAL_WHITE_SPACING_EACH_SIDE:] == 255).all()
@@ -0,0 +1,101 @@
+import random
+from difflib import SequenceMatcher
+
+import pytest
+
+from sent_plates_history import SentLicensePlatesHistory
+
+TTL_SECONDS = 300
+
+def _levenshtein(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+# De-duplication of server.py before SentLicensePlatesHistory (list of sent license plates scanned with SequenceMatcher)
+def _is_duplicate_with_sequence_matcher(license_plates_sent: list, license_plate: str) -> bool:
+    return any(s == license_plate or SequenceMatcher(None, s, license_plate).ratio() > 0.8 for s in license_plates_sent)
+
+def _random_license_plate(rng: random.Random) -> str:
+    characters = "ABCDEFGHJKLMNPRSTUVXYZ0123456789"
+    return "".join(rng.choice(characters) for _ in range(3)) + " " + "".join(rng.choice(characters) for _ in range(4))
+
+def _misread(rng: random.Random, license_plate: str) -> str:
+    position = rng.choice([i for i, char in enumerate(license_plate) if char != " "])
+    replacement = rng.choice([char for char in "ABCDEFGHJKLMNPRSTUVXYZ0123456789" if char != license_plate[position]])
+    return license_plate[:position] + replacement + license_plate[position + 1:]
+
+def test_exact_license_plate_is_duplicate():
+    history = SentLicensePlatesHistory(TTL_SECONDS, 0.8)
+    assert not history.is_duplicate("ABC 1234", now=0)
+    history.add("ABC 1234", now=0)
+    assert history.is_duplicate("ABC 1234", now=1)
+    assert len(history) == 1
+
+def test_similarity_threshold():
+    history = SentLicensePlatesHistory(TTL_SECONDS, 0.8)
+    history.add("ABC 1234", now=0)
+    assert history.is_duplicate("ABC 1284", now=1) # 1 - 1/8 = 0.875
+    assert history.is_duplicate("ABC 123", now=1) # missing character, 1 - 1/8
+    assert not history.is_duplicate("ABD 1284", now=1) # 1 - 2/8 = 0.75
+    assert not history.is_duplicate("XYZ 9876", now=1)
+
+    strict_history = SentLicensePlatesHistory(TTL_SECONDS, 0.9)
+    strict_history.add("ABC 1234", now=0)
+    assert not strict_history.is_duplicate("ABC 1284", now=1)
+    assert strict_history.is_duplicate("ABC 1234", now=1)
+
+def test_similarity_matches_levenshtein():
+    rng = random.Random(0)
+    history = SentLicensePlatesHistory(TTL_SECONDS, 0.7)
+    license_plates = [_random_license_plate(rng)[:rng.randint(5, 8)] for _ in range(200)]
+    for license_plate in license_plates:
+        history.add(license_plate, now=0)
+    for _ in range(200):
+        query = _misread(rng, rng.choice(license_plates)) if rng.random() < 0.5 else _random_license_plate(rng)[:rng.randint(5, 8)]
+        expected = any(1 - _levenshtein(s, query) / max(len(s), len(query)) > 0.7 for s in license_plates)
+        assert history.is_duplicate(query, now=1) == expected, query
+
+def test_expired_license_plates_are_evicted():
+    history = SentLicensePlatesHistory(TTL_SECONDS, 0.8)
+    history.add("ABC 1234", now=0)
+    history.add("XYZ 9876", now=TTL_SECONDS / 2)
+    assert history.is_duplicate("ABC 1234", now=TTL_SECONDS - 1)
+
+    # whole buckets get evicted, so entries may live up to one bucket longer than ttl
+    after_ttl = TTL_SECONDS + 2 * history.bucket_seconds
+    assert not history.is_duplicate("ABC 1234", now=after_ttl)
+    assert not history.is_duplicate("ABC 1284", now=after_ttl)
+    assert history.is_duplicate("XYZ 9876", now=after_ttl)
+    assert len(history) == 1
+
+    assert not history.is_duplicate("XYZ 9876", now=TTL_SECONDS * 2)
+    assert len(history) == 0
+
+def test_license_plate_added_again_stays_until_its_last_entry_expires():
+    history = SentLicensePlatesHistory(TTL_SECONDS, 0.8)
+    history.add("ABC 1234", now=0)
+    history.add("ABC 1234", now=TTL_SECONDS / 2)
+    assert history.is_duplicate("ABC 1234", now=TTL_SECONDS + 2 * history.bucket_seconds)
+    assert not history.is_duplicate("ABC 1234", now=TTL_SECONDS * 2)
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_agrees_with_sequence_matcher_dedup(seed):
+    rng = random.Random(seed)
+    history = SentLicensePlatesHistory(TTL_SECONDS, 0.8)
+    license_plates_sent = []
+    for _ in range(300):
+        license_plate = _random_license_plate(rng)
+        history.add(license_plate, now=0)
+        license_plates_sent.append(license_plate)
+
+    # exact reads, one character misreads of sent license plates, and cars not seen before
+    queries = [rng.choice(license_plates_sent) for _ in range(50)]
+    queries += [_misread(rng, rng.choice(license_plates_sent)) for _ in range(100)]
+    queries += [_random_license_plate(rng) for _ in range(100)]
+    for query in queries:
+        assert history.is_duplicate(query, now=1) == _is_duplicate_with_sequence_matcher(license_plates_sent, query), query
@@ -1,59 +1,150 @@
-import io
 import os
 import shutil
 import cv2
 import imutils
 import numpy as np
-import pymssql
-import concurrent
-import pytesseract
-from PIL import Image
-from datetime import datetime
-from skimage.filters import threshold_local
+import ocr_backends
+from license_plate_cache import LicensePlateReadCache, compute_license_plate_hash
 from ultralytics import YOLO
 
+# Size ultralytics letterboxes images into, if the model doesn't say otherwise (exported models don't)
+DEFAULT_YOLO_IMAGE_SIZE = 640
+
+# Size the model was trained with (exported models => DEFAULT_YOLO_IMAGE_SIZE).
+# It has to be passed to every predict(), ultralytics keeps arguments of the last predict() for the next ones, so a smaller image size would stick.
+def get_default_image_size(preloaded_model: YOLO) -> int:
+    return preloaded_model.overrides.get("imgsz", DEFAULT_YOLO_IMAGE_SIZE)
+
+# car_image => BGR image (numpy array, same as opencv uses), PIL images (RGB) work as well
 # Returns number of results + results as boxes
-def detect_with_yolo(preloaded_model: YOLO, car_image: Image, verbose: bool) -> (int, any):
-    result = preloaded_model.predict(car_image, verbose=verbose)[0]
+def detect_with_yolo(preloaded_model: YOLO, car_image: np.ndarray, verbose: bool) -> (int, any):
+    result = preloaded_model.predict(car_image, verbose=verbose, imgsz=get_default_image_size(preloaded_model))[0]
     return (len(result.boxes), result.boxes)
 
+# Runs the model over all images at once (ultralytics letterboxes them into a single batch, in chunks of max_batch_size)
+# image_size => size images get letterboxed into (multiple of 32), None => the size the model was trained/exported with, see `get_default_image_size`
+# Returns number of results + results as boxes for each image, in the same order as the images got passed in
+# Boxes are already scaled back into the coordinates of the image they belong to
+def detect_with_yolo_batched(preloaded_model: YOLO, images: list[np.ndarray], verbose: bool, max_batch_size: int, image_size: int = None) -> [(int, any)]:
+    detections = []
+    max_batch_size = max(max_batch_size, 1)
+    image_size = get_default_image_size(preloaded_model) if image_size is None else image_size
+    for batch_start in range(0, len(images), max_batch_size):
+        results = preloaded_model.predict(images[batch_start:batch_start + max_batch_size], verbose=verbose, imgsz=image_size)
+        detections.extend((len(result.boxes), result.boxes) for result in results)
+    return detections
+
+# Runtimes of YOLO models (MODEL_RUNTIME), every one except "pytorch" needs the model exported by `ai/export.py` first.
+# Exported models are saved next to the original one, named the way ultralytics names them, "pytorch" uses the model path as is.
+MODEL_RUNTIME_PYTORCH = "pytorch"
+MODEL_RUNTIMES = {
+    MODEL_RUNTIME_PYTORCH: "{}",
+    "onnx": "{}.onnx",
+    "onnx-int8": "{}_int8.onnx",
+    "openvino": "{}_openvino_model",
+    "openvino-int8": "{}_int8_openvino_model",
+}
+
+# Returns path of the model exported for the runtime, eg. `yolov8n.pt` + "onnx-int8" => `yolov8n_int8.onnx`
+def get_model_path_for_runtime(model_path: str, runtime: str) -> str:
+    runtime = runtime.strip().lower()
+    if runtime not in MODEL_RUNTIMES:
+        raise ValueError(f"Unknown model runtime \"{runtime}\", choose one of: {', '.join(MODEL_RUNTIMES.keys())}")
+    if runtime == MODEL_RUNTIME_PYTORCH:
+        return model_path
+    return MODEL_RUNTIMES[runtime].format(os.path.splitext(model_path)[0])
+
+def load_yolo_model(model_path: str, runtime: str = MODEL_RUNTIME_PYTORCH) -> YOLO:
+    runtime_model_path = get_model_path_for_runtime(model_path, runtime)
+    if runtime_model_path != model_path and os.path.exists(runtime_model_path) is False:
+        raise FileNotFoundError(f"Model \"{runtime_model_path}\" (runtime \"{runtime}\") doesn't exist, export it first by running `python export.py {model_path}` inside `./ai`.")
+    return YOLO(runtime_model_path, task="detect")
+
+# First predict() of every model (and of every new batch size) is a lot slower, it allocates buffers and picks kernels.
+# Warm-up runs it on blank images, so the first frame of the camera doesn't pay for it.
+def warm_up_yolo_model(preloaded_model: YOLO, number_of_runs: int, max_batch_size: int):
+    blank_image = np.zeros((640, 640, 3), dtype=np.uint8)
+    for _ in range(number_of_runs):
+        for batch_size in sorted(set([1, max(max_batch_size, 1)])):
+            preloaded_model.predict([blank_image] * batch_size, verbose=False, imgsz=get_default_image_size(preloaded_model))
+
+# Local threshold of license plate binarization, gaussian weighted mean of 99x99 neighbourhood (sigma and kernel size same as skimage uses) - 5
+LOCAL_THRESHOLD_BLOCK_SIZE = 99
+LOCAL_THRESHOLD_SIGMA = (LOCAL_THRESHOLD_BLOCK_SIZE - 1) / 6
+LOCAL_THRESHOLD_KERNEL_SIZE = 2 * int(4 * LOCAL_THRESHOLD_SIGMA + 0.5) + 1
+LOCAL_THRESHOLD_OFFSET = 5
+
+# How license plates get binarized and split into letters
+# - "accurate" => plate upscaled to width_boost, gaussian weighted local threshold (original behavior)
+# - "fast" => plate scaled only as much as needed (FAST_SEGMENTATION_MIN_WIDTH..width_boost), local threshold is a mean of the neighbourhood (box filter)
+SEGMENTATION_MODE_ACCURATE = "accurate"
+SEGMENTATION_MODE_FAST = "fast"
+SEGMENTATION_MODES = [SEGMENTATION_MODE_ACCURATE, SEGMENTATION_MODE_FAST]
+FAST_SEGMENTATION_MIN_WIDTH = 250
+# Size of the box at width_boost (scaled with the plate), picked so the fast mode finds as many letters as the accurate one
+FAST_THRESHOLD_BLOCK_SIZE = 31
+
 def normalize_label(label):
     return label.strip().lower()
 
+# "x_min,y_min,x_max,y_max" => (x_min, y_min, x_max, y_max), empty value => None
+# Raises ValueError if the region is inverted, empty or has negative coordinates (size of the frame is checked once it is known, see MotionGate.check_frame_size)
+def parse_region(value: str, name: str = "Region") -> (int, int, int, int):
+    if value is None or value.strip() == "":
+        return None
+    x_min, y_min, x_max, y_max = [int(float(coordinate)) for coordinate in value.split(",")]
+    if x_min < 0 or y_min < 0 or x_min >= x_max or y_min >= y_max:
+        raise ValueError(f"{name} \"{value}\" has to be x_min,y_min,x_max,y_max with 0 <= x_min < x_max and 0 <= y_min < y_max")
+    return (x_min, y_min, x_max, y_max)
+
+# plate_img => grayscale license plate (2D uint8 array)
+# Returns binarized license plate, white letters on black background
 def clean_plate_into_contours(plate_img: np.ndarray, fixed_width: int) -> np.ndarray:
     # plate_img = cv2.GaussianBlur(plate_img, (5,5), 0)
     plate_img = cv2.GaussianBlur(plate_img, (11,11), 0)
-    V = cv2.split(cv2.cvtColor(plate_img, cv2.COLOR_BGR2HSV))[2]
-    # T = threshold_local(V, 29, offset=15, method='gaussian')
-    T = threshold_local(V, 99, offset=5, method='gaussian')
-    thresh = (V > T).astype('uint8') * 255
-    thresh = cv2.bitwise_not(thresh)
-    plate_img = imutils.resize(plate_img, width=fixed_width)
-    thresh = imutils.resize(thresh, width=fixed_width)
+    # Same as skimage's threshold_local(plate_img, 99, offset=5, method='gaussian'), but done by opencv in float32
+    plate_img_as_float = plate_img.astype(np.float32)
+    T = cv2.GaussianBlur(plate_img_as_float, (LOCAL_THRESHOLD_KERNEL_SIZE, LOCAL_THRESHOLD_KERNEL_SIZE), LOCAL_THRESHOLD_SIGMA, borderType=cv2.BORDER_REFLECT)
+    T -= LOCAL_THRESHOLD_OFFSET
+    thresh = cv2.compare(plate_img_as_float, T, cv2.CMP_LE) # 255 where the pixel is darker than its surroundings
+    if thresh.shape[1] != fixed_width:
+        thresh = imutils.resize(thresh, width=fixed_width)
     kernel = np.ones((3, 3), np.uint8)
     thresh = cv2.morphologyEx(thresh, cv2.MORPH_DILATE, kernel)
     return thresh
 
+def _odd_size(size: float) -> int:
+    return max(int(size) // 2 * 2 + 1, 3)
+
+# Same as clean_plate_into_contours, but the kernels are scaled to the width of plate_img (instead of resizing the plate to width_boost)
+# and the local threshold is a mean computed by opencv's box filter, which costs the same no matter how big the neighbourhood is
+def clean_plate_into_contours_fast(plate_img: np.ndarray, width_boost: int) -> np.ndarray:
+    scale = plate_img.shape[1] / width_boost
+    blur_size = _odd_size(11 * scale)
+    plate_img = cv2.GaussianBlur(plate_img, (blur_size, blur_size), 0)
+    thresh = cv2.adaptiveThreshold(plate_img, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, _odd_size(FAST_THRESHOLD_BLOCK_SIZE * scale), LOCAL_THRESHOLD_OFFSET)
+    # Dilating small plates by 3x3 would glue the letters together
+    kernel_size = max(round(3 * scale), 1)
+    if kernel_size > 1:
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_DILATE, np.ones((kernel_size, kernel_size), np.uint8))
+    return thresh
+
+# Returns [x, y, w, h] of every letter candidate, sorted from left to right
 def get_letter_rectangles_from_contours(iwl):
-    contours,_ = cv2.findContours(iwl,cv2.RETR_TREE,cv2.CHAIN_APPROX_SIMPLE)
-    rectangles=[]
-    for cnt in contours:
-        x,y,w,h=cv2.boundingRect(cnt)
-        if(h < (iwl.shape[0] / 5) or w > (iwl.shape[1] / 5)):
-            continue
-        rectangles.append([x,y,w,h])
-    final_rect = []
-    for (x, y, w, h) in rectangles:
-        flag = True
-        for(x2, y2, w2, h2) in rectangles:
-            if x > x2 and y > y2 and x + w < x2 + w2 and y + h < y2 + h2:
-                flag = False
-                break
-        if flag:
-            final_rect.append([x,y,w,h])
-    rectangles = final_rect
-    rectangles.sort()
-    return rectangles
+    contours,_ = cv2.findContours(iwl,cv2.RETR_LIST,cv2.CHAIN_APPROX_SIMPLE)
+    rectangles = np.array([cv2.boundingRect(cnt) for cnt in contours], dtype=np.int32).reshape(-1, 4)
+    return filter_letter_rectangles(rectangles, iwl.shape[0], iwl.shape[1])
+
+# rectangles => [x, y, w, h] of contours found on image of size height x width
+# Boxes which are too small/wide to be a letter, or are inside of another candidate (eg. hole of "0"), are filtered out
+def filter_letter_rectangles(rectangles: np.ndarray, height: int, width: int) -> list[list[int]]:
+    x, y, w, h = rectangles.T
+    rectangles = rectangles[(h >= (height / 5)) & (w <= (width / 5))]
+    # Every candidate against every other one at once, [i, j] => candidate i lies inside of candidate j
+    x, y, w, h = rectangles.T
+    is_inside = (x[:, None] > x[None, :]) & (y[:, None] > y[None, :]) & ((x + w)[:, None] < (x + w)[None, :]) & ((y + h)[:, None] < (y + h)[None, :])
+    rectangles = rectangles[np.any(is_inside, axis=1) == False]
+    return sorted(rectangles.tolist())
 
 def gen_intermediate_file_name(filename: str, file_type: str, unique_identifier: str):
     return f"./intermediate_detection_files/{filename}_{unique_identifier}.{file_type}"
@@ -67,87 +158,129 @@ def prepare_env_for_reading_license_plates(should_save_intermediate_files: bool)
             os.mkdir("./intermediate_detection_files/")
     except: pass
 
-# Read single license plate box
-# Returns license plate as string
-def read_license_plate(unique_identifier: str, box: any, original_image: Image, width_boost: int, additional_white_spacing_each_side: int, debug: bool, should_try_lp_crop: bool, minimum_number_of_chars_for_match: int) -> (Image, str):
-    # Crop image
-    x_min, y_min, x_max, y_max = box.xyxy.cpu().detach().numpy()[0]
+# Integer pixel bounds of box inside of image (same rounding as PIL's crop), so the box can be cut out by slicing
+def get_box_slices(box: (float, float, float, float), image: np.ndarray) -> (slice, slice):
+    height, width = image.shape[:2]
+    x_min, y_min, x_max, y_max = [int(round(float(coordinate))) for coordinate in box]
+    return (slice(max(y_min, 0), min(y_max, height)), slice(max(x_min, 0), min(x_max, width)))
+
+# Crop (view, not a copy) of box inside of image
+def crop_box(image: np.ndarray, box: (float, float, float, float)) -> np.ndarray:
+    return image[get_box_slices(box, image)]
+
+# Crop single license plate box, converted to grayscale and resized for segmentation
+# original_image => BGR image (numpy array) the license plate box was found on
+# segmentation_mode => one of SEGMENTATION_MODES
+# Returns grayscale license plate image
+def crop_license_plate(unique_identifier: str, box: any, original_image: np.ndarray, width_boost: int, debug: bool, should_try_lp_crop: bool, segmentation_mode: str = SEGMENTATION_MODE_ACCURATE) -> np.ndarray:
+    license_plate_cropped_img = crop_license_plate_box(get_box_coordinates(box), original_image, width_boost, should_try_lp_crop, segmentation_mode)
+    if debug:
+        cv2.imwrite(gen_intermediate_file_name("cropped_license_plate_full", "jpg", unique_identifier), license_plate_cropped_img)
+    return license_plate_cropped_img
+
+# (x_min, y_min, x_max, y_max) of a box found by YOLO
+def get_box_coordinates(box: any) -> (float, float, float, float):
+    return tuple(box.xyxy.cpu().detach().numpy()[0])
+
+# Same as crop_license_plate, box => (x_min, y_min, x_max, y_max), eg. to crop the license plate again, once the result is validated
+def crop_license_plate_box(box: (float, float, float, float), original_image: np.ndarray, width_boost: int, should_try_lp_crop: bool, segmentation_mode: str = SEGMENTATION_MODE_ACCURATE) -> np.ndarray:
+    x_min, y_min, x_max, y_max = box
     original_width = x_max - x_min
     original_height = y_max - y_min
-    boost_multiplier = width_boost / original_width
+    # Fast segmentation works on the plate as small as it can be, large plates are not upscaled at all
+    working_width = min(width_boost, max(original_width, FAST_SEGMENTATION_MIN_WIDTH)) if segmentation_mode == SEGMENTATION_MODE_FAST else width_boost
+    boost_multiplier = working_width / original_width
     boosted_width = int(original_width * boost_multiplier)
     boosted_height = int(original_height * boost_multiplier)
-    license_plate_cropped_img = original_image.crop(  # crop to license plate
-        (x_min, y_min, x_max, y_max)
-    ).convert( # black and white images make preprocessing more effective
-        "L"
-    ).resize( # resizing makes recognition more effective
-        [boosted_width, boosted_height]
+    license_plate_cropped_img = cv2.cvtColor( # black and white images make preprocessing more effective
+        crop_box(original_image, (x_min, y_min, x_max, y_max)), # crop to license plate
+        cv2.COLOR_BGR2GRAY
+    )
+    license_plate_cropped_img = cv2.resize( # resizing makes recognition more effective
+        license_plate_cropped_img, (boosted_width, boosted_height), interpolation=cv2.INTER_CUBIC
     )
     if should_try_lp_crop:
         # crop from left and right, because license plate recognition matches with overflow
-        license_plate_cropped_img = license_plate_cropped_img.crop(((45, 0, boosted_width - 20, boosted_height)))
-    if debug:
-        license_plate_cropped_img.save(gen_intermediate_file_name("cropped_license_plate_full", "jpg", unique_identifier))
-        
+        working_scale = working_width / width_boost
+        license_plate_cropped_img = license_plate_cropped_img[:, int(45 * working_scale):boosted_width - int(20 * working_scale)]
+    return license_plate_cropped_img
+
+# Pre-process and split license plate image (returned by crop_license_plate) into images of each letter
+# Returns letter images (black letter on white background, 2D uint8 arrays), empty, if there aren't enough letters to make a match
+def segment_cropped_license_plate(unique_identifier: str, license_plate_cropped_img: np.ndarray, width_boost: int, additional_white_spacing_each_side: int, debug: bool, minimum_number_of_chars_for_match: int, segmentation_mode: str = SEGMENTATION_MODE_ACCURATE) -> list[np.ndarray]:
     # Pre-process the image
-    license_plate_cropped_img_as_np_array = cv2.cvtColor(np.array(license_plate_cropped_img), cv2.COLOR_GRAY2BGR)
-    iwl_bb = clean_plate_into_contours(license_plate_cropped_img_as_np_array, width_boost)
-    iwl_wb = cv2.bitwise_not(iwl_bb)
+    if segmentation_mode == SEGMENTATION_MODE_FAST:
+        iwl_bb = clean_plate_into_contours_fast(license_plate_cropped_img, width_boost)
+    else:
+        iwl_bb = clean_plate_into_contours(license_plate_cropped_img, width_boost)
     if debug:
         cv2.imwrite(gen_intermediate_file_name("iwl_bb", "jpg", unique_identifier), iwl_bb, [int(cv2.IMWRITE_JPEG_QUALITY), 100])
+    iwl_wb = cv2.bitwise_not(iwl_bb, dst=iwl_bb) # iwl_bb is not needed anymore
+    if debug:
         cv2.imwrite(gen_intermediate_file_name("iwl_wb", "jpg", unique_identifier), iwl_wb, [int(cv2.IMWRITE_JPEG_QUALITY), 100])
         
     # Get each letter
     letter_rectangles = get_letter_rectangles_from_contours(iwl_wb)
-    iwl_wb_pil = Image.fromarray(iwl_wb, mode="L")
     
     # No reason to try reading, if there aren't even enought rectagles (skips reading which improves performance)
     if len(letter_rectangles) < minimum_number_of_chars_for_match:
-        return (license_plate_cropped_img, "")
-    
-    def process_letter_rectangle(args):
-        i, (x, y, w, h) = args
-        letter_box_cropped_img = iwl_wb_pil.crop((x, y, x + w, y + h))
-        new_letter_box_img = Image.new(
-            "L", (
-                letter_box_cropped_img.width + (additional_white_spacing_each_side * 2), 
-                letter_box_cropped_img.height + (additional_white_spacing_each_side * 2)
-            ), "white"
-        )
-        new_letter_box_img.paste(letter_box_cropped_img, (additional_white_spacing_each_side, additional_white_spacing_each_side))
+        return []
 
+    letter_images = []
+    for i, (x, y, w, h) in enumerate(letter_rectangles):
+        new_letter_box_img = np.pad(iwl_wb[y:y + h, x:x + w], additional_white_spacing_each_side, constant_values=255)
         if debug:
-            new_letter_box_img.save(gen_intermediate_file_name("cropped_image", "jpg", f"{unique_identifier}_{i}"))
+            cv2.imwrite(gen_intermediate_file_name("cropped_image", "jpg", f"{unique_identifier}_{i}"), new_letter_box_img)
+        letter_images.append(new_letter_box_img)
+
+    return letter_images
+
+# Crop, pre-process and split single license plate box into images of each letter
+# original_image => BGR image (numpy array) the license plate box was found on
+# segmentation_mode => one of SEGMENTATION_MODES
+# Returns grayscale license plate image + letter images (black letter on white background, 2D uint8 arrays), letter images are empty, if there aren't enough letters to make a match
+def segment_license_plate(unique_identifier: str, box: any, original_image: np.ndarray, width_boost: int, additional_white_spacing_each_side: int, debug: bool, should_try_lp_crop: bool, minimum_number_of_chars_for_match: int, segmentation_mode: str = SEGMENTATION_MODE_ACCURATE) -> (np.ndarray, list[np.ndarray]):
+    license_plate_cropped_img = crop_license_plate(unique_identifier, box, original_image, width_boost, debug, should_try_lp_crop, segmentation_mode)
+    return (license_plate_cropped_img, segment_cropped_license_plate(unique_identifier, license_plate_cropped_img, width_boost, additional_white_spacing_each_side, debug, minimum_number_of_chars_for_match, segmentation_mode))
 
-        char_from_img = pytesseract.image_to_string(new_letter_box_img, lang="eng", config="--psm 13 --dpi 96 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789")
-        char_from_img = str(char_from_img).replace("O", "0").strip()
+# Reads letters of any number of license plates (eg. every license plate of a frame) in a single OCR backend call
+# Returns license plate as string for each list of letter images
+def read_letters_of_license_plates(ocr_backend: ocr_backends.OcrBackend, letter_images_of_license_plates: list[list[np.ndarray]], debug: bool) -> list[str]:
+    all_letter_images = [letter_image for letter_images in letter_images_of_license_plates for letter_image in letter_images]
+    all_chars_from_img = ocr_backend.read_characters(all_letter_images)
 
+    license_plates_as_strings = []
+    offset = 0
+    for letter_images in letter_images_of_license_plates:
+        chars_from_img = all_chars_from_img[offset:offset + len(letter_images)]
+        offset += len(letter_images)
         if debug:
-            print(f"{i} => {char_from_img}")
-
-        return char_from_img
-
-    resulting_license_plate_string = ""
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        results = list(executor.map(process_letter_rectangle, enumerate(letter_rectangles)))
-        resulting_license_plate_string = "".join(results)
-
-    return (license_plate_cropped_img, resulting_license_plate_string.strip())
-
-# https://stackoverflow.com/a/55117662/16638833
-def img_to_bytes(image: Image, format="JPEG"):
-    bytes_io = io.BytesIO()
-    image.save(bytes_io, format=format)
-    return bytes_io.getvalue()
-
-def save_validated_result(db_enabled: bool, car_id: str, license_plate: str, db_server: str, db_port: str, db_name: str, db_user: str, db_pass: str, save_results_enabled: bool, results_path: str, car_image_raw: Image, license_plate_image_raw: Image):
-    if db_enabled:
-        conn = pymssql.connect(server=db_server, port=db_port, database=db_name, user=db_user, password=db_pass)
-        cursor = conn.cursor()
-        cursor.execute("insert into main_gate_alpr_license_plates (id, license_plate, captured_at) values (%s, %s, %s)", (car_id, license_plate, datetime.now()))
-        conn.commit()
-        conn.close()
-    if save_results_enabled:
-        car_image_raw.save(os.path.join(results_path, f"{car_id}_car.jpg"), "JPEG")
-        license_plate_image_raw.save(os.path.join(results_path, f"{car_id}_lp.jpg"), "JPEG")
\ No newline at end of file
+            for i, char_from_img in enumerate(chars_from_img):
+                print(f"{i} => {char_from_img}")
+        license_plates_as_strings.append("".join(chars_from_img).strip())
+    return license_plates_as_strings
+
+DEFAULT_OCR_BACKEND = None
+def get_default_ocr_backend() -> ocr_backends.OcrBackend:
+    global DEFAULT_OCR_BACKEND
+    if DEFAULT_OCR_BACKEND is None:
+        DEFAULT_OCR_BACKEND = ocr_backends.create_ocr_backend("pytesseract")
+    return DEFAULT_OCR_BACKEND
+
+# Read single license plate box
+# original_image => BGR image (numpy array) the license plate box was found on
+# license_plate_cache => near-identical license plate images read before are returned from it, without segmentation and OCR
+# Returns grayscale license plate image + license plate as string
+def read_license_plate(unique_identifier: str, box: any, original_image: np.ndarray, width_boost: int, additional_white_spacing_each_side: int, debug: bool, should_try_lp_crop: bool, minimum_number_of_chars_for_match: int, ocr_backend: ocr_backends.OcrBackend = None, segmentation_mode: str = SEGMENTATION_MODE_ACCURATE, license_plate_cache: LicensePlateReadCache = None) -> (np.ndarray, str):
+    license_plate_cropped_img = crop_license_plate(unique_identifier, box, original_image, width_boost, debug, should_try_lp_crop, segmentation_mode)
+    if license_plate_cache is not None:
+        license_plate_hash = compute_license_plate_hash(license_plate_cropped_img)
+        cached_license_plate_string = license_plate_cache.get(license_plate_hash)
+        if cached_license_plate_string is not None:
+            return (license_plate_cropped_img, cached_license_plate_string)
+
+    letter_images = segment_cropped_license_plate(unique_identifier, license_plate_cropped_img, width_boost, additional_white_spacing_each_side, debug, minimum_number_of_chars_for_match, segmentation_mode)
+    resulting_license_plate_string = read_letters_of_license_plates(ocr_backend or get_default_ocr_backend(), [letter_images], debug)[0] if len(letter_images) > 0 else ""
+    if license_plate_cache is not None:
+        license_plate_cache.put(license_plate_hash, resulting_license_plate_string)
+    return (license_plate_cropped_img, resulting_license_plate_string)
\ No newline at end of file